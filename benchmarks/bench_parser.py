@@ -0,0 +1,70 @@
+"""
+data2_s テーブル抽出のマイクロベンチマーク
+
+benchmarks/fixtures の daily_s1.php ページを使い、従来の BeautifulSoup
+（ページ全体を html.parser で解析）と extract_data2_s_rows の lxml 版・
+BeautifulSoup フォールバック版を比較する
+
+    python benchmarks/bench_parser.py [--number 200]
+"""
+import argparse
+import os
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+FIXTURES = Path(__file__).resolve().parent / 'fixtures'
+
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'weather_project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from weather import scraping  # noqa: E402
+
+
+def parse_with_full_soup(content):
+    """
+    変更前の fetch_weather_data と同じ解析方法
+    """
+    soup = BeautifulSoup(content, 'html.parser')
+    table = soup.find('table', {'class': 'data2_s'})
+    if table:
+        rows = table.find_all('tr')[4:]
+        return [[col.text.strip() for col in row.find_all('td')] for row in rows if row.find_all('td')]
+    return None
+
+
+PARSERS = {
+    'bs4_full_page': parse_with_full_soup,
+    'bs4_strainer': scraping._extract_data2_s_rows_bs4,
+    'lxml': scraping._extract_data2_s_rows_lxml,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--number', type=int, default=200, help='1ページあたりの繰り返し回数')
+    args = parser.parse_args()
+
+    if scraping.lxml_html is None:
+        PARSERS.pop('lxml')
+
+    pages = sorted(FIXTURES.glob('daily_s1_*.html'))
+    for page in pages:
+        content = page.read_bytes()
+        expected = parse_with_full_soup(content)
+        print(f"{page.name} ({len(content)} bytes, {len(expected)} rows)")
+        for name, parse in PARSERS.items():
+            assert parse(content) == expected, f"{name} の結果が一致しません"
+            seconds = timeit.timeit(lambda: parse(content), number=args.number) / args.number
+            print(f"  {name:<14} {seconds * 1000:8.3f} ms/page")
+
+
+if __name__ == '__main__':
+    main()
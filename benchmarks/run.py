@@ -0,0 +1,269 @@
+"""
+エンドポイントと処理段階のベンチマーク
+
+stub_jma.py のスタブサーバー（benchmarks/fixtures を返す）を起動してアプリをそこに向け、
+一時的な SQLite DB を使って Django のテストクライアントでエンドポイントを並行して叩く
+処理段階（HTML の解析・集計・グラフの描画・予報の索引）も別に計測し、結果を JSON に書き出す
+
+    python benchmarks/run.py [--concurrency 8] [--requests 40] [--latency 0.05] [--output results.json]
+    python benchmarks/run.py --compare before.json after.json
+
+cold はキャッシュ（DB・Django のキャッシュ・予報）を空にした状態の1リクエスト、
+warm はその後に --requests 回を --concurrency 並列で送ったときの値
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+FIXTURES = Path(__file__).resolve().parent / 'fixtures'
+
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from stub_jma import StubJMAServer  # noqa: E402
+
+
+def setup_django(stub, database):
+    """
+    アプリをスタブに向け、一時 DB にマイグレーションする（django.setup() の前に呼ぶ）
+    """
+    os.environ['WEATHER_ETRN_BASE_URL'] = f"{stub.base_url}/etrn"
+    os.environ['WEATHER_FORECAST_BASE_URL'] = f"{stub.base_url}/forecast"
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'weather_project.settings')
+
+    from weather_project import settings as project_settings
+    # 開発用の db.sqlite3 には触らない（並列の書き込みを待てるよう timeout を付ける）
+    project_settings.DATABASES['default'].update(NAME=str(database), OPTIONS={'timeout': 30})
+    project_settings.ALLOWED_HOSTS.append('testserver')
+
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def reset_caches():
+    from django.core.cache import cache
+
+    from weather import scraping
+    from weather.models import MonthlyPageCache, TrendCoefficient, YearlyPageCache
+
+    for model in (MonthlyPageCache, YearlyPageCache, TrendCoefficient):
+        model.objects.all().delete()
+    cache.clear()
+    scraping._forecast_cache.clear()
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+
+    def at(fraction):
+        return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+    return {
+        'mean': round(statistics.fmean(ordered), 3),
+        'p50': round(at(0.50), 3),
+        'p90': round(at(0.90), 3),
+        'p99': round(at(0.99), 3),
+        'max': round(ordered[-1], 3),
+    }
+
+
+def bench_endpoint(stub, path, requests, concurrency):
+    from django.test import Client
+
+    reset_caches()
+    before = sum(stub.requests.values())
+    started = time.perf_counter()
+    response = Client().get(path)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    cold = {
+        'status': response.status_code,
+        'latency_ms': round((time.perf_counter() - started) * 1000, 3),
+        'upstream_requests': sum(stub.requests.values()) - before,
+    }
+
+    clients = threading.local()
+
+    def one_request(_):
+        client = getattr(clients, 'client', None)
+        if client is None:
+            client = clients.client = Client()
+        started = time.perf_counter()
+        response = client.get(path)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return (time.perf_counter() - started) * 1000, response.status_code
+
+    before = sum(stub.requests.values())
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one_request, range(requests)))
+    elapsed = time.perf_counter() - started
+    latencies = [latency for latency, _ in results]
+    warm = {
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': sum(1 for _, status in results if status >= 400),
+        'throughput_rps': round(requests / elapsed, 2),
+        'latency_ms': percentiles(latencies),
+        'upstream_requests': sum(stub.requests.values()) - before,
+    }
+    return {'cold': cold, 'warm': warm}
+
+
+def time_stage(function, number):
+    """
+    function を number 回ずつ5回計測し、1回あたりのミリ秒（最小・中央値）を返す
+    """
+    runs = [t / number * 1000 for t in timeit.repeat(function, number=number, repeat=5)]
+    return {'number': number, 'min_ms': round(min(runs), 4), 'median_ms': round(statistics.median(runs), 4)}
+
+
+def bench_stages(number):
+    from weather import graphing, prediction, scraping
+
+    # daily_s1_<prec_no>_<block_no>_<year>_<month>.html
+    paths = sorted(FIXTURES.glob('daily_s1_*.html'), key=lambda path: int(path.stem.rsplit('_', 1)[1]))
+    months = [tuple(int(part) for part in path.stem.rsplit('_', 2)[1:]) for path in paths]
+    pages = [path.read_bytes() for path in paths]
+    yearly_page = next(iter(sorted(FIXTURES.glob('monthly_s1_*.html')))).read_bytes()
+    forecast = json.loads(next(iter(sorted(FIXTURES.glob('forecast_*.json')))).read_text(encoding='utf-8'))
+    rows = [scraping.extract_data2_s_rows(page) for page in pages]
+
+    def parse_observations():
+        return [scraping.parse_daily_observations(r, *month) for month, r in zip(months, rows)]
+
+    observations = parse_observations()
+    # 41年分（グラフと同じ範囲）の日別気温
+    daily = scraping._daily_temperature_matrix(observations * 41)
+    monthly_means = scraping._summarize_daily_matrix(daily)['mean'].reshape(41, 12)
+    series = [[float(i + year) for i in range(12)] for year in range(5)]
+
+    stages = {
+        'parse_daily_page_bs4': time_stage(
+            lambda: [scraping._extract_data2_s_rows_bs4(page) for page in pages], number),
+        'parse_yearly_page': time_stage(
+            lambda: scraping.extract_data2_s_rows(yearly_page, scraping.YEARLY_PAGE_HEADER_ROWS), number),
+        'daily_observations': time_stage(parse_observations, number),
+        'aggregate_41_years': time_stage(lambda: scraping._summarize_daily_matrix(daily), number),
+        'trend_fit_41_years': time_stage(
+            lambda: prediction.fit_linear_trends(range(41), monthly_means), number),
+        'forecast_index': time_stage(lambda: scraping.ForecastIndex(forecast), number),
+        'render_graph_png': time_stage(lambda: graphing.render_temperature_graph_png(*series), max(1, number // 20)),
+    }
+    if scraping.lxml_html is not None:
+        stages['parse_daily_page_lxml'] = time_stage(
+            lambda: [scraping._extract_data2_s_rows_lxml(page) for page in pages], number)
+    # ページ単位の値にそろえる
+    for name in ('parse_daily_page_bs4', 'parse_daily_page_lxml', 'daily_observations'):
+        if name in stages:
+            for key in ('min_ms', 'median_ms'):
+                stages[name][key] = round(stages[name][key] / len(pages), 4)
+    return stages
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(before_path, after_path):
+    """
+    2つの結果ファイルの主な値を並べる（ratio は after / before）
+    """
+    before = json.loads(Path(before_path).read_text())
+    after = json.loads(Path(after_path).read_text())
+    print(f"{'metric':<58} {'before':>10} {'after':>10} {'ratio':>7}")
+
+    def row(name, a, b):
+        ratio = f"{b / a:7.2f}" if a else '      -'
+        print(f"{name:<58} {a:>10} {b:>10} {ratio}")
+
+    for path, result in after.get('endpoints', {}).items():
+        old = before.get('endpoints', {}).get(path)
+        if old is None:
+            continue
+        row(f"{path} cold latency_ms", old['cold']['latency_ms'], result['cold']['latency_ms'])
+        row(f"{path} cold upstream_requests", old['cold']['upstream_requests'], result['cold']['upstream_requests'])
+        row(f"{path} warm p50_ms", old['warm']['latency_ms']['p50'], result['warm']['latency_ms']['p50'])
+        row(f"{path} warm p90_ms", old['warm']['latency_ms']['p90'], result['warm']['latency_ms']['p90'])
+        row(f"{path} warm throughput_rps", old['warm']['throughput_rps'], result['warm']['throughput_rps'])
+    for name, result in after.get('stages', {}).items():
+        old = before.get('stages', {}).get(name)
+        if old is not None:
+            row(f"stage {name} median_ms", old['median_ms'], result['median_ms'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=8, help='warm での並列数')
+    parser.add_argument('--requests', type=int, default=40, help='warm でのエンドポイントごとのリクエスト数')
+    parser.add_argument('--latency', type=float, default=0.05, help='スタブの1リクエストごとの遅延（秒）')
+    parser.add_argument('--weeks', type=int, default=52, help='/custom-week-weather/<n>/ の n')
+    parser.add_argument('--stage-number', type=int, default=50, help='処理段階ごとの繰り返し回数')
+    parser.add_argument('--skip-endpoints', action='store_true')
+    parser.add_argument('--skip-stages', action='store_true')
+    parser.add_argument('--output', default='benchmark-results.json', help='結果の JSON ファイル')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='2つの結果を比較して終わる')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    stub = StubJMAServer(('127.0.0.1', 0), latency=args.latency).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(stub, Path(tmp) / 'bench.sqlite3')
+        results = {
+            'meta': {
+                'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'revision': git_revision(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'args': {k: v for k, v in vars(args).items() if k != 'compare'},
+            },
+            'endpoints': {},
+            'stages': {},
+        }
+        if not args.skip_endpoints:
+            paths = ['/weather-data/', '/weather-graph/', f'/custom-week-weather/{args.weeks}/', '/predict-weather/']
+            for path in paths:
+                result = results['endpoints'][path] = bench_endpoint(stub, path, args.requests, args.concurrency)
+                warm = result['warm']
+                print(
+                    f"{path:<28} cold {result['cold']['latency_ms']:9.1f} ms "
+                    f"({result['cold']['upstream_requests']} upstream)  "
+                    f"warm p50 {warm['latency_ms']['p50']:8.1f} ms  p90 {warm['latency_ms']['p90']:8.1f} ms  "
+                    f"{warm['throughput_rps']:8.1f} req/s  errors {warm['errors']}"
+                )
+        if not args.skip_stages:
+            results['stages'] = bench_stages(args.stage_number)
+            for name, stage in results['stages'].items():
+                print(f"  {name:<24} {stage['median_ms']:10.4f} ms")
+    stub.shutdown()
+
+    Path(args.output).write_text(json.dumps(results, ensure_ascii=False, indent=2))
+    print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
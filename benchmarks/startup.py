@@ -0,0 +1,185 @@
+"""
+ワーカーの起動時間のベンチマーク（コールドスタートと、ワーカーの入れ替え）
+
+- cold: 新しい Python プロセスで django.setup() してから /health/ と /weather-graph/ に最初に応答するまで
+- recycle: gunicorn のマスタープロセスからワーカーを fork してから、同じ2つに最初に応答するまで
+  （--preload なしのマスターは何も読み込んでいないので、ワーカーが fork の後で Django を読み込む。
+  WEATHER_PRELOAD=True の --preload ではマスターで読み込み済みのものをそのまま使う）
+
+どちらも WEATHER_PRELOAD の False / True で計測する。気象庁のページは stub_jma.py のスタブから取り、
+最初に1回捨てのリクエストで DB のページキャッシュを埋めておく（グラフの描画と読み込みの時間だけが残る）
+
+    python benchmarks/startup.py [--runs 5] [--output startup-results.json]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+PATHS = ('/health/', '/weather-graph/')
+
+
+def first_responses(started):
+    """
+    PATHS に1回ずつリクエストし、started からそれぞれの応答までのミリ秒を返す
+    """
+    from django.test import Client
+
+    client = Client()
+    timings = {}
+    for path in PATHS:
+        response = client.get(path)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}")
+        timings[path] = round((time.perf_counter() - started) * 1000, 3)
+    return timings
+
+
+def setup_worker(database):
+    """
+    run.setup_django と同じ設定で django.setup() する（マイグレーションは親で済ませてある）
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'weather_project.settings')
+    from weather_project import settings as project_settings
+    project_settings.DATABASES['default'].update(NAME=str(database), OPTIONS={'timeout': 30})
+    project_settings.ALLOWED_HOSTS.append('testserver')
+
+    import django
+    django.setup()
+
+
+def cold_worker(database):
+    # インタープリタの起動から数えたいので、プロセスの開始時刻は親から受け取る
+    started = float(os.environ['WEATHER_BENCH_SPAWNED_AT'])
+    setup_worker(database)
+    setup_ms = round((time.perf_counter() - started) * 1000, 3)
+    return {'setup_ms': setup_ms, 'first_response_ms': first_responses(started)}
+
+
+def recycle_master(database, runs, preload):
+    """
+    gunicorn のマスターのように、preload なら先に django.setup() してからワーカーを runs 回 fork する
+    """
+    if preload:
+        setup_worker(database)
+    results = []
+    for _ in range(runs):
+        read_end, write_end = os.pipe()
+        started = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            try:
+                if not preload:
+                    setup_worker(database)
+                setup_ms = round((time.perf_counter() - started) * 1000, 3)
+                result = {'setup_ms': setup_ms, 'first_response_ms': first_responses(started)}
+            except BaseException as e:
+                result = {'error': repr(e)}
+            with os.fdopen(write_end, 'w') as f:
+                json.dump(result, f)
+            os._exit(0)
+        os.close(write_end)
+        with os.fdopen(read_end) as f:
+            result = json.load(f)
+        os.waitpid(pid, 0)
+        if 'error' in result:
+            raise RuntimeError(result['error'])
+        results.append(result)
+    return results
+
+
+def run_child(args, env, *extra):
+    env = {**os.environ, **env, 'WEATHER_BENCH_SPAWNED_AT': str(time.perf_counter())}
+    completed = subprocess.run(
+        [sys.executable, __file__, *extra, '--database', args.database],
+        env=env, capture_output=True, text=True, cwd=ROOT,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def summarize(samples):
+    """
+    サンプル（setup_ms と各パスの first_response_ms）の中央値
+    """
+    summary = {'setup_ms': round(statistics.median(s['setup_ms'] for s in samples), 3)}
+    for path in PATHS:
+        summary[path] = round(statistics.median(s['first_response_ms'][path] for s in samples), 3)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='構成ごとの計測回数（中央値を使う）')
+    parser.add_argument('--output', default='startup-results.json', help='結果の JSON ファイル')
+    # 子プロセス用
+    parser.add_argument('--cold-worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--recycle-master', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--database', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cold_worker:
+        print(json.dumps(cold_worker(args.database)))
+        return
+    if args.recycle_master:
+        preload = os.environ.get('WEATHER_PRELOAD') == 'True'
+        print(json.dumps(recycle_master(args.database, args.runs, preload)))
+        return
+
+    from stub_jma import StubJMAServer
+    import run
+
+    stub = StubJMAServer(('127.0.0.1', 0)).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        args.database = str(Path(tmp) / 'startup.sqlite3')
+        # 子プロセスもスタブに向ける（環境変数は子に引き継がれる）
+        run.setup_django(stub, args.database)
+
+        results = {
+            'meta': {
+                'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'revision': run.git_revision(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'runs': args.runs,
+            },
+            'cold': {},
+            'recycle': {},
+        }
+        # 捨てのリクエストで DB のページキャッシュを埋める
+        run_child(args, {}, '--cold-worker')
+        for preload in ('False', 'True'):
+            env = {'WEATHER_PRELOAD': preload}
+            cold = [run_child(args, env, '--cold-worker') for _ in range(args.runs)]
+            recycle = run_child(args, env, '--recycle-master', '--runs', str(args.runs))
+            name = f"preload={preload}"
+            results['cold'][name] = summarize(cold)
+            results['recycle'][name] = summarize(recycle)
+            for kind in ('cold', 'recycle'):
+                summary = results[kind][name]
+                print(
+                    f"{kind:<8} {name:<14} setup {summary['setup_ms']:8.1f} ms  "
+                    + '  '.join(f"{path} {summary[path]:8.1f} ms" for path in PATHS)
+                )
+    stub.shutdown()
+
+    Path(args.output).write_text(json.dumps(results, ensure_ascii=False, indent=2))
+    print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
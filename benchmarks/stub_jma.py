@@ -0,0 +1,143 @@
+"""
+気象庁のページを benchmarks/fixtures から返すローカルのスタブサーバー
+
+    python benchmarks/stub_jma.py [--port 8001] [--latency 0.2]
+
+  /etrn/daily_s1.php?...&month=M   → daily_s1_*_MM.html（同じ月のページ。年・観測所は問わない）
+  /etrn/monthly_s1.php?...         → monthly_s1_*.html
+  /forecast/<office>.json          → forecast_<office>.json（日時は今日の発表になるようずらす）
+
+アプリをスタブに向けるには次の環境変数を設定する（run.py は自動で設定する）
+    WEATHER_ETRN_BASE_URL=http://127.0.0.1:8001/etrn
+    WEATHER_FORECAST_BASE_URL=http://127.0.0.1:8001/forecast
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES = Path(__file__).resolve().parent / 'fixtures'
+
+_ISO_DATETIME = re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\+09:00')
+
+
+def load_fixtures():
+    """
+    Returns: {'daily': {月: bytes}, 'monthly': bytes, 'forecast': {office: 文書}}
+    """
+    daily = {}
+    for path in sorted(FIXTURES.glob('daily_s1_*.html')):
+        daily[int(path.stem.rsplit('_', 1)[1])] = path.read_bytes()
+    monthly = next(iter(sorted(FIXTURES.glob('monthly_s1_*.html'))), None)
+    forecast = {
+        path.stem.split('_', 1)[1]: json.loads(path.read_text(encoding='utf-8'))
+        for path in FIXTURES.glob('forecast_*.json')
+    }
+    return {
+        'daily': daily,
+        'monthly': monthly.read_bytes() if monthly else None,
+        'forecast': forecast,
+    }
+
+
+def shift_forecast(document, today=None):
+    """
+    記録した予報の日時を、短期予報の発表日が今日になるようにずらす
+    """
+    recorded = datetime.fromisoformat(document[0]['reportDatetime']).date()
+    offset = timedelta(days=((today or datetime.now().date()) - recorded).days)
+
+    def shift(match):
+        return (datetime.fromisoformat(match.group(0)) + offset).isoformat()
+
+    text = _ISO_DATETIME.sub(shift, json.dumps(document, ensure_ascii=False))
+    return text.encode('utf-8')
+
+
+class StubJMAServer(ThreadingHTTPServer):
+    """
+    fixtures を返す HTTP サーバー（latency 秒の遅延を入れて気象庁の応答時間を模す）
+    requests に URL ごとの要求回数を数える
+    """
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0):
+        super().__init__(address, _StubHandler)
+        self.latency = latency
+        self.fixtures = load_fixtures()
+        self.requests = {}
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, path):
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name='stub-jma', daemon=True)
+        thread.start()
+        return self
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        self.server.count(url.path)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        body, content_type = self._body(url)
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self, url):
+        fixtures = self.server.fixtures
+        if url.path == '/etrn/daily_s1.php':
+            month = int(parse_qs(url.query).get('month', ['0'])[0] or 0)
+            return fixtures['daily'].get(month), 'text/html; charset=UTF-8'
+        if url.path == '/etrn/monthly_s1.php':
+            return fixtures['monthly'], 'text/html; charset=UTF-8'
+        if url.path.startswith('/forecast/') and url.path.endswith('.json'):
+            document = fixtures['forecast'].get(url.path[len('/forecast/'):-len('.json')])
+            return (shift_forecast(document) if document else None), 'application/json'
+        return None, None
+
+    def log_message(self, format, *args):
+        # ベンチマークの出力を汚さない
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.0, help='1リクエストごとの遅延（秒）')
+    args = parser.parse_args()
+
+    server = StubJMAServer((args.host, args.port), latency=args.latency)
+    print(f"Serving fixtures on {server.base_url} (latency {args.latency}s)")
+    print(f"  WEATHER_ETRN_BASE_URL={server.base_url}/etrn")
+    print(f"  WEATHER_FORECAST_BASE_URL={server.base_url}/forecast")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
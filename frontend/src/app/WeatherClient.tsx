@@ -474,10 +474,38 @@ export default function WeatherClient({ initialData }: WeatherClientProps) {
             <button
               onClick={async () => {
                 try {
-                  const res = await axios.get(
-                    `${API_URL}/custom-week-weather/${customWeeks}/`
+                  // NDJSON で受け取り、届いた月から順に表示する
+                  const res = await fetch(
+                    `${API_URL}/custom-week-weather/${customWeeks}/?stream=1`
                   );
-                  setCustomWeekData(res.data);
+                  if (!res.ok || !res.body) {
+                    throw new Error(`HTTP ${res.status}`);
+                  }
+                  const reader = res.body.getReader();
+                  const decoder = new TextDecoder();
+                  let buffer = "";
+                  let weekData: any[] = [];
+                  let meta: any = null;
+                  while (true) {
+                    const { done, value } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+                    const lines = buffer.split("\n");
+                    buffer = lines.pop() ?? "";
+                    for (const line of lines) {
+                      if (!line) continue;
+                      const item = JSON.parse(line);
+                      if (item.error) throw new Error(item.error);
+                      if (meta === null) {
+                        meta = item;
+                      } else {
+                        weekData = [...weekData, item];
+                      }
+                    }
+                    if (meta !== null) {
+                      setCustomWeekData({ ...meta, week_data: weekData });
+                    }
+                  }
                 } catch (err) {
                   console.error("データ取得エラー:", err);
                 }
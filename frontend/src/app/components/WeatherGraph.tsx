@@ -1,38 +1,15 @@
 // app/components/WeatherGraph.tsx
 "use client";
 
-import { useState, useEffect } from "react";
+import { useState } from "react";
 
 export default function WeatherGraph() {
-  const [graphImage, setGraphImage] = useState<string | null>(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
   const API_URL = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
 
-  useEffect(() => {
-    fetch(`${API_URL}/weather-graph/`)
-      .then((res) => {
-        if (!res.ok) {
-          throw new Error("グラフの取得に失敗しました");
-        }
-        return res.json();
-      })
-      .then((data) => {
-        setGraphImage(data.image_base64);
-        setLoading(false);
-      })
-      .catch((err) => {
-        console.error("グラフ取得エラー:", err);
-        setError(err.message);
-        setLoading(false);
-      });
-  }, [API_URL]);
-
-  if (loading) {
-    return (
-      <div style={{ padding: "20px", textAlign: "center" }}>読み込み中...</div>
-    );
-  }
+  // PNG を直接読み込む（ETag/Cache-Control によりブラウザのキャッシュが効く）
+  const graphUrl = `${API_URL}/weather-graph/image/`;
 
   if (error) {
     return <div style={{ padding: "20px", color: "red" }}>エラー: {error}</div>;
@@ -41,13 +18,24 @@ export default function WeatherGraph() {
   return (
     <div style={{ padding: "20px" }}>
       <h2>気温グラフ</h2>
-      {graphImage && (
-        <img
-          src={`data:image/png;base64,${graphImage}`}
-          alt="気温グラフ"
-          style={{ maxWidth: "100%", height: "auto" }}
-        />
+      {loading && (
+        <div style={{ padding: "20px", textAlign: "center" }}>読み込み中...</div>
       )}
+      <img
+        src={graphUrl}
+        alt="気温グラフ"
+        style={{
+          maxWidth: "100%",
+          height: "auto",
+          display: loading ? "none" : "block",
+        }}
+        onLoad={() => setLoading(false)}
+        onError={() => {
+          console.error("グラフ取得エラー:", graphUrl);
+          setError("グラフの取得に失敗しました");
+          setLoading(false);
+        }}
+      />
     </div>
   );
 }
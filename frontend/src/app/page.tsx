@@ -7,6 +7,7 @@ interface WeatherData {
   today_low_temp: string;
   today_rain: string;
   today_source: string;
+  today_report_datetime?: string | null;
 
   last_year_date: string;
   last_year_temp: string;
@@ -1,3 +1,23 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import MonthlyPageCache, TrendCoefficient, YearlyPageCache
+
+
+@admin.register(MonthlyPageCache)
+class MonthlyPageCacheAdmin(admin.ModelAdmin):
+    list_display = ('prec_no', 'block_no', 'year', 'month', 'is_final', 'fetched_at', 'hit_count', 'miss_count')
+    list_filter = ('is_final', 'block_no')
+    exclude = ('rows',)
+
+
+@admin.register(YearlyPageCache)
+class YearlyPageCacheAdmin(admin.ModelAdmin):
+    list_display = ('prec_no', 'block_no', 'year', 'is_final', 'fetched_at', 'hit_count', 'miss_count')
+    list_filter = ('is_final', 'block_no')
+    exclude = ('rows',)
+
+
+@admin.register(TrendCoefficient)
+class TrendCoefficientAdmin(admin.ModelAdmin):
+    list_display = ('prec_no', 'block_no', 'target_month', 'year_first', 'year_last', 'slope', 'sample_count', 'is_final', 'computed_at')
+    list_filter = ('is_final', 'block_no', 'target_month')
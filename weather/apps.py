@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class WeatherConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'weather'
+
+    def ready(self):
+        # グラフ描画の準備（matplotlib とフォント）は最初にグラフを描くときに行う
+        # WEATHER_PRELOAD なら起動時にまとめて済ませる（gunicorn --preload では fork の前に1回だけ）
+        if settings.WEATHER_PRELOAD:
+            from .preload import preload
+            preload()
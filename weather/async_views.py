@@ -0,0 +1,151 @@
+"""
+ASGI で動かすときのビュー（WEATHER_ASYNC_VIEWS=True のとき urls.py が使う）
+
+各ビューは必要な気象庁のページと予報を httpx でまとめて非同期に先読みし、
+その後は views.py の同期ビューをそのまま呼ぶ（レスポンスは同期版と同じ）
+上流を待つ間はワーカーのスレッドを占有しないので、遅い気象庁のページを
+待つリクエストが多くても他のリクエストを処理できる
+"""
+import asyncio
+from datetime import datetime, timedelta
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from django.views.decorators.csrf import csrf_exempt
+
+from . import views
+from .stations import UnknownStation, get_station
+from .prediction import TREND_WINDOW_YEARS, trend_window_years
+from .scraping import aiter_daily_weather_range, prefetch_async, request_scope
+
+
+def with_async_request_scope(view):
+    """
+    with_station と with_request_scope の非同期版
+    先読みと同期ビューで同じリクエスト内の表を使う
+    """
+    @wraps(view)
+    async def wrapper(request, *args, station=None, **kwargs):
+        try:
+            station = get_station(station)
+        except UnknownStation as e:
+            raise Http404(str(e))
+        with request_scope() as scope:
+            response = await view(request, *args, station=station, **kwargs)
+        if not response.streaming:
+            response['X-Upstream-Fetches'] = str(scope.upstream_fetches)
+        return response
+    return wrapper
+
+def _month_key(date):
+    return (date.year, date.month)
+
+def _years_ago(today, years):
+    return today.replace(year=today.year - years)
+
+@csrf_exempt
+@with_async_request_scope
+async def weather_data(request, station):
+    # 組み立て済みの応答があれば先読みもしない
+    response = await sync_to_async(views.cached_weather_data_response)(request, station)
+    if response is not None:
+        return response
+    today = datetime.now()
+    dates = [today, today - timedelta(days=365)]
+    dates += [_years_ago(today, years) for years in (10, 20, 30, 40)]
+    dates += [today - timedelta(days=days_ago) for days_ago in range(7, 0, -1)]
+    await prefetch_async(
+        months=dict.fromkeys(_month_key(date) for date in dates),
+        forecast=True,
+        station=station,
+    )
+    return await sync_to_async(views.weather_data)(request, station=station)
+
+async def _prefetch_graph_pages(station):
+    current_year = datetime.now().year
+    await prefetch_async(
+        months=[(current_year, datetime.now().month)],
+        years=[current_year - years_back for years_back in (0, 10, 20, 30, 40)],
+        station=station,
+    )
+
+@csrf_exempt
+@with_async_request_scope
+async def weather_graph(request, station):
+    await _prefetch_graph_pages(station)
+    return await sync_to_async(views.weather_graph)(request, station=station)
+
+@csrf_exempt
+@with_async_request_scope
+async def weather_graph_image(request, station):
+    await _prefetch_graph_pages(station)
+    return await sync_to_async(views.weather_graph_image)(request, station=station)
+
+@csrf_exempt
+@with_async_request_scope
+async def custom_week_weather(request, weeks, station):
+    if 1 <= weeks <= 52 and views._wants_ndjson(request):
+        # 先読みはせず、月ページが揃った月から送る
+        return _stream_week_weather(datetime.now(), weeks, station)
+    if 1 <= weeks <= 52:
+        today = datetime.now()
+        await prefetch_async(
+            months=dict.fromkeys(
+                _month_key(today - timedelta(days=days_ago)) for days_ago in range(weeks * 7, 0, -1)
+            ),
+            station=station,
+        )
+    return await sync_to_async(views.custom_week_weather)(request, weeks, station=station)
+
+def _stream_week_weather(today, weeks, station):
+    """
+    views._stream_week_weather の非同期版
+    同期のジェネレーターだと ASGI では本文を全部作ってから送ることになるので、非同期ジェネレーターで返す
+    """
+    total_days = weeks * 7
+    start, end = views._week_weather_range(today, total_days)
+
+    async def lines():
+        yield views._week_weather_header_line(today, weeks, total_days, station)
+        days_ago = total_days
+        try:
+            async for days in aiter_daily_weather_range(start, end, station):
+                chunk, days_ago = views._week_weather_lines(days, days_ago, station)
+                yield chunk
+        except Exception as e:
+            yield views._ndjson_line({'error': str(e)})
+
+    return views._ndjson_response(lines())
+
+@csrf_exempt
+@with_async_request_scope
+async def custom_year_weather(request, years, station):
+    if 0 <= years <= 100:
+        try:
+            target_date = _years_ago(datetime.now(), years)
+        except ValueError:  # 2月29日 → エラーの返し方は同期ビューに任せる
+            target_date = None
+        if target_date is not None:
+            await prefetch_async(months=[_month_key(target_date)], station=station)
+    return await sync_to_async(views.custom_year_weather)(request, years, station=station)
+
+@csrf_exempt
+@with_async_request_scope
+async def predict_weather(request, station):
+    await prefetch_async(years=trend_window_years(), station=station)
+    return await sync_to_async(views.predict_weather)(request, station=station)
+
+@csrf_exempt
+@with_async_request_scope
+async def predict_outlook(request, station):
+    try:
+        lookback = int(request.GET.get('lookback', TREND_WINDOW_YEARS))
+        names = request.GET.get('stations', station.slug).split(',')
+        targets = dict.fromkeys(get_station(name.strip()) for name in names)
+    except ValueError:  # パラメータが不正なときのエラーの返し方は同期ビューに任せる
+        lookback, targets = None, {}
+    if targets and 3 <= lookback <= 40:
+        years = trend_window_years(lookback=lookback)
+        await asyncio.gather(*(prefetch_async(years=years, station=target) for target in targets))
+    return await sync_to_async(views.predict_outlook)(request, station=station)
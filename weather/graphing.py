@@ -0,0 +1,202 @@
+"""
+気温の比較グラフ（PNG）の描画とキャッシュ
+
+matplotlib の読み込みには時間がかかるので、最初にグラフを描くとき（WEATHER_PRELOAD なら
+ワーカーを fork する前の preload()）まで import しない
+"""
+import base64
+import hashlib
+import json
+import logging
+import os
+import platform
+import threading
+from datetime import datetime
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def generate_temperature_graph(current_year_temps, ten_year_temps, twenty_year_temps, thirty_year_temps, forty_year_temps):
+    """
+    今年・10年前・20年前・30年前・40年前の '月平均気温' を比較するグラフを生成し
+    Base64 PNG として返却する
+    """
+    png = render_temperature_graph_png(
+        current_year_temps, ten_year_temps, twenty_year_temps, thirty_year_temps, forty_year_temps
+    )
+    return base64.b64encode(png).decode('utf-8')
+
+
+def temperature_graph_key(series, current_year):
+    """
+    グラフの入力（5系列の月平均気温と基準年）の内容ハッシュ
+    入力が同じなら同じ画像になるので、画像キャッシュのキーと ETag に使う
+    """
+    payload = json.dumps([current_year, series], separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+def get_temperature_graph_png(series, current_year):
+    """
+    グラフの PNG（bytes）を内容ハッシュをキーにキャッシュから返す（無ければ描画して保存）
+    Returns: (key, png)
+    """
+    key = temperature_graph_key(series, current_year)
+    cache_key = f"weather:graph:{key}"
+    png = cache.get(cache_key)
+    metrics.count_cache('graph_png', 'miss' if png is None else 'hit')
+    if png is None:
+        png = render_temperature_graph_png(*series, current_year=current_year)
+        cache.set(cache_key, png, settings.WEATHER_GRAPH_CACHE_TIMEOUT)
+    return key, png
+
+
+_graph_init_lock = threading.Lock()
+_graph_initialized = False
+_japanese_font_available = False
+
+
+def init_graph_fonts():
+    """
+    日本語フォントの登録と matplotlib の rcParams の設定を1回だけ行う
+    最初にグラフを描くとき（WEATHER_PRELOAD なら preload()）に呼ばれる（2回目以降は何もしない）
+    Returns: 日本語フォントが使えるか
+    """
+    global _graph_initialized, _japanese_font_available
+
+    with _graph_init_lock:
+        if _graph_initialized:
+            return _japanese_font_available
+
+        import matplotlib
+        from matplotlib import font_manager
+
+        # 日本語フォントを設定（OS別）
+        system = platform.system()
+        font_found = False
+
+        if system == 'Windows':
+            # Windows環境: 日本語フォントを直接指定
+            matplotlib.rcParams['font.sans-serif'] = ['MS Gothic', 'Yu Gothic', 'Meiryo', 'BIZ UDGothic']
+            matplotlib.rcParams['font.family'] = 'sans-serif'
+            font_found = True
+            logger.info(f"Windows: Set Japanese fonts")
+        else:
+            # Linux/Mac環境: WenQuanYiフォントを使用
+            home = os.path.expanduser('~')
+            possible_paths = [
+                f'{home}/.fonts/wqy-zenhei.ttc',
+                f'{home}/.fonts/wqy-microhei.ttc',
+            ]
+
+            font_path = None
+            for path in possible_paths:
+                if os.path.exists(path):
+                    font_path = path
+                    break
+
+            if font_path:
+                try:
+                    # フォントをMatplotlibに登録
+                    font_manager.fontManager.addfont(font_path)
+                    font_prop = font_manager.FontProperties(fname=font_path)
+                    font_name = font_prop.get_name()
+
+                    # rcParamsに設定
+                    matplotlib.rcParams['font.family'] = font_name
+                    matplotlib.rcParams['font.sans-serif'] = [font_name]
+
+                    logger.info(f"Linux: Loaded {font_name} from {font_path}")
+                    font_found = True
+                except Exception as e:
+                    logger.error(f"Font load failed: {e}")
+                    font_found = False
+            else:
+                logger.warning("Japanese font not found - using English")
+                font_found = False
+
+        matplotlib.rcParams['axes.unicode_minus'] = False
+
+        _japanese_font_available = font_found
+        _graph_initialized = True
+        return font_found
+
+
+@metrics.timed('render_png')
+def render_temperature_graph_png(
+    current_year_temps, ten_year_temps, twenty_year_temps, thirty_year_temps, forty_year_temps, current_year=None,
+):
+    """
+    月平均気温の比較グラフを描画し PNG（bytes）で返す
+    凡例の年は current_year（系列を取得したときの基準年。省略すると今年）から数える
+    pyplot のグローバルな状態は使わず、リクエストごとに Figure と Agg キャンバスを作る
+    （スレッドワーカーでも安全）
+    """
+    # グラフは pyplot を使わず Figure と Agg キャンバスで直接描画する
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    font_found = init_graph_fonts()
+
+    months = range(1, 13)
+    fig = Figure(figsize=(12, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    
+    # データをプロット
+    if current_year is None:
+        current_year = datetime.now().year
+
+    # フォントが見つかっている場合は日本語、見つかってない場合は英語
+    if font_found:
+        title = "年度別 月平均気温の比較"
+        xlabel = "月"
+        ylabel = "平均気温 (°C)"
+        year_labels = {
+            'current': f"{current_year}年",
+            'ten': f"{current_year-10}年",
+            'twenty': f"{current_year-20}年",
+            'thirty': f"{current_year-30}年",
+            'forty': f"{current_year-40}年"
+        }
+    else:
+        title = "Monthly Average Temperature Comparison"
+        xlabel = "Month"
+        ylabel = "Temperature (°C)"
+        year_labels = {
+            'current': str(current_year),
+            'ten': str(current_year-10),
+            'twenty': str(current_year-20),
+            'thirty': str(current_year-30),
+            'forty': str(current_year-40)
+        }
+
+    if current_year_temps:
+        ax.plot(months, current_year_temps, marker='o', linewidth=2, label=year_labels['current'], color='#FF6B6B')
+    if ten_year_temps:
+        ax.plot(months, ten_year_temps, marker='s', linewidth=2, label=year_labels['ten'], color='#4ECDC4')
+    if twenty_year_temps:
+        ax.plot(months, twenty_year_temps, marker='^', linewidth=2, label=year_labels['twenty'], color='#45B7D1')
+    if thirty_year_temps:
+        ax.plot(months, thirty_year_temps, marker='D', linewidth=2, label=year_labels['thirty'], color='#FFA07A')
+    if forty_year_temps:
+        ax.plot(months, forty_year_temps, marker='v', linewidth=2, label=year_labels['forty'], color='#98D8C8')
+
+    ax.set_title(title, fontsize=16, fontweight='bold', pad=20)
+    ax.set_xlabel(xlabel, fontsize=12)
+    ax.set_ylabel(ylabel, fontsize=12)
+    ax.legend(loc='best', fontsize=11, framealpha=0.9)
+    ax.grid(True, alpha=0.3, linestyle='--')
+    ax.set_xticks(months)
+    fig.tight_layout()
+
+    buffer = BytesIO()
+    fig.savefig(buffer, format='png', bbox_inches='tight', dpi=120)
+
+    return buffer.getvalue()
@@ -0,0 +1,109 @@
+import logging
+import time
+from datetime import datetime
+
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from weather.stations import STATIONS, get_station
+from weather.prediction import get_trend_coefficients, trend_window_years
+from weather.scraping import JST, fetch_months_concurrently, fetch_years_concurrently
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = (
+        "気象庁の過去データ（日ごとの月ページと月ごとの年ページ）を遡って保存する。"
+        "--loop を付けると、その後は今月と先月だけを定期的に取り直し続ける"
+        "（--no-backfill なら遡らずに再同期だけを行う）"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--years', type=int, default=settings.WEATHER_BACKFILL_YEARS,
+            help='遡って保存する年数（今年を含む）',
+        )
+        parser.add_argument(
+            '--station', action='append', dest='stations', choices=sorted(STATIONS),
+            help='同期する観測所（複数指定可。既定値は WEATHER_SYNC_STATIONS）',
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='保存後も終了せず、今月と先月を定期的に再同期する',
+        )
+        parser.add_argument(
+            '--no-backfill', action='store_false', dest='backfill',
+            help='過去データを遡って保存しない（--loop と一緒に使う）',
+        )
+        parser.add_argument(
+            '--interval', type=int, default=settings.WEATHER_SYNC_INTERVAL,
+            help='--loop での再同期の間隔（秒）',
+        )
+
+    def handle(self, *args, **options):
+        stations = [get_station(slug) for slug in options['stations'] or settings.WEATHER_SYNC_STATIONS]
+        failed = []
+        if options['backfill']:
+            for station in stations:
+                try:
+                    self.backfill(options['years'], station)
+                except Exception as e:
+                    # DB のロック待ちのタイムアウトなどで他の観測所や --loop まで止めない
+                    logger.error(f"Backfill failed for {station.slug}: {e}")
+                    failed.append(station.slug)
+        if not options['loop']:
+            if failed:
+                raise CommandError(f"Backfill failed for {', '.join(failed)}")
+            return
+        # 遡って保存した直後は今月と先月も新しいので、最初の再同期は interval 後でよい
+        if options['backfill']:
+            time.sleep(options['interval'])
+        while True:
+            try:
+                for station in stations:
+                    self.resync_recent(station)
+            except Exception as e:
+                # 一時的な障害でスケジューラーごと止まらないようにする
+                logger.error(f"Weather sync failed: {e}")
+            time.sleep(options['interval'])
+
+    def backfill(self, years, station):
+        """
+        今年から years 年分を、古い年から1年ずつ保存する（保存済みで確定した月は取り直さない）
+        """
+        now = datetime.now(JST)
+        self.stdout.write(
+            f"Backfilling {years} years for station {station.slug} ({station.prec_no}/{station.block_no})"
+        )
+        for year in range(now.year - years + 1, now.year + 1):
+            months = [(year, month) for month in range(1, 13) if (year, month) <= (now.year, now.month)]
+            rows = fetch_months_concurrently(months, upstream=True, station=station)
+            fetch_years_concurrently([year], upstream=True, station=station)
+            missing = sum(1 for r in rows if r is None)
+            self.stdout.write(f"  {year}: {len(months) - missing}/{len(months)} months")
+        self.update_trends(station)
+        self.stdout.write(self.style.SUCCESS("Backfill complete"))
+
+    def resync_recent(self, station):
+        """
+        まだ変わりうる今月と先月（と、それを含む年ページ）だけを取り直す
+        """
+        now = datetime.now(JST)
+        previous = now - relativedelta(months=1)
+        months = [(previous.year, previous.month), (now.year, now.month)]
+        fetch_months_concurrently(months, refresh=True, upstream=True, station=station)
+        fetch_years_concurrently(
+            sorted({year for year, _ in months}), refresh=True, upstream=True, station=station,
+        )
+        self.stdout.write(f"Resynced {station.slug} {', '.join(f'{y}-{m:02d}' for y, m in months)}")
+        self.update_trends(station)
+
+    def update_trends(self, station):
+        """
+        予測に使う月ごとの気温トレンドを用意する（年が変わって窓がずれたときだけ計算される）
+        """
+        years = trend_window_years()
+        coefficients = get_trend_coefficients(years, station=station)
+        ready = sum(1 for c in coefficients.values() if c.is_final)
+        self.stdout.write(f"Trends {station.slug} {min(years)}-{max(years)}: {ready}/12 months final")
@@ -0,0 +1,295 @@
+"""
+処理時間とキャッシュの計測（Prometheus のテキスト形式で /metrics/ から返す）
+
+- weather_request_duration_seconds: エンドポイントごとの応答時間のヒストグラム
+- weather_requests_total: エンドポイント・メソッド・ステータスごとのリクエスト数
+- weather_stage_duration_seconds: 処理段階（上流の取得・HTML/JSON の解析・集計・回帰・PNG の描画）ごとの時間
+- weather_cache_lookups_total: キャッシュごとの参照結果（hit / miss など）の回数
+- weather_upstream_requests_total: 気象庁のホストごとの取得回数（成功・失敗）
+- weather_upstream_duration_seconds: 気象庁のホストごとの取得時間のヒストグラム（失敗した取得も含む）
+
+値はプロセス（gunicorn のワーカー）ごとに持ち、すべての系列に worker ラベル（プロセス ID）を付ける
+ワーカーが複数あると /metrics/ はスクレイプのたびに別のワーカーが応答するので、ラベルが無いと
+回数が行き来して Prometheus がリセットと見なしてしまう。ワーカーごとの系列として扱い、集計するときは
+    sum without (worker) (rate(weather_requests_total[5m]))
+のようにまとめる（ワーカーが入れ替わると新しい worker の系列が0から始まる）
+/metrics/ は WEATHER_METRICS_TOKEN を設定したときだけ有効で、Authorization: Bearer <トークン> が要る
+各レスポンスには処理段階ごとの合計時間を Server-Timing ヘッダーで付ける
+（並行して取得したページの時間はそれぞれ足すので、応答時間より長くなることがある）
+"""
+import hmac
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+logger = logging.getLogger(__name__)
+
+# ヒストグラムのバケット（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + '}'
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    ラベルの値ごとに増えるだけの回数
+    """
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def lines(self, extra=()):
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            yield f"{self.name}{_format_labels(self.labels, label_values, extra)} {_format_number(value)}"
+
+
+class Histogram:
+    """
+    ラベルの値ごとの観測値の分布（バケットごとの累積回数・合計・回数）
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def lines(self, extra=()):
+        with self._lock:
+            values = {key: dict(series, buckets=list(series['buckets'])) for key, series in self._values.items()}
+        for label_values, series in sorted(values.items()):
+            for bound, count in zip((*self.buckets, float('inf')), (*series['buckets'], series['count'])):
+                labels = _format_labels(self.labels, label_values, [*extra, ('le', _format_number(bound))])
+                yield f"{self.name}_bucket{labels} {count}"
+            labels = _format_labels(self.labels, label_values, extra)
+            yield f"{self.name}_sum{labels} {_format_number(series['sum'])}"
+            yield f"{self.name}_count{labels} {series['count']}"
+
+
+REQUEST_LATENCY = Histogram(
+    'weather_request_duration_seconds', 'エンドポイントごとの応答時間（秒）', ('endpoint',),
+)
+REQUESTS = Counter(
+    'weather_requests_total', 'エンドポイント・メソッド・ステータスごとのリクエスト数', ('endpoint', 'method', 'status'),
+)
+STAGE_LATENCY = Histogram(
+    'weather_stage_duration_seconds', '処理段階ごとの時間（秒）', ('stage',),
+)
+CACHE_LOOKUPS = Counter(
+    'weather_cache_lookups_total', 'キャッシュごとの参照結果の回数', ('cache', 'result'),
+)
+UPSTREAM_REQUESTS = Counter(
+    'weather_upstream_requests_total', '気象庁のホストごとの取得回数', ('host', 'outcome'),
+)
+UPSTREAM_LATENCY = Histogram(
+    'weather_upstream_duration_seconds', '気象庁のホストごとの取得時間（秒）', ('host',),
+)
+
+
+def render():
+    """
+    すべてのメトリクスを Prometheus のテキスト形式（version 0.0.4）にする
+    worker ラベルは fork した後のワーカーのプロセス ID にするため、ここで付ける
+    """
+    worker = [('worker', os.getpid())]
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.lines(worker))
+    return '\n'.join(lines) + '\n'
+
+
+def is_authorized(request):
+    """
+    /metrics/ を返してよいか（Authorization: Bearer に WEATHER_METRICS_TOKEN が付いているか）
+    """
+    token = settings.WEATHER_METRICS_TOKEN
+    scheme, _, given = request.headers.get('Authorization', '').partition(' ')
+    if not token or scheme.lower() != 'bearer':
+        return False
+    return hmac.compare_digest(given.strip().encode('utf-8'), token.encode('utf-8'))
+
+
+class _StageTotals:
+    """
+    1リクエストの間の処理段階ごとの合計時間（リクエストの中で起動したスレッドとも共有する）
+    """
+    def __init__(self):
+        self.seconds = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def server_timing(self, total):
+        with self._lock:
+            items = list(self.seconds.items())
+        return ', '.join(
+            f"{name};dur={seconds * 1000:.1f}" for name, seconds in [*items, ('total', total)]
+        )
+
+
+_request_stages = ContextVar('weather_request_stages', default=None)
+
+
+def observe_stage(name, seconds):
+    STAGE_LATENCY.observe(seconds, name)
+    stages = _request_stages.get()
+    if stages is not None:
+        stages.add(name, seconds)
+
+
+def current_stages():
+    """
+    処理中のリクエストの処理段階ごとの合計時間（秒）。metrics_middleware の外では空
+    """
+    stages = _request_stages.get()
+    if stages is None:
+        return {}
+    with stages._lock:
+        return dict(stages.seconds)
+
+
+@contextmanager
+def stage(name):
+    """
+    with ブロックの時間を処理段階 name として記録する
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - started)
+
+
+def timed(name):
+    """
+    関数の実行時間を処理段階 name として記録するデコレーター
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count_cache(cache, result, amount=1):
+    """
+    キャッシュの参照結果を数える（result は 'hit' / 'miss' など）
+    """
+    if amount:
+        CACHE_LOOKUPS.inc(cache, result, amount=amount)
+
+
+def count_upstream(host, error, seconds):
+    """
+    気象庁への取得1回の結果と時間（リトライを含む）をホストごとに記録する
+    """
+    UPSTREAM_REQUESTS.inc(host, 'error' if error else 'ok')
+    UPSTREAM_LATENCY.observe(seconds, host)
+
+
+def _endpoint_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.url_name or match.view_name
+
+
+def _finish_request(request, response, started, stages):
+    elapsed = time.perf_counter() - started
+    endpoint = _endpoint_name(request)
+    REQUEST_LATENCY.observe(elapsed, endpoint)
+    REQUESTS.inc(endpoint, request.method, str(response.status_code))
+    # ストリーミングでは本文を送る前の時間（最初の応答までの時間）になる
+    response['Server-Timing'] = stages.server_timing(elapsed)
+    logger.debug(f"{request.method} {request.path} {response.status_code} {elapsed * 1000:.1f}ms {stages.seconds}")
+    return response
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """
+    エンドポイントごとの応答時間とリクエスト数を記録し、Server-Timing ヘッダーを付ける
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            stages = _StageTotals()
+            token = _request_stages.set(stages)
+            started = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                _request_stages.reset(token)
+            return _finish_request(request, response, started, stages)
+    else:
+        def middleware(request):
+            stages = _StageTotals()
+            token = _request_stages.set(stages)
+            started = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                _request_stages.reset(token)
+            return _finish_request(request, response, started, stages)
+    return middleware
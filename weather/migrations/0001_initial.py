@@ -0,0 +1,33 @@
+# Generated by Django 5.0.6 on 2026-10-18 04:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyPageCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prec_no', models.IntegerField()),
+                ('block_no', models.IntegerField()),
+                ('year', models.IntegerField()),
+                ('month', models.IntegerField()),
+                ('rows', models.JSONField(default=list)),
+                ('is_final', models.BooleanField(default=False)),
+                ('fetched_at', models.DateTimeField()),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('miss_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='monthlypagecache',
+            constraint=models.UniqueConstraint(fields=('prec_no', 'block_no', 'year', 'month'), name='unique_monthly_page'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.6 on 2026-10-18 04:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='YearlyPageCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prec_no', models.IntegerField()),
+                ('block_no', models.IntegerField()),
+                ('year', models.IntegerField()),
+                ('rows', models.JSONField(default=list)),
+                ('is_final', models.BooleanField(default=False)),
+                ('fetched_at', models.DateTimeField()),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('miss_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='yearlypagecache',
+            constraint=models.UniqueConstraint(fields=('prec_no', 'block_no', 'year'), name='unique_yearly_page'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.6 on 2026-10-18 04:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0002_yearlypagecache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendCoefficient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prec_no', models.IntegerField()),
+                ('block_no', models.IntegerField()),
+                ('target_month', models.IntegerField()),
+                ('year_first', models.IntegerField()),
+                ('year_last', models.IntegerField()),
+                ('slope', models.FloatField(null=True)),
+                ('intercept', models.FloatField(null=True)),
+                ('mean_temp', models.FloatField(null=True)),
+                ('sample_count', models.PositiveIntegerField(default=0)),
+                ('is_final', models.BooleanField(default=False)),
+                ('computed_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='trendcoefficient',
+            constraint=models.UniqueConstraint(fields=('prec_no', 'block_no', 'target_month', 'year_first', 'year_last'), name='unique_trend_coefficient'),
+        ),
+    ]
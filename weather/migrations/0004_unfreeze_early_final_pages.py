@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta, timezone
+
+from django.db import migrations
+
+JST = timezone(timedelta(hours=9))
+# マイグレーションの時点の WEATHER_FINAL_GRACE_DAYS の既定値
+GRACE = timedelta(days=2)
+
+
+def _period_end(year, month=None):
+    if month is None or month == 12:
+        return datetime(year + 1, 1, 1, tzinfo=JST)
+    return datetime(year, month + 1, 1, tzinfo=JST)
+
+
+def unfreeze_early_final_pages(apps, schema_editor):
+    """
+    期間が終わった直後（猶予の前）に取得して確定扱いにしたページを、TTL で取り直す扱いに戻す
+    """
+    for name, fields in (('MonthlyPageCache', ('year', 'month')), ('YearlyPageCache', ('year',))):
+        model = apps.get_model('weather', name)
+        early = [
+            pk for pk, fetched_at, *key in model.objects.filter(is_final=True).values_list('pk', 'fetched_at', *fields)
+            if fetched_at < _period_end(*key) + GRACE
+        ]
+        model.objects.filter(pk__in=early).update(is_final=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0003_trendcoefficient'),
+    ]
+
+    operations = [
+        migrations.RunPython(unfreeze_early_final_pages, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,89 @@
 from django.db import models
 
-# Create your models here.
+
+class PageCache(models.Model):
+    """
+    気象庁ページ（data2_s テーブルの行）のキャッシュの共通部分
+    期間が終わって数日（WEATHER_FINAL_GRACE_DAYS）過ぎてから取得したページは二度と変わらないので期限なし、
+    それより前に取得したページは短い TTL で再取得する
+    """
+    prec_no = models.IntegerField()
+    block_no = models.IntegerField()
+    year = models.IntegerField()
+    rows = models.JSONField(default=list)
+    # 取得時点で期間が終わって猶予も過ぎていたか（True なら以後再取得しない）
+    is_final = models.BooleanField(default=False)
+    fetched_at = models.DateTimeField()
+    hit_count = models.PositiveIntegerField(default=0)
+    miss_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class MonthlyPageCache(PageCache):
+    """
+    daily_s1.php の月ページ（日ごとの値）を観測所・年月ごとに保存する
+    """
+    month = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['prec_no', 'block_no', 'year', 'month'],
+                name='unique_monthly_page',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.prec_no}/{self.block_no} {self.year}-{self.month:02d}"
+
+
+class YearlyPageCache(PageCache):
+    """
+    monthly_s1.php の年ページ（月ごとの値）を観測所・年ごとに保存する
+    """
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['prec_no', 'block_no', 'year'],
+                name='unique_yearly_page',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.prec_no}/{self.block_no} {self.year}"
+
+
+class TrendCoefficient(models.Model):
+    """
+    観測所・月ごとの気温トレンド（year_first〜year_last の月平均気温に当てはめた直線）
+    過去の年だけから計算するので、すべての年の値がそろっていれば（is_final）以後変わらない
+    """
+    prec_no = models.IntegerField()
+    block_no = models.IntegerField()
+    target_month = models.IntegerField()
+    year_first = models.IntegerField()
+    year_last = models.IntegerField()
+    # 気温 = slope * 年 + intercept（sample_count が足りなければ None）
+    slope = models.FloatField(null=True)
+    intercept = models.FloatField(null=True)
+    mean_temp = models.FloatField(null=True)
+    sample_count = models.PositiveIntegerField(default=0)
+    is_final = models.BooleanField(default=False)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['prec_no', 'block_no', 'target_month', 'year_first', 'year_last'],
+                name='unique_trend_coefficient',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.prec_no}/{self.block_no} {self.target_month:02d} ({self.year_first}-{self.year_last})"
+
+    def predict(self, year):
+        return None if self.slope is None else self.slope * year + self.intercept
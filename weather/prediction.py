@@ -0,0 +1,233 @@
+"""
+過去の月平均気温に直線を当てはめた気温トレンドの予測
+"""
+import logging
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from . import metrics
+from .models import TrendCoefficient
+from .scraping import monthly_mean_matrix
+from .stations import get_station
+
+logger = logging.getLogger(__name__)
+
+# 気温トレンドを当てはめる過去の年数と、予測に必要な最低年数
+TREND_WINDOW_YEARS = 10
+TREND_MIN_SAMPLES = 3
+
+@metrics.timed('regression')
+def fit_linear_trends(years, matrix):
+    """
+    (年数, 列数) の行列の列ごとに、年に対する直線を最小二乗法で当てはめる（全列を1回で計算）
+    NaN の値は列ごとに除く。有効な値が2つ未満の列の slope / intercept は NaN
+    Returns: dict with slope, intercept, mean, count（いずれも列数の配列）
+    """
+    matrix = np.asarray(matrix, dtype=float)
+    x = np.asarray(years, dtype=float)[:, None]
+    valid = ~np.isnan(matrix)
+    count = valid.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_mean = np.where(valid, x, 0.0).sum(axis=0) / count
+        y_mean = np.where(valid, matrix, 0.0).sum(axis=0) / count
+        dx = np.where(valid, x - x_mean, 0.0)
+        dy = np.where(valid, matrix - y_mean, 0.0)
+        sxx = (dx * dx).sum(axis=0)
+        slope = np.where(sxx > 0, (dx * dy).sum(axis=0) / sxx, np.nan)
+        residual = np.where(valid, dy - slope * dx, 0.0)
+        residual_std = np.where(count > 2, np.sqrt((residual * residual).sum(axis=0) / (count - 2)), np.nan)
+    return {
+        'slope': slope,
+        'intercept': y_mean - slope * x_mean,
+        'mean': y_mean,
+        'count': count,
+        # 予測区間の計算用（年の平均・偏差平方和・残差の標準偏差）
+        'x_mean': x_mean,
+        'sxx': sxx,
+        'residual_std': residual_std,
+    }
+
+def trend_window_years(today=None, lookback=TREND_WINDOW_YEARS):
+    """
+    トレンドを当てはめる年（去年から lookback 年分、新しい順）
+    """
+    today = today or datetime.now()
+    return [today.year - year_back for year_back in range(1, lookback + 1)]
+
+# t 分布の上側 2.5% 点（自由度 → 値）。表にない自由度は、それ以下で最も近い自由度の値を使う（区間は広めになる）
+_T_975 = {
+    1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262, 10: 2.228,
+    11: 2.201, 12: 2.179, 13: 2.160, 14: 2.145, 15: 2.131, 16: 2.120, 17: 2.110, 18: 2.101, 19: 2.093,
+    20: 2.086, 25: 2.060, 30: 2.042, 40: 2.021, 60: 2.000, 120: 1.980,
+}
+
+def _t_975(dfs):
+    return np.array([
+        _T_975[max(k for k in _T_975 if k <= df)] if df >= 1 else np.nan
+        for df in np.atleast_1d(dfs)
+    ])
+
+def temperature_outlook(horizon=12, lookback=TREND_WINDOW_YEARS, today=None, station=None):
+    """
+    今月から horizon ヶ月分の月平均気温の予測を、過去 lookback 年の (年数 × 12ヶ月) の行列に
+    月ごとの直線をまとめて当てはめて計算する
+    各月の predicted_temp（予測値）・slope（1年あたりの変化）・interval（95% 予測区間）・
+    count（使えた年数）・past_avg_temp（期間の平均）を返す（年数が足りない月は None）
+    """
+    today = today or datetime.now()
+    years = trend_window_years(today, lookback)
+    fit = fit_linear_trends(years, monthly_mean_matrix(years, station=station))
+
+    targets = [
+        (today.year + (today.month - 1 + offset) // 12, (today.month - 1 + offset) % 12 + 1)
+        for offset in range(horizon)
+    ]
+    columns = np.array([month - 1 for _, month in targets])
+    target_years = np.array([year for year, _ in targets], dtype=float)
+    count = fit['count'][columns]
+    predicted = fit['slope'][columns] * target_years + fit['intercept'][columns]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        half_width = _t_975(count - 2) * fit['residual_std'][columns] * np.sqrt(
+            1 + 1 / count + (target_years - fit['x_mean'][columns]) ** 2 / fit['sxx'][columns]
+        )
+
+    months = []
+    for i, (year, month) in enumerate(targets):
+        enough = count[i] >= TREND_MIN_SAMPLES
+        months.append({
+            'year': year,
+            'month': month,
+            'predicted_temp': round(float(predicted[i]), 1) if enough else None,
+            'slope': round(float(fit['slope'][columns[i]]), 3) if enough else None,
+            'interval': [
+                round(float(predicted[i] - half_width[i]), 1),
+                round(float(predicted[i] + half_width[i]), 1),
+            ] if enough else None,
+            'count': int(count[i]),
+            'past_avg_temp': round(float(fit['mean'][columns[i]]), 1) if enough else None,
+        })
+    return {
+        'years': [min(years), max(years)],
+        'confidence_level': 0.95,
+        'months': months,
+    }
+
+def get_trend_coefficients(past_years, refresh=False, station=None):
+    """
+    past_years の各月（1〜12月）の気温トレンドを {月: TrendCoefficient} で返す
+    保存済みならそのまま使い、無い月や、値がそろっていない（is_final でない）まま
+    WEATHER_CURRENT_MONTH_CACHE_TTL を過ぎた月があるときだけ、12ヶ月分をまとめて計算し直す
+    """
+    station = get_station(station)
+    lookup = {
+        'prec_no': station.prec_no,
+        'block_no': station.block_no,
+        'year_first': min(past_years),
+        'year_last': max(past_years),
+    }
+    coefficients = {c.target_month: c for c in TrendCoefficient.objects.filter(**lookup)}
+    ttl = timedelta(seconds=settings.WEATHER_CURRENT_MONTH_CACHE_TTL)
+    now = timezone.now()
+    stale = refresh or len(coefficients) < 12 or any(
+        not c.is_final and now - c.computed_at >= ttl for c in coefficients.values()
+    )
+    metrics.count_cache('trend_coefficients', 'miss' if stale else 'hit')
+    if not stale:
+        return coefficients
+
+    years = list(range(lookup['year_first'], lookup['year_last'] + 1))
+    fit = fit_linear_trends(years, monthly_mean_matrix(years, station=station))
+    for i, month in enumerate(range(1, 13)):
+        enough = fit['count'][i] >= TREND_MIN_SAMPLES
+        coefficients[month], _ = TrendCoefficient.objects.update_or_create(
+            target_month=month,
+            **lookup,
+            defaults={
+                'slope': float(fit['slope'][i]) if enough else None,
+                'intercept': float(fit['intercept'][i]) if enough else None,
+                'mean_temp': float(fit['mean'][i]) if enough else None,
+                'sample_count': int(fit['count'][i]),
+                'is_final': int(fit['count'][i]) == len(years),
+                'computed_at': now,
+            },
+        )
+    return coefficients
+
+def predict_temperature_trend(station=None):
+    """
+    過去10年のデータから今月・来月・再来月の気温トレンドを予測
+    月ごとの直線（TrendCoefficient）は保存済みのものを使い、予測は引くだけ
+    Returns: dict with predictions for current, next, and next-next month
+    """
+    from dateutil.relativedelta import relativedelta
+
+    try:
+        today = datetime.now()
+
+        predictions = []
+        coefficients = get_trend_coefficients(trend_window_years(today), station=station)
+
+        for month_offset in [0, 1, 2]:  # 今月、来月、再来月
+            target_date = today + relativedelta(months=month_offset)
+            target_month = target_date.month
+            target_year = target_date.year
+
+            coefficient = coefficients[target_month]
+            if coefficient.slope is not None:  # 最低3年分のデータがあれば予測
+                # 今年の予測
+                predicted_temp = coefficient.predict(target_year)
+
+                # 過去10年の平均
+                avg_past_temp = coefficient.mean_temp
+
+                # トレンド判定
+                temp_diff = predicted_temp - avg_past_temp
+                if temp_diff > 1.0:
+                    trend = "暑くなる"
+                    trend_en = "hotter"
+                elif temp_diff < -1.0:
+                    trend = "寒くなる"
+                    trend_en = "colder"
+                else:
+                    trend = "平年並み"
+                    trend_en = "average"
+
+                predictions.append({
+                    'month': target_month,
+                    'year': target_year,
+                    'predicted_temp': round(predicted_temp, 1),
+                    'past_avg_temp': round(avg_past_temp, 1),
+                    'temp_diff': round(temp_diff, 1),
+                    'trend': trend,
+                    'trend_en': trend_en,
+                    'confidence': min(coefficient.sample_count * 10, 100)  # データ数に応じた信頼度
+                })
+            else:
+                predictions.append({
+                    'month': target_month,
+                    'year': target_year,
+                    'predicted_temp': None,
+                    'past_avg_temp': None,
+                    'temp_diff': None,
+                    'trend': 'データ不足',
+                    'trend_en': 'insufficient_data',
+                    'confidence': 0
+                })
+
+        return {
+            'success': True,
+            'current_month': predictions[0],
+            'next_month': predictions[1],
+            'next_next_month': predictions[2],
+            'data_source': '過去10年の気象庁データ'
+        }
+
+    except Exception as e:
+        logger.error(f"Temperature prediction error: {e}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
@@ -0,0 +1,40 @@
+"""
+ワーカーを fork する前に、重いモジュールの読み込みとグラフの準備を済ませておく
+
+WEATHER_PRELOAD=True のとき WeatherConfig.ready() から呼ばれる
+gunicorn の --preload と一緒に使うと、マスタープロセスで1回だけ行ったものを各ワーカーが
+fork でそのまま受け継ぐので、ワーカーの起動（max_requests などによる入れ替えも含む）と
+最初のリクエストが速くなる
+
+    WEATHER_PRELOAD=True gunicorn weather_project.wsgi:application --preload --workers 2
+
+fork の前なので、DB の接続・スレッド・上流への Session はここでは作らない
+"""
+import gc
+import logging
+import time
+from importlib import import_module
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def preload():
+    """
+    URLconf（ビュー）と scraping / prediction / graphing を読み込み、matplotlib とフォントを準備する
+    非同期ビューを使うときは httpx も読み込む
+    """
+    started = time.perf_counter()
+    import_module(settings.ROOT_URLCONF)
+
+    from . import graphing, prediction, scraping  # noqa: F401
+    graphing.init_graph_fonts()
+    from matplotlib.backends.backend_agg import FigureCanvasAgg  # noqa: F401
+    from matplotlib.figure import Figure  # noqa: F401
+    if settings.WEATHER_ASYNC_VIEWS:
+        scraping._httpx()
+
+    # 読み込んだオブジェクトを GC の対象から外し、fork 後のワーカーでページがコピーされにくくする
+    gc.freeze()
+    logger.info(f"Preloaded weather modules in {(time.perf_counter() - started) * 1000:.0f}ms")
@@ -0,0 +1,230 @@
+"""
+1リクエストだけを cProfile で計測するミドルウェア（本番で遅いリクエストの原因を調べる用）
+
+WEATHER_PROFILE_TOKEN を設定し、同じ値を X-Weather-Profile ヘッダーか ?profile= で送ると、
+そのリクエストを cProfile の下で処理し、レスポンスの代わりに計測結果の JSON を返す
+
+    curl -H "X-Weather-Profile: $WEATHER_PROFILE_TOKEN" https://.../weather-graph/
+    curl "https://.../predict-weather/?profile=$WEATHER_PROFILE_TOKEN&profile_top=40"
+
+結果には次のものが入る
+- weather パッケージの関数（累積時間順）と、サードパーティのライブラリの関数（自身の時間順）の上位
+- リクエスト中の気象庁への取得の回数・時間・URL ごとの一覧
+- 処理段階ごとの合計時間（weather/metrics.py）
+WEATHER_PROFILE_DIR を設定すると、同じ JSON と pstats の .prof ファイルをそこにも保存する
+
+Python 3.12 以降の cProfile はプロセス内の全スレッドを計測する（ページを並行して取得する
+スレッドも入る代わりに、同じワーカーで同時に処理していた他のリクエストも混ざる）
+cProfile は同時に1つしか動かせないので、計測中に来た計測リクエストには 409 を返す
+"""
+import cProfile
+import hmac
+import json
+import logging
+import os
+import pstats
+import site
+import sys
+import sysconfig
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.utils.decorators import sync_and_async_middleware
+
+from . import metrics
+from .scraping import request_scope
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Weather-Profile'
+DEFAULT_TOP = 25
+
+_profile_lock = threading.Lock()
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+_THIRD_PARTY_DIRS = tuple(
+    os.path.abspath(path) for path in {*site.getsitepackages(), site.getusersitepackages(), sysconfig.get_path('purelib')}
+)
+
+
+def _is_trusted(request):
+    token = settings.WEATHER_PROFILE_TOKEN
+    if not token:
+        return False
+    given = request.headers.get(PROFILE_HEADER) or request.GET.get('profile') or ''
+    return hmac.compare_digest(given.encode('utf-8'), token.encode('utf-8'))
+
+
+def _top(request):
+    try:
+        return max(1, min(200, int(request.GET.get('profile_top', DEFAULT_TOP))))
+    except ValueError:
+        return DEFAULT_TOP
+
+
+def _classify(filename):
+    path = os.path.abspath(filename)
+    if path.startswith(_APP_DIR + os.sep):
+        return 'app'
+    if any(path.startswith(directory + os.sep) for directory in _THIRD_PARTY_DIRS):
+        return 'third_party'
+    return None
+
+
+def _function_label(filename, lineno, name):
+    path = os.path.abspath(filename)
+    for directory in (os.path.dirname(_APP_DIR), *_THIRD_PARTY_DIRS):
+        if path.startswith(directory + os.sep):
+            path = os.path.relpath(path, directory)
+            break
+    return f"{path}:{lineno}({name})"
+
+
+def summarize_profile(profiler, top=DEFAULT_TOP):
+    """
+    cProfile の結果を weather パッケージ（累積時間順）とサードパーティ（自身の時間順）の上位に分ける
+    """
+    groups = {'app': [], 'third_party': []}
+    for (filename, lineno, name), (_, calls, self_time, cumulative, _) in pstats.Stats(profiler).stats.items():
+        group = _classify(filename)
+        if group is not None:
+            groups[group].append({
+                'function': _function_label(filename, lineno, name),
+                'calls': calls,
+                'self_ms': round(self_time * 1000, 3),
+                'cumulative_ms': round(cumulative * 1000, 3),
+            })
+    groups['app'].sort(key=lambda row: row['cumulative_ms'], reverse=True)
+    groups['third_party'].sort(key=lambda row: row['self_ms'], reverse=True)
+    return {name: rows[:top] for name, rows in groups.items()}
+
+
+def _upstream_summary(scope):
+    calls = list(scope.upstream_calls)
+    return {
+        'count': len(calls),
+        'errors': sum(1 for _, _, error in calls if error),
+        'total_ms': round(sum(elapsed for _, elapsed, _ in calls) * 1000, 3),
+        'max_ms': round(max((elapsed for _, elapsed, _ in calls), default=0.0) * 1000, 3),
+        'calls': [
+            {'url': url, 'ms': round(elapsed * 1000, 3), 'error': error}
+            for url, elapsed, error in calls
+        ],
+    }
+
+
+def _drain(response):
+    """
+    ストリーミングのレスポンスは本文の生成も計測に含める
+    Returns: 本文のバイト数
+    """
+    if response.streaming:
+        return len(b''.join(response.streaming_content))
+    return len(response.content)
+
+
+async def _adrain(response):
+    if response.streaming and response.is_async:
+        return len(b''.join([chunk async for chunk in response.streaming_content]))
+    return _drain(response)
+
+
+def _busy():
+    return JsonResponse({'error': '別のリクエストを計測中です'}, status=409)
+
+
+def _report(request, response, profiler, scope, elapsed, size):
+    match = getattr(request, 'resolver_match', None)
+    report = {
+        'profile_id': uuid.uuid4().hex[:12],
+        'method': request.method,
+        'path': request.get_full_path(),
+        'endpoint': match.url_name if match is not None else None,
+        'status': response.status_code,
+        'content_type': response.get('Content-Type'),
+        'bytes': size,
+        'elapsed_ms': round(elapsed * 1000, 3),
+        'upstream': _upstream_summary(scope),
+        'stages_ms': {name: round(seconds * 1000, 3) for name, seconds in metrics.current_stages().items()},
+        'functions': summarize_profile(profiler, _top(request)),
+        'python': sys.version.split()[0],
+        'pid': os.getpid(),
+        'profiled_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    if settings.WEATHER_PROFILE_DIR:
+        report['saved_to'] = _save(report, profiler)
+    logger.info(
+        f"Profiled {request.method} {request.path}: {report['elapsed_ms']}ms, "
+        f"{report['upstream']['count']} upstream calls ({report['profile_id']})"
+    )
+    return HttpResponse(
+        json.dumps(report, ensure_ascii=False, indent=2),
+        content_type='application/json; charset=utf-8',
+        headers={'Cache-Control': 'no-store'},
+    )
+
+
+def _save(report, profiler):
+    """
+    WEATHER_PROFILE_DIR に <時刻>-<エンドポイント>-<id>.json と .prof（pstats 形式）を保存する
+    """
+    directory = settings.WEATHER_PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    stem = f"{time.strftime('%Y%m%d-%H%M%S')}-{report['endpoint'] or 'unmatched'}-{report['profile_id']}"
+    base = os.path.join(directory, stem)
+    profiler.dump_stats(f"{base}.prof")
+    with open(f"{base}.json", 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return f"{base}.json"
+
+
+@sync_and_async_middleware
+def profiling_middleware(get_response):
+    """
+    信頼できる呼び出し元（WEATHER_PROFILE_TOKEN を知っている）のリクエストだけを計測する
+    それ以外のリクエストはそのまま通す
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if not _is_trusted(request):
+                return await get_response(request)
+            if not _profile_lock.acquire(blocking=False):
+                return _busy()
+            try:
+                with request_scope() as scope:
+                    profiler = cProfile.Profile()
+                    started = time.perf_counter()
+                    profiler.enable()
+                    try:
+                        response = await get_response(request)
+                        size = await _adrain(response)
+                    finally:
+                        profiler.disable()
+                    return _report(request, response, profiler, scope, time.perf_counter() - started, size)
+            finally:
+                _profile_lock.release()
+    else:
+        def middleware(request):
+            if not _is_trusted(request):
+                return get_response(request)
+            if not _profile_lock.acquire(blocking=False):
+                return _busy()
+            try:
+                with request_scope() as scope:
+                    profiler = cProfile.Profile()
+                    started = time.perf_counter()
+                    profiler.enable()
+                    try:
+                        response = get_response(request)
+                        size = _drain(response)
+                    finally:
+                        profiler.disable()
+                    return _report(request, response, profiler, scope, time.perf_counter() - started, size)
+            finally:
+                _profile_lock.release()
+    return middleware
@@ -0,0 +1,1514 @@
+"""
+気象庁（過去データの etrn ページと天気予報の JSON）からの取得・解析・キャッシュと集計
+
+HTML の解析に BeautifulSoup を使うのは lxml が無いときだけで、httpx は非同期ビューで
+初めて使うときに読み込む（どちらも必要になるまで import しない）
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from functools import partial
+from urllib.parse import urlsplit
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    from lxml import html as lxml_html
+except ImportError:  # lxml が無い環境では BeautifulSoup で解析する
+    lxml_html = None
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, IntegrityError
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics
+from .models import MonthlyPageCache, YearlyPageCache
+from .stations import get_station
+
+logger = logging.getLogger(__name__)
+
+BASE_URL = f"{settings.WEATHER_ETRN_BASE_URL}/daily_s1.php"
+MONTHLY_BASE_URL = f"{settings.WEATHER_ETRN_BASE_URL}/monthly_s1.php"
+TEMPERATURE_INDEX = 7
+WEATHER_INDEX = 20
+# monthly_s1 の「気温 平均 日最高」列（daily_s1 の TEMPERATURE_INDEX = 日最高気温の月平均）
+MONTHLY_TEMPERATURE_INDEX = 8
+# 気象庁の「月」は日本時間で区切る
+JST = dt_timezone(timedelta(hours=9))
+
+class RequestScope:
+    """
+    1リクエストの間だけ有効な月ページの表と、上流（気象庁）への取得回数・失敗回数
+    同じ年月を何度参照しても取得・解析は1回で済む
+    upstream_calls は終わった取得ごとの (URL, 秒, 失敗したか)
+    unavailable は取得できなかった（他のリクエストの取得の失敗を待って受け取った分も含む）
+    ページ・予報の集合（後で取れたものは除く）。これがある応答は保存して使い回さない
+    """
+    def __init__(self):
+        self.month_rows = {}
+        self.year_rows = {}
+        self.parsed_months = {}
+        self.upstream_fetches = 0
+        self.upstream_errors = 0
+        self.upstream_calls = []
+        self.unavailable = set()
+        self._lock = threading.Lock()
+
+    def count_upstream_fetch(self):
+        with self._lock:
+            self.upstream_fetches += 1
+
+    def record_upstream_call(self, url, elapsed, error):
+        with self._lock:
+            self.upstream_calls.append((url, elapsed, error))
+            self.upstream_errors += int(error)
+
+    def record_unavailable(self, *what):
+        with self._lock:
+            self.unavailable.add(what)
+
+    def record_available(self, *what):
+        with self._lock:
+            self.unavailable.discard(what)
+
+_request_scope = ContextVar('weather_request_scope', default=None)
+
+@contextmanager
+def request_scope():
+    """
+    with ブロックの間、月ページの取得結果をリクエスト単位で共有する
+    既に request_scope() の中なら外側の表をそのまま使う
+    """
+    outer = _request_scope.get()
+    if outer is not None:
+        yield outer
+        return
+    scope = RequestScope()
+    token = _request_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _request_scope.reset(token)
+
+def _record_unavailable(*what):
+    scope = _request_scope.get()
+    if scope is not None:
+        scope.record_unavailable(*what)
+
+def _count_upstream_fetch():
+    scope = _request_scope.get()
+    if scope is not None:
+        scope.count_upstream_fetch()
+
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
+@contextmanager
+def _host_slot(url):
+    """
+    上流ホストごとの同時接続数を WEATHER_UPSTREAM_MAX_CONCURRENCY までに制限する
+    （プロセス内の全リクエストで共有）
+    """
+    host = urlsplit(url).netloc
+    with _host_slots_lock:
+        slot = _host_slots.get(host)
+        if slot is None:
+            slot = _host_slots[host] = threading.BoundedSemaphore(settings.WEATHER_UPSTREAM_MAX_CONCURRENCY)
+    with slot:
+        yield
+
+class _Flight:
+    """
+    取得中の1件（同じものを取りに来た他のスレッドは event を待って result を使う）
+    非同期ビューは wait_async でイベントループのまま待つ（待つ間にスレッドを使わない）
+    """
+    __slots__ = ('event', 'result', '_waiters', '_lock')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self._waiters = []
+        self._lock = threading.Lock()
+
+    def wait(self, timeout=None):
+        """
+        取得が終わるのを待つ（既定では最大 WEATHER_SINGLE_FLIGHT_TIMEOUT 秒）
+        Returns: 終わったか（True なら結果は result）
+        """
+        return self.event.wait(settings.WEATHER_SINGLE_FLIGHT_TIMEOUT if timeout is None else timeout)
+
+    async def wait_async(self, timeout=None):
+        """
+        wait の非同期版。取得が終わると _land_flight が待っているループに結果を渡す
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self.event.is_set():
+                return True
+            self._waiters.append((loop, future))
+        try:
+            await asyncio.wait_for(future, settings.WEATHER_SINGLE_FLIGHT_TIMEOUT if timeout is None else timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def land(self, result):
+        with self._lock:
+            self.result = result
+            self.event.set()
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve_future, future)
+            except RuntimeError:
+                # 待っていたループが既に閉じている
+                pass
+
+def _resolve_future(future):
+    if not future.done():
+        future.set_result(None)
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+def _join_flight(key):
+    """
+    single-flight: プロセス内で key を取得中のスレッドがあれば (その Flight, False)、
+    無ければ新しい Flight を登録して (Flight, True) を返す
+    True を受け取った側が取得し、終わったら必ず _land_flight を呼ぶ
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        if flight is not None:
+            return flight, False
+        flight = _flights[key] = _Flight()
+        return flight, True
+
+def _land_flight(key, flight, result):
+    with _flights_lock:
+        if _flights.get(key) is flight:
+            del _flights[key]
+    flight.land(result)
+
+def _acquire_shared_lock(name):
+    """
+    WEATHER_SHARED_FETCH_LOCK のとき、ワーカー間で共有するキャッシュのロックを取る
+    （取れなければ False。ワーカーが落ちても WEATHER_SINGLE_FLIGHT_TIMEOUT 秒で外れる）
+    """
+    return cache.add(f"weather:lock:{name}", os.getpid(), settings.WEATHER_SINGLE_FLIGHT_TIMEOUT)
+
+def _release_shared_lock(name):
+    cache.delete(f"weather:lock:{name}")
+
+def _wait_shared_locks(names):
+    """
+    別ワーカーが持っているロックが外れるまで待つ（最大 WEATHER_SINGLE_FLIGHT_TIMEOUT 秒）
+    """
+    deadline = time.monotonic() + settings.WEATHER_SINGLE_FLIGHT_TIMEOUT
+    keys = [f"weather:lock:{name}" for name in names]
+    while cache.get_many(keys) and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+# 再試行する上流の HTTP ステータス
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def _get_session(host):
+    """
+    上流ホストごとに使い回す Session（keep-alive の接続プールとリトライ設定付き）
+    """
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            retry = Retry(
+                total=settings.WEATHER_UPSTREAM_RETRIES,
+                backoff_factor=settings.WEATHER_UPSTREAM_BACKOFF,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=frozenset(['GET']),
+            )
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=settings.WEATHER_UPSTREAM_MAX_CONCURRENCY,
+                max_retries=retry,
+            )
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _sessions[host] = session
+        return session
+
+def _record_upstream_call(url, elapsed, error):
+    host = urlsplit(url).netloc
+    metrics.observe_stage('upstream_fetch', elapsed)
+    metrics.count_upstream(host, error, elapsed)
+    scope = _request_scope.get()
+    if scope is not None:
+        scope.record_upstream_call(url, elapsed, error)
+
+def upstream_get(url):
+    """
+    気象庁への GET（ホスト別の Session・同時接続数制限・タイムアウト・リトライ付き）
+    失敗時は requests.RequestException を送出する
+    """
+    host = urlsplit(url).netloc
+    session = _get_session(host)
+    _count_upstream_fetch()
+    started = time.perf_counter()
+    try:
+        with _host_slot(url):
+            response = session.get(
+                url,
+                timeout=(settings.WEATHER_UPSTREAM_CONNECT_TIMEOUT, settings.WEATHER_UPSTREAM_READ_TIMEOUT),
+            )
+        response.raise_for_status()
+    except requests.RequestException:
+        _record_upstream_call(url, time.perf_counter() - started, error=True)
+        raise
+    _record_upstream_call(url, time.perf_counter() - started, error=False)
+    return response
+
+def daily_page_url(year, month, day=None, station=None):
+    """
+    daily_s1.php（日ごとの値）の月ページの URL
+    """
+    station = get_station(station)
+    query = f"prec_no={station.prec_no}&block_no={station.block_no}&year={year}&month={month}"
+    if day is not None:
+        return f"{BASE_URL}?{query}&day={day}&view=p1"
+    return f"{BASE_URL}?{query}&view=p1"
+
+def _httpx():
+    """
+    httpx を読み込んで返す（非同期ビュー（WEATHER_ASYNC_VIEWS）を使わなければ不要）
+    """
+    try:
+        import httpx
+    except ImportError:
+        raise RuntimeError("非同期ビューには httpx が必要です") from None
+    return httpx
+
+# 非同期クライアントとホストごとのセマフォはイベントループに結び付くので、ループごとに作る
+_async_state = {'loop': None, 'client': None, 'slots': {}}
+
+def _get_async_state():
+    loop = asyncio.get_running_loop()
+    if _async_state['loop'] is not loop:
+        httpx = _httpx()
+        _async_state.update(
+            loop=loop,
+            client=httpx.AsyncClient(timeout=httpx.Timeout(
+                settings.WEATHER_UPSTREAM_READ_TIMEOUT,
+                connect=settings.WEATHER_UPSTREAM_CONNECT_TIMEOUT,
+            )),
+            slots={},
+        )
+    return _async_state
+
+async def async_upstream_get(url):
+    """
+    upstream_get の非同期版（httpx）
+    ホストごとの同時接続数・タイムアウト・バックオフ付きの再試行・集計は同期版と同じ
+    失敗時は httpx.HTTPError を送出する
+    """
+    httpx = _httpx()
+    host = urlsplit(url).netloc
+    state = _get_async_state()
+    slot = state['slots'].get(host)
+    if slot is None:
+        slot = state['slots'][host] = asyncio.Semaphore(settings.WEATHER_UPSTREAM_MAX_CONCURRENCY)
+    _count_upstream_fetch()
+    retries = settings.WEATHER_UPSTREAM_RETRIES
+    started = time.perf_counter()
+    try:
+        async with slot:
+            for attempt in range(retries + 1):
+                if attempt:
+                    await asyncio.sleep(settings.WEATHER_UPSTREAM_BACKOFF * 2 ** (attempt - 1))
+                try:
+                    response = await state['client'].get(url)
+                except httpx.TransportError:
+                    if attempt == retries:
+                        raise
+                    continue
+                if response.status_code in RETRY_STATUSES and attempt < retries:
+                    continue
+                response.raise_for_status()
+                break
+    except httpx.HTTPError:
+        _record_upstream_call(url, time.perf_counter() - started, error=True)
+        raise
+    _record_upstream_call(url, time.perf_counter() - started, error=False)
+    return response
+
+def fetch_weather_data(year, month, day=None, station=None):
+    station = get_station(station)
+    logger.info(f"Fetching weather data for {station.slug} {year}-{month:02d}-{day if day else 'all days'}")
+    url = daily_page_url(year, month, day, station)
+    try:
+        response = upstream_get(url)
+        return extract_data2_s_rows(response.content)
+    except requests.RequestException as e:
+        logger.error(f"Error fetching data: {e}")
+    return None
+
+# data2_s テーブルの先頭4行は見出し
+DATA2_S_HEADER_ROWS = 4
+
+@metrics.timed('parse_html')
+def extract_data2_s_rows(content, header_rows=DATA2_S_HEADER_ROWS):
+    """
+    気象庁ページの HTML（bytes）から table.data2_s のデータ行だけを取り出す
+    各行はセルの文字列のリスト、テーブルが無ければ None
+    lxml があれば lxml で、無ければ BeautifulSoup で解析する
+    """
+    if lxml_html is not None:
+        return _extract_data2_s_rows_lxml(content, header_rows)
+    return _extract_data2_s_rows_bs4(content, header_rows)
+
+# 気象庁の etrn ページは UTF-8
+_LXML_PARSER = lxml_html.HTMLParser(encoding='utf-8') if lxml_html is not None else None
+
+def _extract_data2_s_rows_lxml(content, header_rows=DATA2_S_HEADER_ROWS):
+    document = lxml_html.document_fromstring(content, parser=_LXML_PARSER)
+    table = next((el for el in document.find_class('data2_s') if el.tag == 'table'), None)
+    if table is None:
+        return None
+    rows = []
+    for row in list(table.iter('tr'))[header_rows:]:
+        cells = [cell.text_content().strip() for cell in row.iter('td')]
+        if cells:
+            rows.append(cells)
+    return rows
+
+def _extract_data2_s_rows_bs4(content, header_rows=DATA2_S_HEADER_ROWS):
+    from bs4 import BeautifulSoup, SoupStrainer
+
+    # data2_s テーブルだけを木にする
+    soup = BeautifulSoup(content, 'html.parser', parse_only=SoupStrainer('table', {'class': 'data2_s'}))
+    table = soup.find('table', {'class': 'data2_s'})
+    if not table:
+        return None
+    rows = table.find_all('tr')[header_rows:]
+    return [[col.text.strip() for col in row.find_all('td')] for row in rows if row.find_all('td')]
+
+def _is_final_period(period_end, now=None):
+    now = now or datetime.now(JST)
+    return now >= period_end + timedelta(days=settings.WEATHER_FINAL_GRACE_DAYS)
+
+def is_final_month(year, month, now=None):
+    """
+    指定年月のページを確定扱い（以後取り直さない）にしてよいか
+    日本時間で月が終わってから WEATHER_FINAL_GRACE_DAYS 日が過ぎていれば True
+    （月が変わった直後は月末の値がまだ速報値や資料不足値（"]"）のことがある）
+    """
+    next_month = datetime(year + 1, 1, 1, tzinfo=JST) if month == 12 else datetime(year, month + 1, 1, tzinfo=JST)
+    return _is_final_period(next_month, now)
+
+def fetch_months_concurrently(keys, refresh=False, upstream=None, station=None):
+    """
+    (year, month) のリストの月ページをまとめて取得し、keys と同じ順序で行のリストを返す
+    リクエスト内の表・永続キャッシュにない月だけを、ホストごとの同時接続数
+    （WEATHER_UPSTREAM_MAX_CONCURRENCY）を守りながら並行して気象庁から取得する
+    refresh=True ならキャッシュの期限に関係なく取り直す
+    upstream=False なら気象庁には取りに行かず、保存済みのデータだけを（期限切れでも）返す
+    （既定値は WEATHER_LOCAL_READS_ONLY が False なら True）
+    station は観測所（None なら WEATHER_DEFAULT_STATION）。キャッシュは観測所ごと
+    """
+    return _fetch_pages(DAILY_PAGES, get_station(station), keys, refresh, upstream)
+
+def fetch_years_concurrently(years, refresh=False, upstream=None, station=None):
+    """
+    monthly_s1.php の年ページ（1年分の月ごとの値）をまとめて取得し、years の順で行のリストを返す
+    キャッシュ（YearlyPageCache）と引数の扱いは月ページと同じ
+    """
+    return _fetch_pages(MONTHLY_PAGES, get_station(station), [(year,) for year in years], refresh, upstream)
+
+class _PageKind:
+    """
+    キャッシュするページの種類ごとの設定（名前・キャッシュのモデル・キーの項目・取得関数など）
+    fetch と url は (*key, station=...) で呼ぶ
+    """
+    def __init__(self, name, model, key_fields, fetch, url, header_rows, is_final, scope_table):
+        self.name = name
+        self.model = model
+        self.key_fields = key_fields
+        self.fetch = fetch
+        self.url = url
+        self.header_rows = header_rows
+        self.is_final = is_final
+        self.scope_table = scope_table
+
+    def lookup(self, station, key):
+        return {'prec_no': station.prec_no, 'block_no': station.block_no, **dict(zip(self.key_fields, key))}
+
+    def key_of(self, entry):
+        return tuple(getattr(entry, field) for field in self.key_fields)
+
+def _fetch_pages(kind, station, keys, refresh=False, upstream=None):
+    keys = list(keys)
+    results, entries, missing = _resolve_cached_pages(kind, station, keys, refresh, upstream)
+    leading, waiting = _claim_pages(kind, station, missing, entries, results)
+    try:
+        _save_downloaded_pages(
+            kind, station, list(leading), _download_pages(kind, station, list(leading)), entries, results,
+        )
+    finally:
+        _land_pages(kind, station, leading, results)
+    _await_pages(kind, station, waiting, entries, results)
+    _remember_in_scope(kind, station, results)
+    return [results[key] for key in keys]
+
+def _iter_pages(kind, station, keys, refresh=False, upstream=None):
+    """
+    _fetch_pages と同じだが、keys の順に (key, rows) をページが揃いしだい返す
+    キャッシュにあるページはすぐに返し、無いページは裏で並行して取得する
+    """
+    keys = list(dict.fromkeys(keys))
+    results, entries, missing = _resolve_cached_pages(kind, station, keys, refresh, upstream)
+    leading, waiting = _claim_pages(kind, station, missing, entries, results)
+    workers = max(1, min(len(leading), settings.WEATHER_UPSTREAM_MAX_CONCURRENCY))
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                key: executor.submit(copy_context().run, partial(kind.fetch, *key, station=station))
+                for key in leading
+            }
+            for key in keys:
+                if key in futures:
+                    _save_downloaded_pages(kind, station, [key], [futures[key].result()], entries, results)
+                    _land_pages(kind, station, {key: leading.pop(key)}, results)
+                    _remember_in_scope(kind, station, {key: results[key]})
+                elif key in waiting:
+                    _await_pages(kind, station, {key: waiting[key]}, entries, results)
+                    _remember_in_scope(kind, station, {key: results[key]})
+                yield key, results[key]
+    finally:
+        # 途中で打ち切られても、待っている他のリクエストを解放する
+        _land_pages(kind, station, leading, results)
+
+def _resolve_cached_pages(kind, station, keys, refresh=False, upstream=None):
+    """
+    リクエスト内の表と永続キャッシュから引けるページを引く
+    Returns: (results, entries, missing)
+    results は引けたページの行、entries はキャッシュの行、missing は気象庁から取るべきキー
+    """
+    if upstream is None:
+        upstream = not settings.WEATHER_LOCAL_READS_ONLY
+    results = {}
+    scope = _request_scope.get()
+    scope_table = getattr(scope, kind.scope_table) if scope is not None else {}
+    if not refresh:
+        results.update({
+            key: scope_table[(station.slug, *key)] for key in keys if (station.slug, *key) in scope_table
+        })
+        metrics.count_cache(kind.name, 'request', len(results))
+
+    pending = list(dict.fromkeys(key for key in keys if key not in results))
+    if not pending:
+        return results, {}, []
+
+    entries = _load_cache_entries(kind, station, pending)
+    ttl = timedelta(seconds=settings.WEATHER_CURRENT_MONTH_CACHE_TTL)
+    now = timezone.now()
+    hit_pks = []
+    stale = 0
+    for key in pending:
+        entry = entries.get(key)
+        if entry is None or refresh:
+            continue
+        if entry.is_final or now - entry.fetched_at < ttl:
+            results[key] = entry.rows
+            hit_pks.append(entry.pk)
+        elif not upstream:
+            results[key] = entry.rows
+            hit_pks.append(entry.pk)
+            stale += 1
+    metrics.count_cache(kind.name, 'hit', len(hit_pks) - stale)
+    metrics.count_cache(kind.name, 'stale', stale)
+    _count_page_hits(kind.model, hit_pks)
+
+    missing = [key for key in pending if key not in results]
+    metrics.count_cache(kind.name, 'miss', len(missing))
+    if not upstream:
+        # 保存済みのデータだけを読む設定では、無い月は取得できなかった扱い
+        results.update({key: None for key in missing})
+        missing = []
+    return results, entries, missing
+
+# ページキャッシュの hit_count は参照のたびに UPDATE せず（SQLite では読み込みが書き込みロックを取ることになる）、
+# プロセス内で数えて WEATHER_HIT_COUNT_FLUSH_INTERVAL 秒ごとにまとめて書き込む
+_pending_hits = {}
+_pending_hits_lock = threading.Lock()
+_hits_flushed_at = time.monotonic()
+
+def _count_page_hits(model, pks):
+    global _pending_hits, _hits_flushed_at
+    with _pending_hits_lock:
+        for pk in pks:
+            _pending_hits[(model, pk)] = _pending_hits.get((model, pk), 0) + 1
+        if not _pending_hits or time.monotonic() - _hits_flushed_at < settings.WEATHER_HIT_COUNT_FLUSH_INTERVAL:
+            return
+        pending, _pending_hits = _pending_hits, {}
+        _hits_flushed_at = time.monotonic()
+    _write_page_hits(pending)
+
+def _write_page_hits(pending):
+    # 増やす数が同じ行は1回の UPDATE にまとめる
+    by_amount = {}
+    for (model, pk), amount in pending.items():
+        by_amount.setdefault((model, amount), []).append(pk)
+    try:
+        for (model, amount), pks in by_amount.items():
+            model.objects.filter(pk__in=pks).update(hit_count=F('hit_count') + amount)
+    except DatabaseError as e:
+        # ヒット数は目安なので、書き込めなければ捨てる（リクエストは失敗させない）
+        logger.warning(f"Failed to write page cache hit counts: {e}")
+
+def _save_downloaded_pages(kind, station, keys, rows_list, entries, results):
+    """
+    気象庁から取得したページをキャッシュに保存して results に入れる
+    """
+    for key, rows in zip(keys, rows_list):
+        entry = entries.get(key)
+        if rows is None:
+            # 取得失敗時は期限切れでも手元のキャッシュを返す
+            results[key] = entry.rows if entry is not None else None
+        else:
+            _store_page_rows(kind, station, key, rows, entry)
+            results[key] = rows
+
+def _remember_in_scope(kind, station, results):
+    scope = _request_scope.get()
+    if scope is not None:
+        getattr(scope, kind.scope_table).update({
+            (station.slug, *key): rows for key, rows in results.items() if rows is not None
+        })
+        for key, rows in results.items():
+            if rows is None:
+                scope.record_unavailable(kind.name, station.slug, *key)
+            else:
+                scope.record_available(kind.name, station.slug, *key)
+
+def _page_flight_key(kind, station, key):
+    return (kind.scope_table, station.slug, *key)
+
+def _page_lock_name(kind, station, key):
+    return f"{kind.scope_table}:{station.slug}:{'-'.join(str(part) for part in key)}"
+
+def _claim_pages(kind, station, keys, entries, results):
+    """
+    single-flight: 気象庁から取るべきページを、自分で取得するものと他の取得を待つものに分ける
+    Returns: (leading, waiting)
+    leading は {key: (Flight, 共有ロックを取ったか)}。取得・保存したら _land_pages に渡す
+    waiting は {key: Flight}。同じプロセスの別スレッドが取得中なので _await_pages で結果を受け取る
+    WEATHER_SHARED_FETCH_LOCK なら別ワーカーが取得中のページも、その保存を待って DB から results に入れる
+    """
+    leading, waiting = {}, {}
+    for key in keys:
+        flight, leader = _join_flight(_page_flight_key(kind, station, key))
+        if leader:
+            leading[key] = (flight, False)
+        else:
+            waiting[key] = flight
+    if not settings.WEATHER_SHARED_FETCH_LOCK or not leading:
+        return leading, waiting
+
+    busy = []
+    for key, (flight, _) in leading.items():
+        if _acquire_shared_lock(_page_lock_name(kind, station, key)):
+            leading[key] = (flight, True)
+        else:
+            busy.append(key)
+    if busy:
+        _wait_shared_locks([_page_lock_name(kind, station, key) for key in busy])
+        stored = _load_cache_entries(kind, station, busy)
+        for key in busy:
+            entry, previous = stored.get(key), entries.get(key)
+            # 別ワーカーが保存していればそれを使う（失敗していれば自分で取る）
+            if entry is not None and (previous is None or entry.fetched_at > previous.fetched_at):
+                results[key] = entry.rows
+                flight, _ = leading.pop(key)
+                _land_flight(_page_flight_key(kind, station, key), flight, entry.rows)
+    return leading, waiting
+
+def _land_pages(kind, station, leading, results):
+    """
+    取得・保存が終わったページを待っている側に渡し、共有ロックを外す
+    """
+    for key, (flight, locked) in leading.items():
+        if locked:
+            _release_shared_lock(_page_lock_name(kind, station, key))
+        _land_flight(_page_flight_key(kind, station, key), flight, results.get(key))
+
+def _await_pages(kind, station, waiting, entries, results):
+    """
+    別スレッドが取得中のページを待って results に入れる（失敗したら期限切れでも手元のキャッシュ）
+    待つのは全部で WEATHER_SINGLE_FLIGHT_TIMEOUT 秒まで。それまでに終わらなかったページは自分で取得する
+    """
+    deadline = time.monotonic() + settings.WEATHER_SINGLE_FLIGHT_TIMEOUT
+    landed = {key: flight.wait(max(0.0, deadline - time.monotonic())) for key, flight in waiting.items()}
+    _take_landed_pages(waiting, landed, entries, results)
+    late = [key for key, done in landed.items() if not done]
+    if late:
+        logger.warning(f"Timed out waiting for {len(late)} {kind.name} fetches; fetching them directly")
+        _save_downloaded_pages(kind, station, late, _download_pages(kind, station, late), entries, results)
+
+def _take_landed_pages(waiting, landed, entries, results):
+    for key, flight in waiting.items():
+        if not landed[key]:
+            continue
+        rows = flight.result
+        if rows is None and entries.get(key) is not None:
+            rows = entries[key].rows
+        results[key] = rows
+
+async def prefetch_async(months=(), years=(), forecast=False, station=None):
+    """
+    非同期ビュー用: 観測所の月ページ・年ページ・予報（forecast=True のとき）をまとめて先読みする
+    キャッシュに無いものだけを httpx で並行して取得して保存し、リクエスト内の表に入れる
+    （この後に同期の処理が読むときは気象庁への通信が発生しない）
+    """
+    station = get_station(station)
+    await asyncio.gather(
+        _prefetch_pages_async(DAILY_PAGES, station, list(months)),
+        _prefetch_pages_async(MONTHLY_PAGES, station, [(year,) for year in years]),
+        *([_prefetch_forecast_async(station.forecast_url)] if forecast else []),
+    )
+
+async def _prefetch_pages_async(kind, station, keys):
+    """
+    Returns: {key: 行のリスト（取得できなければ None）}
+    """
+    if not keys:
+        return {}
+    results, entries, missing = await sync_to_async(_resolve_cached_pages)(kind, station, keys)
+    leading, waiting = await _claim_pages_async(kind, station, missing, entries, results)
+    try:
+        rows_list = await asyncio.gather(*(_download_page_async(kind, station, key) for key in leading))
+        await sync_to_async(_save_downloaded_pages)(kind, station, list(leading), rows_list, entries, results)
+    finally:
+        await sync_to_async(_land_pages)(kind, station, leading, results)
+    if waiting:
+        await _await_pages_async(kind, station, waiting, entries, results)
+    _remember_in_scope(kind, station, results)
+    return results
+
+async def _claim_pages_async(kind, station, keys, entries, results):
+    """
+    _claim_pages の非同期版
+    _claim_pages はスレッドで最後まで行われるので、待っている間に取り消されたら（ストリーミングの
+    クライアントが切断したときなど）登録した Flight はそのスレッドかここで _land_pages に渡す
+    （渡さないと、同じページを取る他のリクエストが WEATHER_SINGLE_FLIGHT_TIMEOUT 秒ずつ待たされる）
+    """
+    lock = threading.Lock()
+    claimed = None
+    abandoned = False
+
+    def claim():
+        nonlocal claimed
+        result = _claim_pages(kind, station, keys, entries, results)
+        with lock:
+            claimed = result
+            land = abandoned
+        if land:
+            _land_pages(kind, station, result[0], results)
+        return result
+
+    try:
+        return await sync_to_async(claim)()
+    except asyncio.CancelledError:
+        with lock:
+            abandoned = True
+            land = claimed
+        if land is not None:
+            await sync_to_async(_land_pages)(kind, station, land[0], results)
+        raise
+
+async def _await_pages_async(kind, station, waiting, entries, results):
+    """
+    _await_pages の非同期版（待つ間はスレッドを使わないので、取得中の側の解析を妨げない）
+    """
+    done = await asyncio.gather(*(flight.wait_async() for flight in waiting.values()))
+    landed = dict(zip(waiting, done))
+    _take_landed_pages(waiting, landed, entries, results)
+    late = [key for key, done in landed.items() if not done]
+    if late:
+        logger.warning(f"Timed out waiting for {len(late)} {kind.name} fetches; fetching them directly")
+        rows_list = await asyncio.gather(*(_download_page_async(kind, station, key) for key in late))
+        await sync_to_async(_save_downloaded_pages)(kind, station, late, rows_list, entries, results)
+
+async def _download_page_async(kind, station, key):
+    url = kind.url(*key, station=station)
+    try:
+        response = await async_upstream_get(url)
+    except _httpx().HTTPError as e:
+        logger.error(f"Error fetching data: {e}")
+        return None
+    # HTML の解析は CPU を使うのでイベントループの外で行う
+    return await asyncio.to_thread(extract_data2_s_rows, response.content, kind.header_rows)
+
+def _load_cache_entries(kind, station, keys):
+    years = {key[0] for key in keys}
+    queryset = kind.model.objects.filter(prec_no=station.prec_no, block_no=station.block_no, year__in=years)
+    wanted = set(keys)
+    return {kind.key_of(e): e for e in queryset if kind.key_of(e) in wanted}
+
+def _download_pages(kind, station, keys):
+    """
+    ページを並行して取得（結果は keys の順）
+    スレッドでは通信と HTML の解析だけを行い、DB への保存は呼び出し元のスレッドで行う
+    """
+    if len(keys) <= 1:
+        return [kind.fetch(*key, station=station) for key in keys]
+    workers = min(len(keys), settings.WEATHER_UPSTREAM_MAX_CONCURRENCY)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # request_scope の取得回数を数えられるよう、コンテキストを引き継ぐ
+        futures = [
+            executor.submit(copy_context().run, partial(kind.fetch, *key, station=station))
+            for key in keys
+        ]
+        return [future.result() for future in futures]
+
+def _store_page_rows(kind, station, key, rows, entry):
+    lookup = kind.lookup(station, key)
+    # 取得時点で期間が終わって猶予（WEATHER_FINAL_GRACE_DAYS）も過ぎていれば確定扱い
+    # （それより前に取った分は TTL で取り直す）
+    fields = {'rows': rows, 'is_final': kind.is_final(*key), 'fetched_at': timezone.now()}
+    # 日ごとの値が変わったら、それを使って組み立てた /weather-data/ の応答は使えない
+    if kind is DAILY_PAGES and (entry is None or entry.rows != rows):
+        invalidate_weather_data_response(station)
+    if entry is not None:
+        kind.model.objects.filter(pk=entry.pk).update(miss_count=F('miss_count') + 1, **fields)
+        return
+    try:
+        kind.model.objects.create(miss_count=1, **lookup, **fields)
+    except IntegrityError:
+        # 同時に別リクエストが保存した場合
+        kind.model.objects.filter(**lookup).update(miss_count=F('miss_count') + 1, **fields)
+
+def _pages_fresh_until(kind, station, keys):
+    """
+    keys のページのうち未確定（今月など）のものが TTL で取り直される最初の時刻（time.time() の値）
+    """
+    ttl = settings.WEATHER_CURRENT_MONTH_CACHE_TTL
+    if settings.WEATHER_LOCAL_READS_ONLY:
+        # リクエストでは取り直さない（sync_weather が保存する）ので、TTL ごとに読み直す
+        return time.time() + ttl
+    wanted = set(keys)
+    queryset = kind.model.objects.filter(
+        prec_no=station.prec_no, block_no=station.block_no, is_final=False, year__in={key[0] for key in keys},
+    ).values_list(*kind.key_fields, 'fetched_at')
+    return min(
+        (row[-1].timestamp() + ttl for row in queryset if tuple(row[:-1]) in wanted),
+        default=time.time() + ttl,
+    )
+
+def yearly_page_url(year, station=None):
+    """
+    monthly_s1.php（月ごとの値）の年ページの URL
+    """
+    station = get_station(station)
+    return f"{MONTHLY_BASE_URL}?prec_no={station.prec_no}&block_no={station.block_no}&year={year}&month=&day=&view=p1"
+
+# monthly_s1 は見出し行の数がページによって違うので、td を含む行をすべて取る
+YEARLY_PAGE_HEADER_ROWS = 0
+
+def fetch_yearly_weather_data(year, station=None):
+    """
+    monthly_s1.php から1年分の月ごとの値（data2_s の行）を取得
+    """
+    url = yearly_page_url(year, station)
+    try:
+        response = upstream_get(url)
+        return extract_data2_s_rows(response.content, header_rows=YEARLY_PAGE_HEADER_ROWS)
+    except requests.RequestException as e:
+        logger.error(f"Error fetching data: {e}")
+    return None
+
+def is_final_year(year, now=None):
+    """
+    指定年のページを確定扱いにしてよいか（年が終わってから WEATHER_FINAL_GRACE_DAYS 日が過ぎたか）
+    """
+    return _is_final_period(datetime(year + 1, 1, 1, tzinfo=JST), now)
+
+DAILY_PAGES = _PageKind(
+    'daily_page', MonthlyPageCache, ('year', 'month'), fetch_weather_data, daily_page_url,
+    DATA2_S_HEADER_ROWS, is_final_month, 'month_rows',
+)
+MONTHLY_PAGES = _PageKind(
+    'monthly_page', YearlyPageCache, ('year',), fetch_yearly_weather_data, yearly_page_url,
+    YEARLY_PAGE_HEADER_ROWS, is_final_year, 'year_rows',
+)
+
+# 値の後ろに付く品質記号
+# ")" 準正常値（統計に使ってよい）、"]" 資料不足値、"#" 疑問値
+_VALUE_PATTERN = re.compile(r'^(-?\d+(?:\.\d+)?)\s*([)\]#]?)$')
+USABLE_QUALITY_MARKS = ('', ')')
+
+def parse_jma_value(text):
+    """
+    気象庁の値の文字列を (float, 品質記号) に変換
+    "--"（該当現象なし）、"×"（欠測）、"///"（統計なし）、空欄、資料不足値・疑問値は NaN
+    """
+    match = _VALUE_PATTERN.match(text.strip()) if text else None
+    if not match:
+        return math.nan, ''
+    value, mark = match.groups()
+    if mark not in USABLE_QUALITY_MARKS:
+        return math.nan, mark
+    return float(value), mark
+
+class DailyObservation:
+    """
+    1日分の観測値
+    temp は数値（使えない値は NaN）、temp_text は表示用に元の文字列を残す
+    """
+    __slots__ = ('date', 'temp', 'temp_text', 'weather', 'quality')
+
+    def __init__(self, date, temp, temp_text, weather, quality=''):
+        self.date = date
+        self.temp = temp
+        self.temp_text = temp_text
+        self.weather = weather
+        self.quality = quality
+
+    def as_tuple(self):
+        """
+        従来の (日付文字列, 気温文字列, 天気) 形式
+        """
+        return (self.date.isoformat(), self.temp_text, self.weather)
+
+    def __repr__(self):
+        return f"DailyObservation({self.date.isoformat()}, {self.temp}, {self.weather!r})"
+
+def parse_daily_observations(data, year, month):
+    """
+    data2_s の行を DailyObservation のリストに変換（解析は月ごとに1回だけ行う）
+    """
+    observations = []
+    for row in data:
+        if len(row) <= max(TEMPERATURE_INDEX, WEATHER_INDEX) or not row[0].isdigit():
+            continue
+        temp, quality = parse_jma_value(row[TEMPERATURE_INDEX])
+        observations.append(DailyObservation(
+            date(year, month, int(row[0])),
+            temp,
+            row[TEMPERATURE_INDEX],
+            row[WEATHER_INDEX],
+            quality,
+        ))
+    return observations
+
+def parse_weather_data(data, year, month):
+    return [observation.as_tuple() for observation in parse_daily_observations(data, year, month)]
+
+def get_monthly_observations(year, month, station=None):
+    """
+    指定年月の DailyObservation のリスト（取得できなければ None）
+    request_scope() の中では解析結果をリクエスト内で使い回す
+    """
+    return get_observations_batch([(year, month)], station)[0]
+
+def get_observations_batch(keys, station=None):
+    """
+    (year, month) のリストに対応する DailyObservation のリストを keys の順で返す
+    未取得の月ページは fetch_months_concurrently でまとめて取得する
+    """
+    station = get_station(station)
+    keys = [(station.slug, year, month) for year, month in keys]
+    scope = _request_scope.get()
+    parsed = scope.parsed_months if scope is not None else {}
+    missing = [key for key in dict.fromkeys(keys) if key not in parsed]
+    results = {}
+    rows_list = fetch_months_concurrently([key[1:] for key in missing], station=station)
+    for key, data in zip(missing, rows_list):
+        results[key] = parse_daily_observations(data, *key[1:]) if data else None
+        if scope is not None and results[key] is not None:
+            parsed[key] = results[key]
+    return [parsed[key] if key in parsed else results[key] for key in keys]
+
+def _month_keys_between(start, end):
+    """
+    start〜end の日付にかかる (year, month) を古い順に返す
+    """
+    keys = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        keys.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return keys
+
+def get_daily_weather_range(start, end, station=None):
+    """
+    start〜end（両端を含む）の日ごとの観測値を日付順に返す
+    期間にかかる月ページは1回ずつまとめて取得し、各日は日付で引く
+    Returns: [(date, DailyObservation または None), ...]
+    """
+    start, end = _as_date(start), _as_date(end)
+    by_date = {}
+    for observations in get_observations_batch(_month_keys_between(start, end), station):
+        for observation in observations or ():
+            by_date[observation.date] = observation
+    return [(day, by_date.get(day)) for day in _dates_between(start, end)]
+
+def iter_daily_weather_range(start, end, station=None):
+    """
+    get_daily_weather_range と同じ値を月ごとのリストに分けて返すジェネレーター（ストリーミング用）
+    月ページは並行して取得し、古い月から揃ったものを順に返す
+    """
+    start, end = _as_date(start), _as_date(end)
+    pages = _iter_pages(DAILY_PAGES, get_station(station), _month_keys_between(start, end))
+    for (year, month), rows in pages:
+        yield _month_days(start, end, year, month, rows)
+
+async def aiter_daily_weather_range(start, end, station=None):
+    """
+    iter_daily_weather_range の非同期版（非同期ビューのストリーミング用）
+    月ページは httpx で並行して先読みし、古い月から揃ったものを順に返す
+    （全部の月が揃うのを待たずに最初の月を返せる）
+    """
+    station = get_station(station)
+    start, end = _as_date(start), _as_date(end)
+    keys = _month_keys_between(start, end)
+    tasks = [asyncio.ensure_future(_prefetch_pages_async(DAILY_PAGES, station, [key])) for key in keys]
+    try:
+        for (year, month), task in zip(keys, tasks):
+            rows = (await task)[(year, month)]
+            yield _month_days(start, end, year, month, rows)
+    finally:
+        # 途中で打ち切られたら残りの取得もやめる（待っている他のリクエストには _land_pages で渡る）
+        for task in tasks:
+            task.cancel()
+
+def _month_days(start, end, year, month, rows):
+    """
+    月ページの行から start〜end のうちその月の [(日付, DailyObservation または None)] を作る
+    """
+    by_date = {o.date: o for o in parse_daily_observations(rows, year, month)} if rows else {}
+    next_month = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    first = max(start, date(year, month, 1))
+    last = min(end, next_month - timedelta(days=1))
+    return [(day, by_date.get(day)) for day in _dates_between(first, last)]
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+def _dates_between(start, end):
+    return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+def get_monthly_weather_data(year, month, day=None, station=None):
+    observations = get_monthly_observations(year, month, station)
+    if not observations:
+        return None
+    return [observation.as_tuple() for observation in observations]
+
+@metrics.timed('aggregate')
+def _daily_temperature_matrix(observation_lists):
+    """
+    月ごとの観測値を (月数, 31) の配列に並べる（日付のない欄・使えない値は NaN）
+    """
+    daily = np.full((len(observation_lists), 31), np.nan)
+    for i, observations in enumerate(observation_lists):
+        for o in observations or ():
+            daily[i, o.date.day - 1] = o.temp
+    return daily
+
+@metrics.timed('aggregate')
+def _summarize_daily_matrix(daily):
+    """
+    (月数, 31) の日別気温から月ごとの平均・最高・最低・日数を1回で計算
+    有効な値が1つもない月はすべて NaN（日数は 0）
+    """
+    valid = ~np.isnan(daily)
+    count = valid.sum(axis=1)
+    total = np.where(valid, daily, 0.0).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, total / count, np.nan)
+    return {
+        'mean': mean,
+        'max': np.fmax.reduce(daily, axis=1),
+        'min': np.fmin.reduce(daily, axis=1),
+        'count': count,
+    }
+
+def monthly_temperature_stats(observations):
+    """
+    1ヶ月分の観測値から平均・最高・最低・日数を計算（値がなければ None）
+    """
+    stats = _summarize_daily_matrix(_daily_temperature_matrix([observations]))
+    return {name: nan_to_none(values[0]) for name, values in stats.items()}
+
+def aggregate_monthly_temperatures(years, months=range(1, 13), station=None):
+    """
+    years × months の全月をまとめて取得・集計し、(年数, 月数) の行列で返す
+    Returns: dict with years, months and mean / max / min / count matrices
+    """
+    years = list(years)
+    months = list(months)
+    keys = [(year, month) for year in years for month in months]
+    stats = _summarize_daily_matrix(_daily_temperature_matrix(get_observations_batch(keys, station)))
+    shape = (len(years), len(months))
+    result = {name: values.reshape(shape) for name, values in stats.items()}
+    result.update(years=years, months=months)
+    return result
+
+def monthly_mean_matrix(years, backend=None, station=None):
+    """
+    years × 12ヶ月の月平均気温（日最高気温の月平均）を (年数, 12) の行列で返す
+    backend が 'monthly'（既定値は WEATHER_MONTHLY_MEAN_BACKEND）なら monthly_s1.php の
+    年ページ（1年1ページ）から読み、年ページにまだ値がない月（今月など）だけ日ごとの
+    ページから集計する。'daily' なら全月を日ごとのページから集計する
+    """
+    years = list(years)
+    backend = backend or settings.WEATHER_MONTHLY_MEAN_BACKEND
+    if backend == 'daily':
+        return aggregate_monthly_temperatures(years, station=station)['mean']
+
+    matrix = np.full((len(years), 12), np.nan)
+    pages = fetch_years_concurrently(years, station=station)
+    with metrics.stage('aggregate'):
+        for i, rows in enumerate(pages):
+            for row in rows or ():
+                if len(row) > MONTHLY_TEMPERATURE_INDEX and row[0].isdigit() and 1 <= int(row[0]) <= 12:
+                    matrix[i, int(row[0]) - 1] = parse_jma_value(row[MONTHLY_TEMPERATURE_INDEX])[0]
+
+    # 年ページに値がない月（資料不足値を含む）のうち、既に始まっている月だけ日ごとのページで補う
+    now = datetime.now(JST)
+    gaps = [
+        (i, month)
+        for i, year in enumerate(years)
+        for month in range(1, 13)
+        if np.isnan(matrix[i, month - 1]) and (year, month) <= (now.year, now.month)
+    ]
+    if gaps:
+        observation_lists = get_observations_batch([(years[i], month) for i, month in gaps], station)
+        means = _summarize_daily_matrix(_daily_temperature_matrix(observation_lists))['mean']
+        for (i, month), value in zip(gaps, means):
+            matrix[i, month - 1] = value
+    return matrix
+
+def nan_to_none(value):
+    """
+    NaN を None（JSON の null）に、numpy の数値を Python の数値に変換
+    """
+    value = value.item() if isinstance(value, np.generic) else value
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+def matrix_to_lists(matrix):
+    """
+    集計行列を None 入りの Python のリストに変換
+    """
+    return [[nan_to_none(value) for value in row] for row in matrix]
+
+def get_similar_weather_data(year, month, weather, station=None):
+    observations = get_monthly_observations(year, month, station)
+    if not observations:
+        return None
+    return next((o.as_tuple() for o in observations if o.weather == weather), None)
+
+def get_highest_temperature(year, month, station=None):
+    observations = get_monthly_observations(year, month, station)
+    if not observations:
+        return None
+    return monthly_temperature_stats(observations)['max']
+
+class _IndexedSeries:
+    """
+    予報 JSON の timeSeries 1つ分（日付 → インデックスの表と、地域コード → 地域の表）
+    """
+    __slots__ = ('times', 'indexes_by_date', 'areas')
+
+    def __init__(self, series):
+        # 時刻は日本時間のまま（タイムゾーンを外して）扱う
+        self.times = [datetime.fromisoformat(t).replace(tzinfo=None) for t in series["timeDefines"]]
+        self.indexes_by_date = {}
+        for i, t in enumerate(self.times):
+            self.indexes_by_date.setdefault(t.date(), []).append(i)
+        self.areas = {area["area"]["code"]: area for area in series["areas"]}
+
+class ForecastIndex:
+    """
+    予報 JSON（forecast/<office>.json）を1回だけ走査して作る索引
+    短期予報・週間予報の全 timeSeries について、任意の日付・地域コードの値を引ける
+    """
+    @metrics.timed('parse_json')
+    def __init__(self, document):
+        self.report_datetime = document[0].get("reportDatetime") if document else None
+        # 短期予報（document[0]）→ 週間予報（document[1]）の順
+        self.series = [_IndexedSeries(series) for report in document for series in report["timeSeries"]]
+
+    def days(self):
+        """
+        予報に含まれる日付の一覧
+        """
+        return sorted({day for series in self.series for day in series.indexes_by_date})
+
+    def entries(self, area_code, field, day):
+        """
+        指定地域・日付の field の値を (時刻, 値) のリストで返す
+        field を持つ timeSeries のうち、その日を含む最初のもの（短期予報が優先）から取る
+        空欄の値は除く
+        """
+        for series in self.series:
+            area = series.areas.get(area_code)
+            if area is None or field not in area or day not in series.indexes_by_date:
+                continue
+            values = area[field]
+            found = [
+                (series.times[i], values[i])
+                for i in series.indexes_by_date[day]
+                if i < len(values) and values[i] != ""
+            ]
+            if found:
+                return found
+        return []
+
+    def value(self, area_code, field, day):
+        """
+        指定地域・日付の field の最初の値（無ければ None）
+        """
+        found = self.entries(area_code, field, day)
+        return found[0][1] if found else None
+
+    def temperatures(self, area_code, day):
+        """
+        指定地域・日付の (最低気温, 最高気温)
+        短期予報の temps は 0時が朝の最低・9時が日中の最高、無ければ週間予報の値を使う
+        """
+        low = high = None
+        for t, value in self.entries(area_code, "temps", day):
+            if t.hour < 9:
+                low = value
+            else:
+                high = value
+        if low is None:
+            low = self.value(area_code, "tempsMin", day)
+        if high is None:
+            high = self.value(area_code, "tempsMax", day)
+        return low, high
+
+    def day_forecast(self, day, area_code, temp_area_code):
+        """
+        1日分の予報（天気・天気コード・最高/最低気温・降水確率）
+        """
+        low, high = self.temperatures(temp_area_code, day)
+        pop = self.value(area_code, "pops", day)
+        return {
+            "date": day.isoformat(),
+            "weather": self.value(area_code, "weathers", day),
+            "weather_code": self.value(area_code, "weatherCodes", day),
+            "high": high,
+            "low": low,
+            "rain": f"{pop}%" if pop is not None else None,
+        }
+
+_forecast_cache = {}
+_forecast_lock = threading.Lock()
+_forecast_refreshing = set()
+# 予報の取得に最後に失敗した時刻（WEATHER_FORECAST_FAILURE_BACKOFF 秒の間は取り直さない）
+_forecast_failures = {}
+
+def get_forecast_index(url):
+    """
+    予報 JSON の ForecastIndex を stale-while-revalidate で返す（予報1件につき索引の作成は1回だけ）
+    WEATHER_FORECAST_TTL 秒以内に取得したものはそのまま返し、それより古ければ手元の分を
+    すぐ返して裏で取り直す。手元に無いときだけその場で取得する
+    取得に失敗しても、古い予報があればそれを返し続ける（何も無ければ None）
+    失敗してから WEATHER_FORECAST_FAILURE_BACKOFF 秒の間と、同じリクエストで既に取得できなかった予報は
+    取り直さない（障害中に1リクエストで何度も気象庁に問い合わせて待たされないように）
+    WEATHER_FORECAST_SHARED_CACHE が True なら Django のキャッシュでワーカー間でも共有する
+    """
+    entry = _get_forecast_entry(url)
+    if entry is None:
+        _record_unavailable('forecast', url)
+        return None
+    return entry[2]
+
+def _get_forecast_entry(url):
+    entry = _forecast_cache.get(url)
+    if entry is None and settings.WEATHER_FORECAST_SHARED_CACHE:
+        shared = cache.get(f"weather:forecast:{url}")
+        if shared is not None:
+            fetched_at, document = shared
+            entry = _forecast_cache[url] = (fetched_at, document, ForecastIndex(document))
+            metrics.count_cache('forecast', 'shared')
+
+    if entry is None:
+        if _forecast_backing_off(url):
+            metrics.count_cache('forecast', 'backoff')
+            return None
+        metrics.count_cache('forecast', 'miss')
+        return _refresh_forecast_entry(url)
+
+    if time.time() - entry[0] >= settings.WEATHER_FORECAST_TTL:
+        metrics.count_cache('forecast', 'stale')
+        if not _forecast_backing_off(url):
+            _refresh_forecast_in_background(url)
+    else:
+        metrics.count_cache('forecast', 'hit')
+    return entry
+
+def _forecast_backing_off(url):
+    """
+    予報を取り直さずにおくか（直前に失敗した、または今のリクエストで既に取得できなかった）
+    """
+    scope = _request_scope.get()
+    if scope is not None and ('forecast', url) in scope.unavailable:
+        return True
+    failed_at = _forecast_failures.get(url)
+    return failed_at is not None and time.time() - failed_at < settings.WEATHER_FORECAST_FAILURE_BACKOFF
+
+def _refresh_forecast_entry(url):
+    """
+    予報を取り直す（single-flight: 同じ URL を別スレッドが取得中なら、その結果を待って使う）
+    """
+    flight_key = ('forecast', url)
+    flight, leader = _join_flight(flight_key)
+    if not leader:
+        if flight.wait():
+            return flight.result or _forecast_cache.get(url)
+        # 待ちきれなければ自分で取得する
+        return _download_forecast_entry(url)
+    entry = None
+    try:
+        entry = _download_forecast_entry(url)
+    finally:
+        _land_flight(flight_key, flight, entry)
+    return entry
+
+def _download_forecast_entry(url):
+    lock = f"forecast:{url}"
+    locked = False
+    if settings.WEATHER_SHARED_FETCH_LOCK and settings.WEATHER_FORECAST_SHARED_CACHE:
+        locked = _acquire_shared_lock(lock)
+        if not locked:
+            # 別ワーカーが取得中なら、共有キャッシュに入るのを待って使う（失敗していれば自分で取る）
+            _wait_shared_locks([lock])
+            shared, current = cache.get(f"weather:forecast:{url}"), _forecast_cache.get(url)
+            if shared is not None and (current is None or shared[0] > current[0]):
+                fetched_at, document = shared
+                entry = _forecast_cache[url] = (fetched_at, document, ForecastIndex(document))
+                return entry
+    try:
+        response = upstream_get(url)
+        with metrics.stage('parse_json'):
+            document = response.json()
+        return _store_forecast_document(url, document)
+    except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+        logger.error(f"予報の取得に失敗: {e}")
+        _forecast_failures[url] = time.time()
+        return _forecast_cache.get(url)
+    finally:
+        if locked:
+            _release_shared_lock(lock)
+
+def _store_forecast_document(url, document):
+    index = ForecastIndex(document)
+    fetched_at = time.time()
+    entry = _forecast_cache[url] = (fetched_at, document, index)
+    _forecast_failures.pop(url, None)
+    if settings.WEATHER_FORECAST_SHARED_CACHE:
+        cache.set(f"weather:forecast:{url}", (fetched_at, document), None)
+    return entry
+
+async def _prefetch_forecast_async(url):
+    """
+    手元に予報が無いときだけ非同期で取得する（古い予報の取り直しは同期版と同じく裏で行う）
+    """
+    if url in _forecast_cache:
+        return
+    if settings.WEATHER_FORECAST_SHARED_CACHE and await cache.aget(f"weather:forecast:{url}") is not None:
+        return
+    if _forecast_backing_off(url):
+        return
+    flight_key = ('forecast', url)
+    flight, leader = _join_flight(flight_key)
+    if not leader and await flight.wait_async():
+        return
+    # 待ちきれなかったときは自分で取得する（他の取得の Flight には触らない）
+    entry = None
+    try:
+        response = await async_upstream_get(url)
+        with metrics.stage('parse_json'):
+            document = response.json()
+        entry = _store_forecast_document(url, document)
+    except (_httpx().HTTPError, ValueError, KeyError, TypeError) as e:
+        logger.error(f"予報の取得に失敗: {e}")
+        _forecast_failures[url] = time.time()
+    finally:
+        if leader:
+            _land_flight(flight_key, flight, entry)
+
+def _refresh_forecast_in_background(url):
+    # 同じ URL の取り直しは同時に1つだけ
+    with _forecast_lock:
+        if url in _forecast_refreshing:
+            return
+        _forecast_refreshing.add(url)
+
+    def refresh():
+        try:
+            _refresh_forecast_entry(url)
+        finally:
+            with _forecast_lock:
+                _forecast_refreshing.discard(url)
+
+    threading.Thread(target=refresh, name='forecast-refresh', daemon=True).start()
+
+def fetch_today_weather_forecast(station=None):
+    """
+    気象庁の天気予報APIから今日の天気・気温を取得
+    地域は観測所の area_code（天気・降水確率）と temp_area_code（気温）
+    """
+    station = get_station(station)
+    return today_weather_forecast(get_forecast_index(station.forecast_url), station)
+
+def today_weather_forecast(index, station=None):
+    """
+    fetch_today_weather_forecast と同じ dict を、取得済みの予報の索引（取得できなければ None）から作る
+    """
+    station = get_station(station)
+    url = station.forecast_url
+    
+    try:
+        if index is None:
+            raise ValueError("予報データを取得できませんでした")
+        
+        # 今日の日付を取得
+        today = datetime.now().date()
+        
+        # 今日の天気
+        weather = index.value(station.area_code, "weathers", today)
+        if weather is None:
+            logger.warning(f"今日（{today}）の{station.name}の天気が見つかりませんでした")
+            return {
+                "weather": "取得失敗",
+                "high": None,
+                "low": None,
+                "rain": None,
+                "source_url": url,
+                "report_datetime": index.report_datetime,
+            }
+        
+        # 今日の降水確率（複数時間帯がある場合は最初のもの）
+        pop = index.value(station.area_code, "pops", today)
+        rain_text = f"{pop}%" if pop is not None else "--%"
+        
+        # 今日の気温
+        low_temp, high_temp = index.temperatures(station.temp_area_code, today)
+        
+        result = {
+            "weather": weather,
+            "high": high_temp,
+            "low": low_temp,
+            "rain": rain_text,
+            "source_url": url,
+            "report_datetime": index.report_datetime,
+        }
+        
+        logger.info(f"今日の天気データ: {result}")
+        return result
+    
+    except Exception as e:
+        logger.error(f"天気取得中にエラー: {e}")
+        return {
+            "weather": "取得失敗",
+            "high": None,
+            "low": None,
+            "rain": None,
+            "source_url": url,
+            "report_datetime": None,
+        }
+
+def weather_forecast_days(index, station=None):
+    """
+    予報期間（今日〜週間予報の最終日）の日ごとの予報のリスト
+    今日・明日・週間予報のどれも同じ索引（取得済みの予報。取得できなければ None）から引く
+    """
+    station = get_station(station)
+    if index is None:
+        return []
+    today = datetime.now().date()
+    return [
+        index.day_forecast(day, station.area_code, station.temp_area_code)
+        for day in index.days() if day >= today
+    ]
+    
+def get_average_temperature(year, month, station=None):
+    """
+    指定された年月の平均気温を取得
+    """
+    observations = get_monthly_observations(year, month, station)
+    if not observations:
+        return None
+    return monthly_temperature_stats(observations)['mean']
+
+
+WEATHER_DATA_RESPONSE_TIMEOUT = 60 * 60 * 24
+
+def _weather_data_response_key(station):
+    return f"weather:response:weather-data:{station.slug}"
+
+def weather_data_version(today, index):
+    """
+    /weather-data/ の応答が前提にしている日付と予報の発表時刻（index は予報の索引か None）
+    これが変わったら保存済みの応答は作り直す
+    """
+    return [today.strftime('%Y-%m-%d'), index.report_datetime if index is not None else None]
+
+def get_weather_data_response(version, station=None):
+    """
+    保存済みの /weather-data/ の応答（store_weather_data_response の dict）
+    version が違うか、今月分の月ページを取り直す時刻を過ぎていれば None
+    """
+    entry = cache.get(_weather_data_response_key(get_station(station)))
+    if entry is None or entry['version'] != version or time.time() >= entry['fresh_until']:
+        return None
+    # miss は作り直したときに weather_data ビューで数える（非同期ビューでは2回引くため）
+    metrics.count_cache('weather_data_response', 'hit')
+    return entry
+
+def store_weather_data_response(version, body, months, station=None):
+    """
+    組み立て済みの /weather-data/ の応答本文（JSON の bytes）を保存する
+    ETag は本文のハッシュで、本文が前回と同じなら Last-Modified は前回のまま
+    months（応答に使った月ページのうち今月分を含むもの）が取り直されるまで有効
+    """
+    station = get_station(station)
+    key = _weather_data_response_key(station)
+    etag = hashlib.sha256(body).hexdigest()[:32]
+    previous = cache.get(key)
+    entry = {
+        'version': version,
+        'body': body,
+        'etag': etag,
+        'last_modified': (
+            previous['last_modified'] if previous is not None and previous['etag'] == etag else time.time()
+        ),
+        'fresh_until': _pages_fresh_until(DAILY_PAGES, station, months),
+    }
+    cache.set(key, entry, WEATHER_DATA_RESPONSE_TIMEOUT)
+    return entry
+
+def invalidate_weather_data_response(station=None):
+    cache.delete(_weather_data_response_key(get_station(station)))
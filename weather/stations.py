@@ -0,0 +1,67 @@
+"""
+観測所の一覧
+過去データ（etrn）の観測所番号と、天気予報（bosai）の発表官署・地域コードを対応付ける
+観測所を増やすときは STATIONS に1行足すだけでよい（キャッシュはすべて観測所ごと）
+"""
+from django.conf import settings
+
+
+class UnknownStation(ValueError):
+    """
+    STATIONS に無い観測所が指定された
+    """
+
+
+class Station:
+    """
+    1つの観測所
+    prec_no / block_no: 過去データ（daily_s1.php など）の府県番号・地点番号
+    office_code: 予報を発表する官署（forecast/<office_code>.json）
+    area_code: 天気・降水確率の地域、temp_area_code: 気温の地点
+    """
+    __slots__ = ('slug', 'name', 'prec_no', 'block_no', 'office_code', 'area_code', 'temp_area_code')
+
+    def __init__(self, slug, name, prec_no, block_no, office_code, area_code, temp_area_code):
+        self.slug = slug
+        self.name = name
+        self.prec_no = prec_no
+        self.block_no = block_no
+        self.office_code = office_code
+        self.area_code = area_code
+        self.temp_area_code = temp_area_code
+
+    @property
+    def forecast_url(self):
+        return f"{settings.WEATHER_FORECAST_BASE_URL}/{self.office_code}.json"
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __repr__(self):
+        return f"Station({self.slug!r}, {self.prec_no}/{self.block_no})"
+
+
+STATIONS = {station.slug: station for station in (
+    Station('tokyo', '東京', 44, 47662, '130000', '130010', '44132'),
+    Station('osaka', '大阪', 62, 47772, '270000', '270000', '62078'),
+    Station('nagoya', '名古屋', 51, 47636, '230000', '230010', '51106'),
+    Station('sapporo', '札幌', 14, 47412, '016000', '016010', '14163'),
+    Station('fukuoka', '福岡', 82, 47807, '400000', '400010', '82182'),
+)}
+
+# "prec_no:block_no" でも引けるようにする
+_STATIONS_BY_NUMBER = {f"{s.prec_no}:{s.block_no}": s for s in STATIONS.values()}
+
+
+def get_station(station=None):
+    """
+    slug・"prec_no:block_no"・Station のどれかを Station にする
+    None なら WEATHER_DEFAULT_STATION。見つからなければ UnknownStation
+    """
+    if isinstance(station, Station):
+        return station
+    name = station or settings.WEATHER_DEFAULT_STATION
+    found = STATIONS.get(name) or _STATIONS_BY_NUMBER.get(name)
+    if found is None:
+        raise UnknownStation(f"未対応の観測所です: {name}")
+    return found
@@ -1,3 +1,892 @@
-from django.test import TestCase
+import asyncio
+import base64
+import json
+import math
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from unittest import mock, skipIf
 
-# Create your tests here.
+import numpy as np
+import requests
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import include, path
+from django.utils import timezone
+
+from benchmarks.stub_jma import FIXTURES, StubJMAServer
+
+from . import async_views, graphing, metrics, profiling, scraping, views
+from .models import MonthlyPageCache
+from .prediction import fit_linear_trends, temperature_outlook
+from .scraping import (
+    DAILY_PAGES,
+    ForecastIndex,
+    JST,
+    fetch_months_concurrently,
+    is_final_month,
+    is_final_year,
+    monthly_temperature_stats,
+    parse_daily_observations,
+    parse_jma_value,
+)
+from .stations import get_station
+
+
+class FinalPeriodTests(SimpleTestCase):
+    def test_month_is_final_only_after_grace_period(self):
+        self.assertFalse(is_final_month(2026, 9, now=datetime(2026, 9, 30, 23, tzinfo=JST)))
+        self.assertFalse(is_final_month(2026, 9, now=datetime(2026, 10, 1, 1, tzinfo=JST)))
+        self.assertFalse(is_final_month(2026, 9, now=datetime(2026, 10, 2, 23, 59, tzinfo=JST)))
+        self.assertTrue(is_final_month(2026, 9, now=datetime(2026, 10, 3, tzinfo=JST)))
+        self.assertFalse(is_final_month(2025, 12, now=datetime(2026, 1, 2, tzinfo=JST)))
+        self.assertTrue(is_final_month(2025, 12, now=datetime(2026, 1, 3, tzinfo=JST)))
+
+    @override_settings(WEATHER_FINAL_GRACE_DAYS=0)
+    def test_without_grace_period(self):
+        self.assertTrue(is_final_month(2026, 9, now=datetime(2026, 10, 1, tzinfo=JST)))
+        self.assertFalse(is_final_year(2026, now=datetime(2026, 12, 31, 23, tzinfo=JST)))
+        self.assertTrue(is_final_year(2025, now=datetime(2026, 1, 1, tzinfo=JST)))
+
+
+def _rows(label):
+    return [[label]]
+
+
+@override_settings(WEATHER_CURRENT_MONTH_CACHE_TTL=3600, WEATHER_LOCAL_READS_ONLY=False)
+class PageCacheTests(TestCase):
+    def setUp(self):
+        self.station = get_station('tokyo')
+        self.fetched = []
+        scraping._pending_hits.clear()
+
+    def fetch(self, year, month, station=None):
+        self.fetched.append((year, month))
+        return _rows('fresh')
+
+    def cached(self, year, month, is_final, age):
+        return MonthlyPageCache.objects.create(
+            prec_no=self.station.prec_no, block_no=self.station.block_no, year=year, month=month,
+            rows=_rows('cached'), is_final=is_final, fetched_at=timezone.now() - age,
+        )
+
+    def fetch_months(self, keys, **kwargs):
+        with mock.patch.object(DAILY_PAGES, 'fetch', self.fetch):
+            return fetch_months_concurrently(keys, station=self.station, **kwargs)
+
+    def test_final_page_is_never_refetched(self):
+        self.cached(2020, 1, is_final=True, age=timedelta(days=400))
+        self.assertEqual(self.fetch_months([(2020, 1)]), [_rows('cached')])
+        self.assertEqual(self.fetched, [])
+
+    def test_non_final_page_is_refetched_after_ttl(self):
+        self.cached(2020, 1, is_final=False, age=timedelta(minutes=10))
+        self.cached(2020, 2, is_final=False, age=timedelta(hours=2))
+        self.assertEqual(self.fetch_months([(2020, 1), (2020, 2)]), [_rows('cached'), _rows('fresh')])
+        self.assertEqual(self.fetched, [(2020, 2)])
+        entry = MonthlyPageCache.objects.get(year=2020, month=2)
+        self.assertEqual(entry.rows, _rows('fresh'))
+        self.assertTrue(entry.is_final)
+        self.assertEqual(entry.miss_count, 1)
+
+    def test_local_reads_return_stale_pages_without_fetching(self):
+        self.cached(2020, 2, is_final=False, age=timedelta(hours=2))
+        self.assertEqual(self.fetch_months([(2020, 2), (2020, 3)], upstream=False), [_rows('cached'), None])
+        self.assertEqual(self.fetched, [])
+
+    def test_page_fetched_within_grace_period_stays_non_final(self):
+        today = datetime.now(JST)
+        self.assertEqual(self.fetch_months([(today.year, today.month), (2020, 1)]), [_rows('fresh')] * 2)
+        current = MonthlyPageCache.objects.get(year=today.year, month=today.month)
+        self.assertFalse(current.is_final)
+        self.assertTrue(MonthlyPageCache.objects.get(year=2020, month=1).is_final)
+        with override_settings(WEATHER_FINAL_GRACE_DAYS=100000):
+            self.fetch_months([(2019, 1)])
+        self.assertFalse(MonthlyPageCache.objects.get(year=2019, month=1).is_final)
+
+    def test_hit_counts_are_written_in_batches(self):
+        self.cached(2020, 1, is_final=True, age=timedelta(days=400))
+        # キャッシュの SELECT だけで、UPDATE は行わない
+        with override_settings(WEATHER_HIT_COUNT_FLUSH_INTERVAL=3600), self.assertNumQueries(2):
+            self.fetch_months([(2020, 1)])
+            self.fetch_months([(2020, 1)])
+        self.assertEqual(MonthlyPageCache.objects.get(year=2020, month=1).hit_count, 0)
+        with override_settings(WEATHER_HIT_COUNT_FLUSH_INTERVAL=0):
+            self.fetch_months([(2020, 1)])
+        self.assertEqual(MonthlyPageCache.objects.get(year=2020, month=1).hit_count, 3)
+
+
+def _is_nan(value):
+    return isinstance(value, float) and math.isnan(value)
+
+
+class ParseJmaValueTests(SimpleTestCase):
+    def test_plain_and_negative_values(self):
+        self.assertEqual(parse_jma_value('25.3'), (25.3, ''))
+        self.assertEqual(parse_jma_value('-3.2'), (-3.2, ''))
+        self.assertEqual(parse_jma_value(' 0 '), (0.0, ''))
+
+    def test_quasi_normal_value_is_usable(self):
+        self.assertEqual(parse_jma_value('12.5)'), (12.5, ')'))
+        self.assertEqual(parse_jma_value('-1.0 )'), (-1.0, ')'))
+
+    def test_insufficient_and_doubtful_values_are_nan(self):
+        for text, mark in (('12.5]', ']'), ('-4.1]', ']'), ('30.2#', '#')):
+            value, quality = parse_jma_value(text)
+            self.assertTrue(_is_nan(value), text)
+            self.assertEqual(quality, mark)
+
+    def test_missing_and_no_phenomenon_are_nan(self):
+        for text in ('×', '--', '///', '', None, '晴'):
+            value, quality = parse_jma_value(text)
+            self.assertTrue(_is_nan(value), text)
+            self.assertEqual(quality, '')
+
+
+class MonthlyTemperatureStatsTests(SimpleTestCase):
+    def test_unusable_values_do_not_count_in_monthly_stats(self):
+        rows = [
+            [str(day), *[''] * 6, temp, *[''] * 12, '晴']
+            for day, temp in ((1, '20.0'), (2, '22.0)'), (3, '40.0]'), (4, '×'), (5, '-2.0#'))
+        ]
+        observations = parse_daily_observations(rows, 2020, 1)
+        self.assertEqual([o.quality for o in observations], ['', ')', ']', '', '#'])
+        stats = monthly_temperature_stats(observations)
+        self.assertEqual(stats['count'], 2)
+        self.assertEqual(stats['mean'], 21.0)
+        self.assertEqual(stats['max'], 22.0)
+        self.assertEqual(stats['min'], 20.0)
+
+
+FORECAST_DOCUMENT = [
+    {
+        'reportDatetime': '2026-10-18T05:00:00+09:00',
+        'timeSeries': [
+            {
+                'timeDefines': ['2026-10-18T05:00:00+09:00', '2026-10-19T00:00:00+09:00'],
+                'areas': [{'area': {'code': '130010'}, 'weatherCodes': ['100', '200'], 'weathers': ['晴れ', 'くもり']}],
+            },
+            {
+                'timeDefines': [
+                    '2026-10-18T06:00:00+09:00', '2026-10-18T12:00:00+09:00', '2026-10-19T00:00:00+09:00',
+                ],
+                'areas': [{'area': {'code': '130010'}, 'pops': ['', '10', '30']}],
+            },
+            {
+                'timeDefines': [
+                    '2026-10-18T09:00:00+09:00', '2026-10-19T00:00:00+09:00', '2026-10-19T09:00:00+09:00',
+                ],
+                'areas': [{'area': {'code': '44132'}, 'temps': ['24', '15', '22']}],
+            },
+        ],
+    },
+    {
+        'reportDatetime': '2026-10-18T11:00:00+09:00',
+        'timeSeries': [
+            {
+                'timeDefines': ['2026-10-19T00:00:00+09:00', '2026-10-20T00:00:00+09:00'],
+                'areas': [{'area': {'code': '130010'}, 'weatherCodes': ['201', '300'], 'pops': ['40', '70']}],
+            },
+            {
+                'timeDefines': ['2026-10-19T00:00:00+09:00', '2026-10-20T00:00:00+09:00'],
+                'areas': [{'area': {'code': '44132'}, 'tempsMin': ['', '14'], 'tempsMax': ['', '21']}],
+            },
+        ],
+    },
+]
+
+
+class ForecastIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = ForecastIndex(FORECAST_DOCUMENT)
+
+    def test_report_datetime_and_days(self):
+        self.assertEqual(self.index.report_datetime, '2026-10-18T05:00:00+09:00')
+        self.assertEqual(self.index.days(), [date(2026, 10, 18), date(2026, 10, 19), date(2026, 10, 20)])
+
+    def test_temperatures_from_short_term_temps(self):
+        # 0時の値が朝の最低、9時の値が日中の最高
+        self.assertEqual(self.index.temperatures('44132', date(2026, 10, 19)), ('15', '22'))
+
+    def test_temperatures_only_daytime_high_today(self):
+        # 今日の朝の最低は発表時点で過ぎていて短期予報に無く、週間予報にも今日は無い
+        self.assertEqual(self.index.temperatures('44132', date(2026, 10, 18)), (None, '24'))
+
+    def test_temperatures_fall_back_to_weekly(self):
+        self.assertEqual(self.index.temperatures('44132', date(2026, 10, 20)), ('14', '21'))
+        self.assertEqual(self.index.temperatures('99999', date(2026, 10, 20)), (None, None))
+
+    def test_day_forecast_prefers_short_term_and_skips_blanks(self):
+        self.assertEqual(self.index.day_forecast(date(2026, 10, 18), '130010', '44132'), {
+            'date': '2026-10-18',
+            'weather': '晴れ',
+            'weather_code': '100',
+            'high': '24',
+            'low': None,
+            'rain': '10%',
+        })
+        self.assertEqual(self.index.day_forecast(date(2026, 10, 19), '130010', '44132')['weather_code'], '200')
+
+    def test_day_forecast_from_weekly_only(self):
+        self.assertEqual(self.index.day_forecast(date(2026, 10, 20), '130010', '44132'), {
+            'date': '2026-10-20',
+            'weather': None,
+            'weather_code': '300',
+            'high': '21',
+            'low': '14',
+            'rain': '70%',
+        })
+
+
+
+@override_settings(WEATHER_SHARED_FETCH_LOCK=False, WEATHER_FORECAST_SHARED_CACHE=False)
+class ForecastFailureBackoffTests(SimpleTestCase):
+    url = 'https://forecast.invalid/130000.json'
+
+    def setUp(self):
+        scraping._forecast_cache.pop(self.url, None)
+        scraping._forecast_failures.pop(self.url, None)
+        self.addCleanup(scraping._forecast_failures.pop, self.url, None)
+        self.addCleanup(scraping._forecast_cache.pop, self.url, None)
+        patcher = mock.patch.object(scraping, 'upstream_get', side_effect=requests.ConnectionError('down'))
+        self.upstream_get = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @override_settings(WEATHER_FORECAST_FAILURE_BACKOFF=60)
+    def test_failure_is_not_retried_during_backoff(self):
+        with scraping.request_scope() as scope:
+            for _ in range(4):
+                self.assertIsNone(scraping.get_forecast_index(self.url))
+        self.assertEqual(self.upstream_get.call_count, 1)
+        self.assertIn(('forecast', self.url), scope.unavailable)
+        # 別のリクエストでも待つ
+        self.assertIsNone(scraping.get_forecast_index(self.url))
+        self.assertEqual(self.upstream_get.call_count, 1)
+
+    @override_settings(WEATHER_FORECAST_FAILURE_BACKOFF=0)
+    def test_unavailable_forecast_is_not_retried_within_a_request(self):
+        with scraping.request_scope():
+            self.assertIsNone(scraping.get_forecast_index(self.url))
+            self.assertIsNone(scraping.get_forecast_index(self.url))
+        self.assertEqual(self.upstream_get.call_count, 1)
+        self.assertIsNone(scraping.get_forecast_index(self.url))
+        self.assertEqual(self.upstream_get.call_count, 2)
+
+    @override_settings(WEATHER_FORECAST_FAILURE_BACKOFF=0)
+    def test_success_clears_failure(self):
+        self.assertIsNone(scraping.get_forecast_index(self.url))
+        self.upstream_get.side_effect = None
+        self.upstream_get.return_value.json.return_value = FORECAST_DOCUMENT
+        index = scraping.get_forecast_index(self.url)
+        self.assertEqual(index.report_datetime, '2026-10-18T05:00:00+09:00')
+        self.assertNotIn(self.url, scraping._forecast_failures)
+
+
+class LinearTrendTests(SimpleTestCase):
+    def test_fit_linear_trends_handles_nan_columns(self):
+        years = [2000, 2001, 2002, 2003, 2004]
+        matrix = np.array([
+            [2 * year + 1 for year in years],
+            [np.nan] * 5,
+            [np.nan, 10.0, np.nan, np.nan, np.nan],
+            [np.nan, 2.0, np.nan, 4.0, 5.0],
+        ]).T
+        fit = fit_linear_trends(years, matrix)
+
+        self.assertAlmostEqual(fit['slope'][0], 2.0)
+        self.assertAlmostEqual(fit['intercept'][0], 1.0)
+        self.assertEqual(list(fit['count']), [5, 0, 1, 3])
+        # 値が無い列・1つしかない列は NaN（警告や例外にならない）
+        self.assertTrue(np.isnan(fit['slope'][1]))
+        self.assertTrue(np.isnan(fit['mean'][1]))
+        self.assertTrue(np.isnan(fit['slope'][2]))
+        self.assertEqual(fit['mean'][2], 10.0)
+        # 途中の NaN は除いて当てはめる
+        self.assertAlmostEqual(fit['slope'][3], 1.0)
+        self.assertAlmostEqual(fit['intercept'][3], -1999.0)
+
+
+class TemperatureOutlookTests(SimpleTestCase):
+    def test_temperature_outlook_marks_short_months_as_missing(self):
+        today = datetime(2026, 1, 15)
+
+        def monthly_mean_matrix(years, station=None):
+            matrix = np.array([[10.0 + month + 0.5 * (year - 2016) for month in range(12)] for year in years])
+            matrix[:, 0] = np.nan  # 1月: 値なし
+            matrix[2:, 1] = np.nan  # 2月: 2年分だけ
+            return matrix
+
+        with mock.patch('weather.prediction.monthly_mean_matrix', monthly_mean_matrix):
+            outlook = temperature_outlook(horizon=12, today=today)
+
+        self.assertEqual(outlook['years'], [2016, 2025])
+        january, february, march = outlook['months'][:3]
+        self.assertEqual((january['count'], january['predicted_temp'], january['interval']), (0, None, None))
+        self.assertEqual((february['count'], february['predicted_temp'], february['slope']), (2, None, None))
+        self.assertEqual(march['count'], 10)
+        self.assertEqual(march['predicted_temp'], 17.0)  # 12 + 0.5 * (2026 - 2016)
+        self.assertEqual(march['slope'], 0.5)
+        self.assertEqual(march['interval'], [17.0, 17.0])
+        self.assertEqual(march['past_avg_temp'], 14.2)
+        # そのまま JSON にできる（NaN や numpy の値が残っていない）
+        json.dumps(outlook, allow_nan=False)
+
+
+class RequestScopeTests(SimpleTestCase):
+    def test_unavailable_pages_are_recorded_until_fetched(self):
+        station = get_station('tokyo')
+        with scraping.request_scope() as scope:
+            scraping._remember_in_scope(DAILY_PAGES, station, {(2020, 1): None, (2020, 2): _rows('x')})
+            self.assertEqual(scope.unavailable, {('daily_page', 'tokyo', 2020, 1)})
+            scraping._remember_in_scope(DAILY_PAGES, station, {(2020, 1): _rows('y')})
+            self.assertEqual(scope.unavailable, set())
+            self.assertEqual(scope.month_rows[('tokyo', 2020, 1)], _rows('y'))
+
+
+@override_settings(WEATHER_SHARED_FETCH_LOCK=False, WEATHER_LOCAL_READS_ONLY=False)
+@mock.patch.object(scraping, '_store_page_rows')
+@mock.patch.object(scraping, '_load_cache_entries', return_value={})
+class SingleFlightTests(SimpleTestCase):
+    """
+    DB を使わずに、同じページの取得がスレッド間・イベントループとスレッドの間でまとまるかを見る
+    """
+    def setUp(self):
+        scraping._pending_hits.clear()
+        self.station = get_station('tokyo')
+        self.fetched = []
+        self.lock = threading.Lock()
+
+    def slow_fetch(self, year, month, station=None):
+        with self.lock:
+            self.fetched.append((year, month))
+        time.sleep(0.2)
+        return _rows(f"{year}-{month}")
+
+    def test_concurrent_threads_share_one_upstream_fetch(self, *mocks):
+        keys = [(2020, 1), (2020, 2)]
+        barrier = threading.Barrier(8)
+
+        def worker(_):
+            barrier.wait()
+            return fetch_months_concurrently(keys, station=self.station)
+
+        with mock.patch.object(DAILY_PAGES, 'fetch', self.slow_fetch), ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(worker, range(8)))
+
+        self.assertEqual(sorted(self.fetched), keys)
+        self.assertEqual(results, [[_rows('2020-1'), _rows('2020-2')]] * 8)
+        self.assertEqual(scraping._flights, {})
+
+    @override_settings(WEATHER_SINGLE_FLIGHT_TIMEOUT=0.3)
+    def test_waiter_fetches_itself_after_timeout(self, *mocks):
+        key = scraping._page_flight_key(DAILY_PAGES, self.station, (2020, 1))
+        flight, leader = scraping._join_flight(key)
+        self.assertTrue(leader)
+        try:
+            started = time.monotonic()
+            with mock.patch.object(DAILY_PAGES, 'fetch', self.slow_fetch):
+                rows = fetch_months_concurrently([(2020, 1)], station=self.station)
+            self.assertLess(time.monotonic() - started, 2)
+        finally:
+            scraping._land_flight(key, flight, None)
+        self.assertEqual(rows, [_rows('2020-1')])
+        self.assertEqual(self.fetched, [(2020, 1)])
+
+    def test_async_waiters_do_not_block_executor_threads(self, *mocks):
+        """
+        待つ側がスレッドを使うと、1スレッドの executor では取得側の解析が終わらず時間切れまで止まる
+        """
+        key = (2020, 1)
+        flight_key = scraping._page_flight_key(DAILY_PAGES, self.station, key)
+
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            loop.set_default_executor(ThreadPoolExecutor(max_workers=1))
+            flight, leader = scraping._join_flight(flight_key)
+            self.assertTrue(leader)
+            results = [{} for _ in range(4)]
+            waiters = [
+                asyncio.ensure_future(scraping._await_pages_async(DAILY_PAGES, self.station, {key: flight}, {}, r))
+                for r in results
+            ]
+            await asyncio.sleep(0.05)
+            # 取得した側の HTML の解析（executor で行う）
+            rows = await asyncio.to_thread(_rows, 'parsed')
+            scraping._land_flight(flight_key, flight, rows)
+            await asyncio.gather(*waiters)
+            return results
+
+        started = time.monotonic()
+        with override_settings(WEATHER_SINGLE_FLIGHT_TIMEOUT=5):
+            results = asyncio.run(scenario())
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(results, [{key: _rows('parsed')}] * 4)
+
+
+@override_settings(WEATHER_SHARED_FETCH_LOCK=False, WEATHER_LOCAL_READS_ONLY=False)
+class DailyWeatherStreamTests(SimpleTestCase):
+    def setUp(self):
+        self.station = get_station('tokyo')
+
+    def test_closing_stream_early_lands_claimed_flights(self):
+        """
+        クライアントが切断して月ごとの取得が取り消されても、登録した Flight が残らない
+        """
+        claim_pages = scraping._claim_pages
+
+        def resolve_cached_pages(kind, station, keys, refresh=False, upstream=None):
+            return {}, {}, list(keys)
+
+        def slow_claim_pages(kind, station, keys, entries, results):
+            time.sleep(0.2)
+            return claim_pages(kind, station, keys, entries, results)
+
+        async def download_page(kind, station, key):
+            return _rows(f"{key[0]}-{key[1]}")
+
+        async def scenario():
+            days = scraping.aiter_daily_weather_range(date(2020, 1, 1), date(2020, 3, 31), self.station)
+            first = asyncio.ensure_future(days.__anext__())
+            # 最初の月の _claim_pages の途中で切断する
+            await asyncio.sleep(0.05)
+            first.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await first
+            await days.aclose()
+            # 取り消された側のスレッドの処理が終わるのを待つ
+            await sync_to_async(lambda: None)()
+
+        with mock.patch.object(scraping, '_resolve_cached_pages', resolve_cached_pages), \
+                mock.patch.object(scraping, '_claim_pages', slow_claim_pages), \
+                mock.patch.object(scraping, '_download_page_async', download_page), \
+                mock.patch.object(scraping, '_store_page_rows'):
+            asyncio.run(scenario())
+
+        self.assertEqual(scraping._flights, {})
+
+
+class WeatherURLConf:
+    """
+    weather_project/urls.py の観測所ごとの URL を、同期・非同期のどちらかのビューで組んだ URLconf
+    （urls.py は WEATHER_ASYNC_VIEWS で使うビューが決まるので、テストでは明示して選ぶ）
+    """
+    def __init__(self, data_views):
+        data_urlpatterns = [
+            path('weather-data/', data_views.weather_data, name='weather_data'),
+            path('weather-graph/', data_views.weather_graph, name='weather_graph'),
+            path('weather-graph/image/', data_views.weather_graph_image, name='weather_graph_image'),
+            path('custom-week-weather/<int:weeks>/', data_views.custom_week_weather, name='custom_week_weather'),
+            path('custom-year-weather/<int:years>/', data_views.custom_year_weather, name='custom_year_weather'),
+        ]
+        self.urlpatterns = [
+            *data_urlpatterns,
+            path('stations/', views.station_list, name='station_list'),
+            path('stations/<slug:station>/', include((data_urlpatterns, 'station'))),
+        ]
+
+
+SYNC_URLS = WeatherURLConf(views)
+ASYNC_URLS = WeatherURLConf(async_views)
+
+
+class StubJMATestCase(TestCase):
+    """
+    気象庁の代わりに benchmarks/stub_jma.py のスタブ（記録したページ）を使うビューのテスト
+    stub.requests にパスごとの要求回数が入る
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = StubJMAServer(('127.0.0.1', 0)).start()
+        cls.addClassCleanup(cls.stub.server_close)
+        cls.addClassCleanup(cls.stub.shutdown)
+
+    def setUp(self):
+        base_url = self.stub.base_url
+        settings_override = override_settings(
+            ROOT_URLCONF=SYNC_URLS,
+            WEATHER_ETRN_BASE_URL=f"{base_url}/etrn",
+            WEATHER_FORECAST_BASE_URL=f"{base_url}/forecast",
+            WEATHER_LOCAL_READS_ONLY=False,
+            WEATHER_SHARED_FETCH_LOCK=False,
+            WEATHER_FORECAST_SHARED_CACHE=False,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for patcher in (
+            mock.patch.object(scraping, 'BASE_URL', f"{base_url}/etrn/daily_s1.php"),
+            mock.patch.object(scraping, 'MONTHLY_BASE_URL', f"{base_url}/etrn/monthly_s1.php"),
+            mock.patch.dict(self.stub.fixtures),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        cache.clear()
+        self.addCleanup(cache.clear)
+        for table in (scraping._forecast_cache, scraping._forecast_failures, scraping._pending_hits):
+            table.clear()
+            self.addCleanup(table.clear)
+        self.stub.requests.clear()
+
+    def forecast_requests(self):
+        return sum(count for path, count in self.stub.requests.items() if path.startswith('/forecast/'))
+
+
+class WeatherDataViewTests(StubJMATestCase):
+    def test_response_is_stored_and_revalidated(self):
+        response = self.client.get('/weather-data/')
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual(payload['station'], 'tokyo')
+        self.assertIsNotNone(payload['today_report_datetime'])
+        etag = response['ETag']
+
+        fetches = dict(self.stub.requests)
+        again = self.client.get('/weather-data/')
+        self.assertEqual(again.content, response.content)
+        self.assertEqual(again['ETag'], etag)
+        self.assertEqual(self.client.get('/weather-data/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.stub.requests, fetches)
+
+    def test_forecast_is_looked_up_once_on_a_miss(self):
+        with mock.patch('weather.views.get_forecast_index', wraps=scraping.get_forecast_index) as lookup:
+            self.assertEqual(self.client.get('/weather-data/').status_code, 200)
+        self.assertEqual(lookup.call_count, 1)
+        self.assertEqual(self.forecast_requests(), 1)
+
+    @override_settings(WEATHER_FORECAST_FAILURE_BACKOFF=0)
+    def test_response_is_not_stored_when_upstream_failed(self):
+        forecast = self.stub.fixtures['forecast']
+        self.stub.fixtures['forecast'] = {}
+        response = self.client.get('/weather-data/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()['today_report_datetime'])
+        self.assertNotIn('ETag', response)
+        self.assertIsNone(cache.get('weather:response:weather-data:tokyo'))
+        # 予報の取得は1リクエストで1回だけ
+        self.assertEqual(self.forecast_requests(), 1)
+
+        # 取れるようになったら次のリクエストで取り直して保存する
+        self.stub.fixtures['forecast'] = forecast
+        response = self.client.get('/weather-data/')
+        self.assertIsNotNone(response.json()['today_report_datetime'])
+        self.assertIn('ETag', response)
+        self.assertEqual(self.forecast_requests(), 2)
+
+
+class UpstreamMetricsTests(StubJMATestCase):
+    def upstream_samples(self, host):
+        prefix = f'weather_upstream_duration_seconds_count{{host="{host}",worker="{os.getpid()}"}} '
+        lines = [line for line in metrics.render().splitlines() if line.startswith(prefix)]
+        return int(lines[0][len(prefix):]) if lines else 0
+
+    def test_upstream_latency_is_recorded_per_host(self):
+        host = self.stub.base_url.split('://', 1)[1]
+        scraping.upstream_get(f"{self.stub.base_url}/forecast/130000.json")
+        with self.assertRaises(requests.HTTPError):
+            scraping.upstream_get(f"{self.stub.base_url}/forecast/999999.json")
+        self.assertEqual(self.upstream_samples(host), 2)
+        self.assertEqual(metrics.UPSTREAM_REQUESTS.value(host, 'ok'), 1)
+        self.assertEqual(metrics.UPSTREAM_REQUESTS.value(host, 'error'), 1)
+
+
+_SAMPLE = re.compile(r'^([a-z_]+)(?:\{(.*)\})? (\S+)$')
+_LABEL = re.compile(r'([a-z_]+)="((?:[^"\\]|\\.)*)"')
+
+
+def _parse_exposition(text):
+    """
+    Prometheus のテキスト形式を {メトリクス名: TYPE} と [(サンプル名, {ラベル}, 値)] にする
+    """
+    types, samples = {}, []
+    for line in text.splitlines():
+        if line.startswith('# TYPE '):
+            _, _, name, kind = line.split(' ')
+            types[name] = kind
+        elif line and not line.startswith('#'):
+            match = _SAMPLE.match(line)
+            if match is None:
+                raise AssertionError(f"Not a sample line: {line!r}")
+            name, labels, value = match.groups()
+            samples.append((name, dict(_LABEL.findall(labels or '')), float(value)))
+    return types, samples
+
+
+class MetricsViewTests(SimpleTestCase):
+    token = 'metrics-secret'
+
+    def test_disabled_without_token(self):
+        with override_settings(WEATHER_METRICS_TOKEN=''):
+            self.assertEqual(self.client.get('/metrics/').status_code, 404)
+
+    @override_settings(WEATHER_METRICS_TOKEN=token)
+    def test_requires_bearer_token(self):
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+        self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION=f'Basic {self.token}').status_code, 401)
+
+    @override_settings(WEATHER_METRICS_TOKEN=token)
+    def test_exposition_format(self):
+        self.assertEqual(self.client.get('/health/').status_code, 200)
+        response = self.client.get('/metrics/', HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        types, samples = _parse_exposition(response.content.decode('utf-8'))
+
+        self.assertEqual(types['weather_requests_total'], 'counter')
+        self.assertEqual(types['weather_request_duration_seconds'], 'histogram')
+        self.assertEqual(types['weather_upstream_duration_seconds'], 'histogram')
+        for name, labels, _ in samples:
+            self.assertIn(re.sub(r'_(bucket|sum|count)$', '', name), types)
+            # ワーカーごとの系列になる
+            self.assertEqual(labels['worker'], str(os.getpid()))
+        self.assertTrue(any(
+            name == 'weather_requests_total' and labels['endpoint'] == 'health_check' and labels['status'] == '200'
+            for name, labels, _ in samples
+        ))
+
+        # バケットは累積で、+Inf は _count と同じ
+        buckets = [
+            (labels['le'], value) for name, labels, value in samples
+            if name == 'weather_request_duration_seconds_bucket' and labels['endpoint'] == 'health_check'
+        ]
+        self.assertEqual(buckets[-1][0], '+Inf')
+        self.assertEqual([value for _, value in buckets], sorted(value for _, value in buckets))
+        count = next(
+            value for name, labels, value in samples
+            if name == 'weather_request_duration_seconds_count' and labels['endpoint'] == 'health_check'
+        )
+        self.assertEqual(buckets[-1][1], count)
+
+
+class TemperatureGraphTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_labels_use_the_year_the_series_were_fetched_for(self):
+        from matplotlib.axes import Axes
+
+        series = [[float(month) for month in range(1, 13)]] * 5
+        # 12月31日に取得した系列を、年が明けてから描画する
+        with mock.patch.object(graphing, 'datetime', wraps=datetime) as fake_datetime, \
+                mock.patch.object(Axes, 'plot', autospec=True, side_effect=Axes.plot) as plot:
+            fake_datetime.now.return_value = datetime(2026, 1, 1, 0, 0, 5)
+            key, png = graphing.get_temperature_graph_png(series, 2025)
+
+        self.assertEqual(key, graphing.temperature_graph_key(series, 2025))
+        self.assertTrue(png.startswith(b'\x89PNG'))
+        labels = [call.kwargs['label'] for call in plot.call_args_list]
+        self.assertEqual([label.rstrip('年') for label in labels], ['2025', '2015', '2005', '1995', '1985'])
+
+
+class WeatherGraphViewTests(StubJMATestCase):
+    def test_image_is_cached_and_revalidated(self):
+        with mock.patch.object(graphing, 'render_temperature_graph_png', wraps=graphing.render_temperature_graph_png) \
+                as render:
+            response = self.client.get('/weather-graph/image/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'image/png')
+            self.assertTrue(response.content.startswith(b'\x89PNG'))
+            self.assertIn('max-age=', response['Cache-Control'])
+            etag = response['ETag']
+
+            not_modified = self.client.get('/weather-graph/image/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(not_modified.status_code, 304)
+            self.assertEqual(not_modified['ETag'], etag)
+            self.assertEqual(not_modified.content, b'')
+
+            # JSON は別の ETag で、画像はキャッシュから使う
+            graph = self.client.get('/weather-graph/')
+            self.assertEqual(graph.status_code, 200)
+            self.assertNotEqual(graph['ETag'], etag)
+            self.assertEqual(base64.b64decode(graph.json()['image_base64']), response.content)
+            self.assertEqual(self.client.get('/weather-graph/', HTTP_IF_NONE_MATCH=graph['ETag']).status_code, 304)
+        self.assertEqual(render.call_count, 1)
+
+
+@skipIf(scraping.lxml_html is None, 'lxml がインストールされていない')
+class Data2sExtractorTests(SimpleTestCase):
+    """
+    lxml 版と BeautifulSoup 版の table.data2_s の抽出が、記録したページで同じ結果になる
+    """
+    def assert_same_rows(self, page, header_rows, min_rows):
+        content = page.read_bytes()
+        rows = scraping._extract_data2_s_rows_lxml(content, header_rows)
+        self.assertEqual(rows, scraping._extract_data2_s_rows_bs4(content, header_rows), page.name)
+        self.assertGreaterEqual(len(rows), min_rows, page.name)
+        self.assertTrue(all(isinstance(cell, str) and cell == cell.strip() for row in rows for cell in row))
+        return rows
+
+    def test_daily_pages(self):
+        pages = sorted(FIXTURES.glob('daily_s1_*.html'))
+        self.assertTrue(pages)
+        for page in pages:
+            rows = self.assert_same_rows(page, scraping.DAILY_PAGES.header_rows, 28)
+            # 1列目は日
+            self.assertEqual([row[0] for row in rows], [str(day) for day in range(1, len(rows) + 1)], page.name)
+
+    def test_monthly_page(self):
+        for page in sorted(FIXTURES.glob('monthly_s1_*.html')):
+            self.assert_same_rows(page, scraping.MONTHLY_PAGES.header_rows, 12)
+
+    def test_page_without_table(self):
+        content = '<html><body><table class="data2_p"><tr><td>1</td></tr></table></body></html>'.encode('utf-8')
+        self.assertIsNone(scraping._extract_data2_s_rows_lxml(content))
+        self.assertIsNone(scraping._extract_data2_s_rows_bs4(content))
+
+
+class AsyncViewTests(StubJMATestCase):
+    """
+    非同期ビューは先読みしてから同期ビューを呼ぶので、応答は同期ビューと同じになる
+    """
+    def async_get(self, path, **extra):
+        with override_settings(ROOT_URLCONF=ASYNC_URLS):
+            return async_to_sync(self.async_client.get)(path, **extra)
+
+    def test_weather_data_matches_sync_view(self):
+        response = self.async_get('/weather-data/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ETag', response)
+        # 先読みした月ページと予報は、それぞれ1回だけ取得する
+        self.assertEqual(self.forecast_requests(), 1)
+        self.assertEqual(response['X-Upstream-Fetches'], str(sum(self.stub.requests.values())))
+
+        self.assertEqual(self.async_get('/weather-data/', headers={'If-None-Match': response['ETag']}).status_code, 304)
+        cache.clear()
+        self.assertEqual(response.json(), self.client.get('/weather-data/').json())
+
+    def test_weather_graph_image_matches_sync_view(self):
+        response = self.async_get('/weather-graph/image/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        cache.clear()
+        sync_response = self.client.get('/weather-graph/image/')
+        self.assertEqual(response['ETag'], sync_response['ETag'])
+        self.assertEqual(response.content, sync_response.content)
+
+    def test_custom_year_weather_matches_sync_view(self):
+        response = self.async_get('/custom-year-weather/3/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), self.client.get('/custom-year-weather/3/').json())
+        self.assertEqual(self.async_get('/custom-year-weather/101/').status_code, 400)
+
+    def test_unknown_station_is_404(self):
+        self.assertEqual(self.async_get('/stations/nowhere/weather-data/').status_code, 404)
+        self.assertEqual(self.stub.requests, {})
+
+
+class WeekWeatherStreamViewTests(StubJMATestCase):
+    """
+    /custom-week-weather/ の NDJSON は JSON の week_data と同じ内容を1日1行で返す
+    """
+    weeks = 6
+
+    def assert_stream_matches_json(self, chunks):
+        expected = self.client.get(f'/custom-week-weather/{self.weeks}/').json()
+        header, *days = [json.loads(line) for line in b''.join(chunks).decode('utf-8').splitlines()]
+        self.assertEqual(header, {
+            'station': 'tokyo',
+            'weeks': self.weeks,
+            'total_days': self.weeks * 7,
+            'today_date': expected['today_date'],
+        })
+        self.assertEqual(days, expected['week_data'])
+        self.assertEqual([day['days_ago'] for day in days], list(range(self.weeks * 7, 0, -1)))
+
+    def test_sync_stream(self):
+        response = self.client.get(f'/custom-week-weather/{self.weeks}/?stream=1')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(response['X-Accel-Buffering'], 'no')
+        self.assert_stream_matches_json(list(response.streaming_content))
+
+    def test_async_stream(self):
+        async def stream():
+            response = await self.async_client.get(
+                f'/custom-week-weather/{self.weeks}/', headers={'Accept': 'application/x-ndjson'},
+            )
+            return response, [chunk async for chunk in response.streaming_content]
+
+        with override_settings(ROOT_URLCONF=ASYNC_URLS):
+            response, chunks = async_to_sync(stream)()
+        self.assertTrue(response.is_async)
+        # 月ごとに送る（見出しの行と、期間にかかる月の数）
+        self.assertGreaterEqual(len(chunks), 3)
+        self.assert_stream_matches_json(chunks)
+        self.assertEqual(scraping._flights, {})
+
+
+class StationRoutingTests(StubJMATestCase):
+    def test_station_list(self):
+        response = self.client.get('/stations/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['default'], 'tokyo')
+        self.assertIn({'slug': 'osaka', 'prec_no': 62, 'block_no': 47772}, [
+            {key: station[key] for key in ('slug', 'prec_no', 'block_no')} for station in data['stations']
+        ])
+
+    def test_default_station_and_explicit_slug_are_the_same(self):
+        default = self.client.get('/custom-week-weather/1/').json()
+        tokyo = self.client.get('/stations/tokyo/custom-week-weather/1/').json()
+        self.assertEqual(default, tokyo)
+
+    def test_station_pages_are_fetched_for_that_station(self):
+        response = self.client.get('/stations/osaka/custom-week-weather/1/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['station'], 'osaka')
+        self.assertTrue(all('prec_no=62&block_no=47772' in day['source'] for day in data['week_data']))
+        # 観測所ごとにキャッシュするので、東京のページは使わない
+        self.client.get('/stations/tokyo/custom-week-weather/1/')
+        stations = set(MonthlyPageCache.objects.values_list('prec_no', 'block_no'))
+        self.assertEqual(stations, {(62, 47772), (44, 47662)})
+
+    def test_unknown_station_is_404(self):
+        for url in ('/stations/nowhere/weather-data/', '/stations/nowhere/weather-graph/image/'):
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+        self.assertEqual(self.stub.requests, {})
+
+
+class ProfilingMiddlewareTests(SimpleTestCase):
+    token = 'profile-secret'
+
+    def assert_not_profiled(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'status': 'ok'})
+
+    def test_disabled_without_token(self):
+        with override_settings(WEATHER_PROFILE_TOKEN=''):
+            self.assert_not_profiled(self.client.get('/health/', headers={'X-Weather-Profile': ''}))
+            self.assert_not_profiled(self.client.get('/health/?profile='))
+
+    @override_settings(WEATHER_PROFILE_TOKEN=token, WEATHER_PROFILE_DIR='')
+    def test_wrong_token_is_not_profiled(self):
+        self.assert_not_profiled(self.client.get('/health/', headers={'X-Weather-Profile': 'wrong'}))
+        self.assert_not_profiled(self.client.get('/health/?profile=wrong'))
+
+    @override_settings(WEATHER_PROFILE_TOKEN=token, WEATHER_PROFILE_DIR='')
+    def test_token_in_header_or_query_returns_report(self):
+        for response in (
+            self.client.get('/health/', headers={'X-Weather-Profile': self.token}),
+            self.client.get(f'/health/?profile={self.token}&profile_top=5'),
+        ):
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Cache-Control'], 'no-store')
+            report = response.json()
+            self.assertEqual((report['endpoint'], report['status']), ('health_check', 200))
+            self.assertEqual(report['upstream']['count'], 0)
+            self.assertEqual(set(report['functions']), {'app', 'third_party'})
+        self.assertLessEqual(len(report['functions']['third_party']), 5)
+
+    @override_settings(WEATHER_PROFILE_TOKEN=token)
+    def test_concurrent_profile_is_rejected(self):
+        with profiling._profile_lock:
+            response = self.client.get('/health/', headers={'X-Weather-Profile': self.token})
+        self.assertEqual(response.status_code, 409)
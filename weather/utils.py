@@ -1,419 +1,29 @@
-import requests
-from bs4 import BeautifulSoup
-from datetime import datetime
-import logging
-import re
-import base64
-from io import BytesIO
-
-# 最初にmatplotlibのバックエンドを設定（importの前に！）
-import matplotlib
-matplotlib.use('Agg')  # GUIを使わないバックエンド
-import matplotlib.pyplot as plt
-
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-BASE_URL = "https://www.data.jma.go.jp/stats/etrn/view/daily_s1.php"
-TEMPERATURE_INDEX = 7
-WEATHER_INDEX = 20
-ARIA_CODE = 130000
-
-def fetch_weather_data(year, month, day=None):
-    print(f"Fetching weather data for {year}-{month:02d}-{day if day else 'all days'}")
-    if day is not None:
-        url = f"{BASE_URL}?prec_no=44&block_no=47662&year={year}&month={month}&day={day}&view=p1"
-    else:
-        url = f"{BASE_URL}?prec_no=44&block_no=47662&year={year}&month={month}&view=p1"
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        table = soup.find('table', {'class': 'data2_s'})
-        if table:
-            rows = table.find_all('tr')[4:]
-            return [[col.text.strip() for col in row.find_all('td')] for row in rows if row.find_all('td')]
-    except requests.RequestException as e:
-        logger.error(f"Error fetching data: {e}")
-    return None
-
-def parse_weather_data(data, year, month):
-    return [
-        (f"{year}-{month:02d}-{int(row[0]):02d}", row[TEMPERATURE_INDEX], row[WEATHER_INDEX])
-        for row in data
-        if len(row) > max(TEMPERATURE_INDEX, WEATHER_INDEX)
-    ]
-
-def get_monthly_weather_data(year, month, day=None):
-    data = fetch_weather_data(year, month, day)
-    if data:
-        return parse_weather_data(data, year, month)
-    return None
-
-def get_similar_weather_data(year, month, weather):
-    monthly_data = get_monthly_weather_data(year, month, day=None)
-    if not monthly_data:
-        return None
-    return next((row for row in monthly_data if row[2] == weather), None)
-
-def get_highest_temperature(year, month):
-    monthly_data = get_monthly_weather_data(year, month, day=None)
-    if not monthly_data:
-        return None
-    temps = [float(row[1]) for row in monthly_data if row[1] and row[1].replace('.', '', 1).isdigit()]
-    return max(temps) if temps else None
-
-def fetch_today_weather_forecast():
-    """
-    気象庁の天気予報APIから今日の天気・気温を取得
-    東京 (code=130010)
-    """
-    url = "https://www.jma.go.jp/bosai/forecast/data/forecast/130000.json"
-    
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        
-        # 今日の日付を取得
-        today = datetime.now().date()
-        
-        # 最初の予報データを取得
-        forecast_data = data[0]
-        time_series = forecast_data["timeSeries"]
-        
-        # 天気・風・波のデータ（timeSeries[0]）
-        weather_series = time_series[0]
-        time_defines = weather_series["timeDefines"]
-        
-        # 今日のインデックスを探す
-        today_index = None
-        for i, time_str in enumerate(time_defines):
-            time_date = datetime.fromisoformat(time_str.replace("+09:00", "")).date()
-            if time_date == today:
-                today_index = i
-                break
-        
-        if today_index is None:
-            logger.warning(f"今日の日付 {today} が見つかりませんでした")
-            return {
-                "weather": "取得失敗",
-                "high": None,
-                "low": None,
-                "rain": None,
-                "source_url": url
-            }
-        
-        # 東京地方のデータを取得
-        tokyo_area = None
-        for area in weather_series["areas"]:
-            if area["area"]["code"] == "130010":  # 東京地方
-                tokyo_area = area
-                break
-        
-        if not tokyo_area:
-            logger.warning("東京地方のデータが見つかりませんでした")
-            return {
-                "weather": "取得失敗",
-                "high": None,
-                "low": None,
-                "rain": None,
-                "source_url": url
-            }
-        
-        # 天気を取得
-        weather = tokyo_area["weathers"][today_index]
-        
-        # 降水確率のデータ（timeSeries[1]）
-        pop_series = time_series[1]
-        pop_time_defines = pop_series["timeDefines"]
-        
-        # 今日の降水確率を取得（複数時間帯がある場合は最初のもの）
-        rain_text = "--%"
-        for area in pop_series["areas"]:
-            if area["area"]["code"] == "130010":
-                # 今日の日付に該当する降水確率を探す
-                for i, time_str in enumerate(pop_time_defines):
-                    time_date = datetime.fromisoformat(time_str.replace("+09:00", "")).date()
-                    if time_date == today and i < len(area["pops"]):
-                        rain_text = area["pops"][i] + "%"
-                        break
-                break
-        
-        # 気温のデータ（timeSeries[2]）
-        temp_series = time_series[2]
-        temp_time_defines = temp_series["timeDefines"]
-        
-        # 今日の気温を取得
-        high_temp = None
-        low_temp = None
-        
-        # 今日の日付のインデックスを探す
-        temp_today_index = None
-        for i, time_str in enumerate(temp_time_defines):
-            time_date = datetime.fromisoformat(time_str.replace("+09:00", "")).date()
-            if time_date == today:
-                temp_today_index = i
-                break
-        
-        if temp_today_index is not None:
-            for area in temp_series["areas"]:
-                if area["area"]["code"] == "44132":  # 東京
-                    temps = area["temps"]
-                    if temp_today_index < len(temps):
-                        low_temp = temps[temp_today_index * 2] if temp_today_index * 2 < len(temps) else None
-                        high_temp = temps[temp_today_index * 2 + 1] if temp_today_index * 2 + 1 < len(temps) else None
-                    break
-        
-        result = {
-            "weather": weather,
-            "high": high_temp,
-            "low": low_temp,
-            "rain": rain_text,
-            "source_url": url
-        }
-        
-        logger.info(f"今日の天気データ: {result}")
-        return result
-    
-    except Exception as e:
-        logger.error(f"天気取得中にエラー: {e}")
-        return {
-            "weather": "取得失敗",
-            "high": None,
-            "low": None,
-            "rain": None,
-            "source_url": url
-        }
-    
-def get_average_temperature(year, month):
-    """
-    指定された年月の平均気温を取得
-    """
-    monthly_data = get_monthly_weather_data(year, month, day=None)
-    if not monthly_data:
-        return None
-    
-    temps = []
-    for row in monthly_data:
-        temp_str = row[1]
-        if temp_str and temp_str.replace('.', '', 1).replace('-', '', 1).isdigit():
-            temps.append(float(temp_str))
-    
-    if temps:
-        return sum(temps) / len(temps)  # 平均を計算
-    return None
-
-
-def generate_temperature_graph(current_year_temps, ten_year_temps, twenty_year_temps, thirty_year_temps, forty_year_temps):
-    """
-    今年・10年前・20年前・30年前・40年前の '月平均気温' を比較するグラフを生成し
-    Base64 PNG として返却する
-    """
-    import platform
-    import os
-
-    # 日本語フォントを設定（OS別）
-    system = platform.system()
-    font_found = False
-
-    if system == 'Windows':
-        # Windows環境: 日本語フォントを直接指定
-        plt.rcParams['font.sans-serif'] = ['MS Gothic', 'Yu Gothic', 'Meiryo', 'BIZ UDGothic']
-        plt.rcParams['font.family'] = 'sans-serif'
-        font_found = True
-        logger.info(f"Windows: Set Japanese fonts")
-    else:
-        # Linux/Mac環境: WenQuanYiフォントを使用
-        home = os.path.expanduser('~')
-        possible_paths = [
-            f'{home}/.fonts/wqy-zenhei.ttc',
-            f'{home}/.fonts/wqy-microhei.ttc',
-        ]
-
-        font_path = None
-        for path in possible_paths:
-            if os.path.exists(path):
-                font_path = path
-                break
-
-        if font_path:
-            try:
-                # フォントをMatplotlibに登録
-                from matplotlib import font_manager
-                font_manager.fontManager.addfont(font_path)
-                font_prop = font_manager.FontProperties(fname=font_path)
-                font_name = font_prop.get_name()
-
-                # rcParamsに設定
-                plt.rcParams['font.family'] = font_name
-                plt.rcParams['font.sans-serif'] = [font_name]
-
-                logger.info(f"Linux: Loaded {font_name} from {font_path}")
-                font_found = True
-            except Exception as e:
-                logger.error(f"Font load failed: {e}")
-                font_found = False
-        else:
-            logger.warning("Japanese font not found - using English")
-            font_found = False
-
-    plt.rcParams['axes.unicode_minus'] = False
-    
-    months = range(1, 13)
-    fig = plt.figure(figsize=(12, 6))
-    
-    # データをプロット
-    from datetime import datetime
-    current_year = datetime.now().year
-
-    # フォントが見つかっている場合は日本語、見つかってない場合は英語
-    if font_found:
-        title = "年度別 月平均気温の比較"
-        xlabel = "月"
-        ylabel = "平均気温 (°C)"
-        year_labels = {
-            'current': f"{current_year}年",
-            'ten': f"{current_year-10}年",
-            'twenty': f"{current_year-20}年",
-            'thirty': f"{current_year-30}年",
-            'forty': f"{current_year-40}年"
-        }
-    else:
-        title = "Monthly Average Temperature Comparison"
-        xlabel = "Month"
-        ylabel = "Temperature (°C)"
-        year_labels = {
-            'current': str(current_year),
-            'ten': str(current_year-10),
-            'twenty': str(current_year-20),
-            'thirty': str(current_year-30),
-            'forty': str(current_year-40)
-        }
-
-    if current_year_temps:
-        plt.plot(months, current_year_temps, marker='o', linewidth=2, label=year_labels['current'], color='#FF6B6B')
-    if ten_year_temps:
-        plt.plot(months, ten_year_temps, marker='s', linewidth=2, label=year_labels['ten'], color='#4ECDC4')
-    if twenty_year_temps:
-        plt.plot(months, twenty_year_temps, marker='^', linewidth=2, label=year_labels['twenty'], color='#45B7D1')
-    if thirty_year_temps:
-        plt.plot(months, thirty_year_temps, marker='D', linewidth=2, label=year_labels['thirty'], color='#FFA07A')
-    if forty_year_temps:
-        plt.plot(months, forty_year_temps, marker='v', linewidth=2, label=year_labels['forty'], color='#98D8C8')
-
-    plt.title(title, fontsize=16, fontweight='bold', pad=20)
-    plt.xlabel(xlabel, fontsize=12)
-    plt.ylabel(ylabel, fontsize=12)
-    plt.legend(loc='best', fontsize=11, framealpha=0.9)
-    plt.grid(True, alpha=0.3, linestyle='--')
-    plt.xticks(months)
-    plt.tight_layout()
-
-    buffer = BytesIO()
-    plt.savefig(buffer, format='png', bbox_inches='tight', dpi=120)
-    plt.close(fig)
-    buffer.seek(0)
-
-    return base64.b64encode(buffer.read()).decode('utf-8')
-
-
-def predict_temperature_trend():
-    """
-    過去10年のデータから今月・来月・再来月の気温トレンドを予測
-    Returns: dict with predictions for current, next, and next-next month
-    """
-    from sklearn.linear_model import LinearRegression
-    import numpy as np
-    from datetime import datetime
-    from dateutil.relativedelta import relativedelta
-
-    try:
-        today = datetime.now()
-        current_month = today.month
-        current_year = today.year
-
-        # 過去10年分のデータを収集（各月）
-        predictions = []
-
-        for month_offset in [0, 1, 2]:  # 今月、来月、再来月
-            target_date = today + relativedelta(months=month_offset)
-            target_month = target_date.month
-            target_year = target_date.year
-
-            # 過去10年のこの月のデータを取得
-            temps = []
-            years = []
-
-            for year_back in range(1, 11):  # 過去10年
-                past_year = current_year - year_back
-                try:
-                    avg_temp = get_average_temperature(past_year, target_month)
-                    if avg_temp is not None:
-                        temps.append(avg_temp)
-                        years.append(past_year)
-                except:
-                    continue
-
-            if len(temps) >= 3:  # 最低3年分のデータがあれば予測
-                # 線形回帰モデルで予測
-                X = np.array(years).reshape(-1, 1)
-                y = np.array(temps)
-
-                model = LinearRegression()
-                model.fit(X, y)
-
-                # 今年の予測
-                predicted_temp = model.predict([[target_year]])[0]
-
-                # 過去10年の平均
-                avg_past_temp = np.mean(temps)
-
-                # トレンド判定
-                temp_diff = predicted_temp - avg_past_temp
-                if temp_diff > 1.0:
-                    trend = "暑くなる"
-                    trend_en = "hotter"
-                elif temp_diff < -1.0:
-                    trend = "寒くなる"
-                    trend_en = "colder"
-                else:
-                    trend = "平年並み"
-                    trend_en = "average"
-
-                predictions.append({
-                    'month': target_month,
-                    'year': target_year,
-                    'predicted_temp': round(predicted_temp, 1),
-                    'past_avg_temp': round(avg_past_temp, 1),
-                    'temp_diff': round(temp_diff, 1),
-                    'trend': trend,
-                    'trend_en': trend_en,
-                    'confidence': min(len(temps) * 10, 100)  # データ数に応じた信頼度
-                })
-            else:
-                predictions.append({
-                    'month': target_month,
-                    'year': target_year,
-                    'predicted_temp': None,
-                    'past_avg_temp': None,
-                    'temp_diff': None,
-                    'trend': 'データ不足',
-                    'trend_en': 'insufficient_data',
-                    'confidence': 0
-                })
-
-        return {
-            'success': True,
-            'current_month': predictions[0],
-            'next_month': predictions[1],
-            'next_next_month': predictions[2],
-            'data_source': '過去10年の気象庁データ'
-        }
-
-    except Exception as e:
-        logger.error(f"Temperature prediction error: {e}")
-        return {
-            'success': False,
-            'error': str(e)
-        }
\ No newline at end of file
+"""
+以前の weather.utils の名前をそのまま使えるようにする互換用のモジュール
+
+中身は次の3つに分けてある（必要になったときに読み込まれる）
+- weather.scraping: 気象庁からの取得・解析・キャッシュと集計
+- weather.graphing: 気温の比較グラフの描画（matplotlib）
+- weather.prediction: 気温トレンドの予測
+新しいコードではそれぞれのモジュールから直接 import する
+"""
+from importlib import import_module
+
+_SUBMODULES = ('scraping', 'prediction', 'graphing')
+
+
+def __getattr__(name):
+    for submodule in _SUBMODULES:
+        module = import_module(f"{__package__}.{submodule}")
+        if hasattr(module, name):
+            value = getattr(module, name)
+            globals()[name] = value
+            return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    names = set(globals())
+    for submodule in _SUBMODULES:
+        names.update(dir(import_module(f"{__package__}.{submodule}")))
+    return sorted(names)
@@ -1,52 +1,165 @@
-from django.http import JsonResponse
+import base64
+import json
+import logging
+from functools import wraps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from django.views.decorators.csrf import csrf_exempt
 from datetime import datetime, timedelta
-from .utils import (
-    fetch_today_weather_forecast,
-    get_monthly_weather_data,
+from .scraping import (
+    get_forecast_index,
+    today_weather_forecast,
+    weather_forecast_days,
     get_similar_weather_data,
     get_highest_temperature,
-    generate_temperature_graph,
+    get_daily_weather_range,
+    iter_daily_weather_range,
+    monthly_mean_matrix,
+    matrix_to_lists,
+    request_scope,
+    daily_page_url,
+    weather_data_version,
+    get_weather_data_response,
+    store_weather_data_response,
 )
-from .utils import get_average_temperature, generate_temperature_graph
+from .graphing import get_temperature_graph_png, temperature_graph_key
+from .prediction import TREND_WINDOW_YEARS, temperature_outlook
+from .stations import STATIONS, UnknownStation, get_station
+from . import metrics
 
-# 気象庁サイト（引用元URL）
-BASE_URL = "https://www.data.jma.go.jp/stats/etrn/view/daily_s1.php"
+logger = logging.getLogger(__name__)
 
-@csrf_exempt
-def get_past_weather_data(target_date):
+def with_request_scope(view):
     """
-    指定日の気象庁データを取得して返す（year-month-day）
+    リクエスト中に同じ年月の月ページを取得・解析するのを1回にまとめる
+    上流への取得回数を X-Upstream-Fetches ヘッダーで返す（デバッグ用）
     """
-    data = get_monthly_weather_data(target_date.year, target_date.month, target_date.day)
-
-    date_str = None
-    temp = None
-    weather_desc = None
-
-    if data:
-        search_key = f"{target_date.year}-{target_date.month:02d}-{target_date.day:02d}"
-
-        for entry in data:
-            if entry[0] == search_key:
-                date_str, temp, weather_desc = entry
-                break
-
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with request_scope() as scope:
+            response = view(request, *args, **kwargs)
+        # ストリーミングでは本文を送りながら取得するので、この時点の回数は返さない
+        if not response.streaming:
+            response['X-Upstream-Fetches'] = str(scope.upstream_fetches)
+        return response
+    return wrapper
+
+def with_station(view):
+    """
+    URL の station（slug）を Station にしてビューに渡す
+    URL に無ければ既定の観測所（WEATHER_DEFAULT_STATION）、未対応の観測所なら 404
+    """
+    @wraps(view)
+    def wrapper(request, *args, station=None, **kwargs):
+        try:
+            station = get_station(station)
+        except UnknownStation as e:
+            raise Http404(str(e))
+        return view(request, *args, station=station, **kwargs)
+    return wrapper
+
+def _past_weather_entry(target_date, observation, station=None):
+    """
+    1日分の観測値を get_past_weather_data の形式（date / temp / weather / source）にする
+    """
+    date_str, temp, weather_desc = observation.as_tuple() if observation else (None, None, None)
     return {
         "date": date_str,
         "temp": temp,
         "weather": weather_desc,
-        "source": f"{BASE_URL}?prec_no=44&block_no=47662&year={target_date.year}&month={target_date.month}&day={target_date.day}&view=p1"
+        # 気象庁サイト（引用元URL）
+        "source": daily_page_url(target_date.year, target_date.month, target_date.day, station)
     }
 
+@csrf_exempt
+def get_past_weather_data(target_date, station=None):
+    """
+    指定日の気象庁データを取得して返す（year-month-day）
+    """
+    return get_past_weather_range(target_date, target_date, station)[0]
+
+def get_past_weather_range(start, end, station=None):
+    """
+    start〜end（両端を含む）の各日の get_past_weather_data と同じ dict を日付順に返す
+    月ページは月ごとに1回だけ取得する
+    """
+    return [
+        _past_weather_entry(day, observation, station)
+        for day, observation in get_daily_weather_range(start, end, station)
+    ]
+
 
 @csrf_exempt
-def weather_data(request):
+@with_station
+@with_request_scope
+def weather_data(request, station):
+    """
+    今日の天気と過去の同じ日の天気
+    応答は日付・予報の発表時刻・今月の観測値が変わるまで同じなので、組み立て済みの JSON を
+    観測所ごとに保存して使い回す（ETag / Last-Modified で 304 も返す）
+    """
     today = datetime.now()
+    # 予報は1回だけ引き、応答のバージョンと本文の両方に同じものを使う
+    forecast = get_forecast_index(station.forecast_url)
+    if not settings.WEATHER_DATA_RESPONSE_CACHE:
+        return JsonResponse(_weather_data_payload(today, station, forecast))
+
+    version = weather_data_version(today, forecast)
+    response = cached_weather_data_response(request, station, version)
+    if response is not None:
+        return response
+
+    metrics.count_cache('weather_data_response', 'miss')
+    with request_scope() as scope:
+        body = json.dumps(_weather_data_payload(today, station, forecast), cls=DjangoJSONEncoder).encode('utf-8')
+    if scope.upstream_errors or scope.unavailable:
+        # 気象庁から取れなかった部分がある応答は保存しない（次のリクエストで取り直す）
+        # 他のリクエストの取得を待って失敗・時間切れになったページもここに入る
+        return HttpResponse(body, content_type='application/json')
+    entry = store_weather_data_response(version, body, _weather_data_recent_months(today), station)
+    return _weather_data_entry_response(request, entry)
+
+def cached_weather_data_response(request, station, version=None):
+    """
+    保存済みの weather_data の応答があればそれを返す（無ければ None）
+    version は weather_data_version の値（省略すると今日の日付と今の予報から求める）
+    """
+    if not settings.WEATHER_DATA_RESPONSE_CACHE:
+        return None
+    if version is None:
+        version = weather_data_version(datetime.now(), get_forecast_index(station.forecast_url))
+    entry = get_weather_data_response(version, station)
+    return _weather_data_entry_response(request, entry) if entry is not None else None
+
+def _weather_data_recent_months(today):
+    """
+    応答のうち、まだ変わりうる観測値（今日・昨日と直近7日分）の月
+    """
+    return list(dict.fromkeys(
+        (day.year, day.month) for day in (today - timedelta(days=days_ago) for days_ago in range(8))
+    ))
+
+def _weather_data_entry_response(request, entry):
+    etag = quote_etag(entry['etag'])
+    last_modified = int(entry['last_modified'])
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(entry['body'], content_type='application/json')
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+def _weather_data_payload(today, station, forecast):
+    """
+    forecast は予報の索引（get_forecast_index の値。取得できなければ None）
+    """
     last_year = today - timedelta(days=365)
 
     # 今日の天気
-    today_forecast = fetch_today_weather_forecast()
+    today_forecast = today_weather_forecast(forecast, station)
     display_date = today  # 表示する日付（デフォルトは今日）
 
     # 今日の天気が取得できない場合、昨日のデータを取得
@@ -54,7 +167,7 @@ def weather_data(request):
         today_forecast["high"] is None or
         today_forecast["high"] == ""):
         yesterday = today - timedelta(days=1)
-        yesterday_data = get_past_weather_data(yesterday)
+        yesterday_data = get_past_weather_data(yesterday, station)
         if yesterday_data["temp"] and yesterday_data["weather"]:
             today_forecast = {
                 "weather": yesterday_data["weather"],
@@ -72,36 +185,31 @@ def weather_data(request):
         today_forecast["is_yesterday"] = False
 
     # === 過去データ取得 ===
-    last_year_info = get_past_weather_data(last_year)
-    ten_years_info = get_past_weather_data(today.replace(year=today.year - 10))
-    twenty_years_info = get_past_weather_data(today.replace(year=today.year - 20))
-    thirty_years_info = get_past_weather_data(today.replace(year=today.year - 30))
-    forty_years_info = get_past_weather_data(today.replace(year=today.year - 40))
+    last_year_info = get_past_weather_data(last_year, station)
+    ten_years_info = get_past_weather_data(today.replace(year=today.year - 10), station)
+    twenty_years_info = get_past_weather_data(today.replace(year=today.year - 20), station)
+    thirty_years_info = get_past_weather_data(today.replace(year=today.year - 30), station)
+    forty_years_info = get_past_weather_data(today.replace(year=today.year - 40), station)
 
     # 7日間分のデータ（1週間前から7日前まで）
-    week_data = []
-    for days_ago in range(7, 0, -1):  # 7日前から1日前まで
-        target_date = today - timedelta(days=days_ago)
-        day_info = get_past_weather_data(target_date)
-        week_data.append({
-            'days_ago': days_ago,
-            'date': day_info['date'],
-            'temp': day_info['temp'],
-            'weather': day_info['weather'],
-            'source': day_info['source']
-        })
+    week_data = _days_ago_entries(today, 7, station)
 
     # 類似天気（去年基準）
     similar_weather_data = get_similar_weather_data(
         last_year.year,
         last_year.month,
-        last_year_info["weather"]
+        last_year_info["weather"],
+        station,
     )
 
     # 去年の最高気温
-    highest_temp = get_highest_temperature(last_year.year, last_year.month)
+    highest_temp = get_highest_temperature(last_year.year, last_year.month, station)
+
+    return {
+        # 観測所
+        "station": station.slug,
+        "station_name": station.name,
 
-    return JsonResponse({
         # 今日
         "today_date": display_date.strftime("%Y-%m-%d"),
         "today_weather": today_forecast["weather"],
@@ -109,6 +217,8 @@ def weather_data(request):
         "today_low_temp": today_forecast["low"],
         "today_rain": today_forecast["rain"],
         "today_source": today_forecast["source_url"],
+        # 予報の発表時刻（予報がどれだけ新しいか）
+        "today_report_datetime": today_forecast.get("report_datetime"),
         "is_yesterday_data": today_forecast.get("is_yesterday", False),
 
         # 去年
@@ -147,54 +257,73 @@ def weather_data(request):
 
         # 7日間のデータ
         "week_data": week_data,
-    })
 
-@csrf_exempt
-def weather_graph(request):
-    today = datetime.now()
-    current_year = today.year
-    
-    # 各年の月平均気温を取得
-    current_year_temps = []
-    ten_year_temps = []
-    twenty_year_temps = []
-    thirty_year_temps = []
-    forty_year_temps = []
-    
-    for month in range(1, 13):
-        # 今年
-        temp = get_average_temperature(current_year, month)
-        current_year_temps.append(temp if temp else None)
-        
-        # 10年前
-        temp = get_average_temperature(current_year - 10, month)
-        ten_year_temps.append(temp if temp else None)
-        
-        # 20年前
-        temp = get_average_temperature(current_year - 20, month)
-        twenty_year_temps.append(temp if temp else None)
-        
-        # 30年前
-        temp = get_average_temperature(current_year - 30, month)
-        thirty_year_temps.append(temp if temp else None)
-        
-        # 40年前
-        temp = get_average_temperature(current_year - 40, month)
-        forty_year_temps.append(temp if temp else None)
-    
-    print(f"今年の平均気温: {current_year_temps}")
-    print(f"10年前の平均気温: {ten_year_temps}")
-    
-    # グラフを生成
-    graph_base64 = generate_temperature_graph(
-        current_year_temps,
-        ten_year_temps,
-        twenty_year_temps,
-        thirty_year_temps,
-        forty_year_temps
+        # 今日以降の日ごとの予報（明日・週間予報）
+        "forecast_days": weather_forecast_days(forecast, station),
+    }
+
+def _days_ago_entries(today, total_days, station=None):
+    """
+    total_days 日前から1日前までの日次データ（days_ago 付き）を古い順に返す
+    """
+    start = today - timedelta(days=total_days)
+    end = today - timedelta(days=1)
+    return [
+        {
+            'days_ago': total_days - offset,
+            'date': day_info['date'],
+            'temp': day_info['temp'],
+            'weather': day_info['weather'],
+            'source': day_info['source']
+        }
+        for offset, day_info in enumerate(get_past_weather_range(start, end, station))
+    ]
+
+def _temperature_graph_series(station=None):
+    """
+    グラフに描く今年・10年前・20年前・30年前・40年前の月平均気温
+    Returns: (current_year, [5系列のリスト])
+    """
+    current_year = datetime.now().year
+
+    # 各年の月平均気温を (5年 × 12ヶ月) の行列でまとめて取得
+    # （日ごとの値は不要なので、既定では1年1ページの monthly_s1.php から読む）
+    means = monthly_mean_matrix(
+        (current_year - years_back for years_back in (0, 10, 20, 30, 40)),
+        station=station,
     )
+    series = matrix_to_lists(means)
+
+    logger.debug(f"今年の平均気温: {series[0]}")
+    logger.debug(f"10年前の平均気温: {series[1]}")
+    return current_year, series
+
+def _graph_cache_headers(response, etag):
+    """
+    グラフは入力が変わらない限り同じなので、ETag と Cache-Control を付ける
+    """
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=settings.WEATHER_GRAPH_MAX_AGE)
+    return response
+
+@csrf_exempt
+@with_station
+@with_request_scope
+def weather_graph(request, station):
+    current_year, series = _temperature_graph_series(station)
+
+    # JSON と PNG で表現が違うので ETag も分ける
+    etag = quote_etag(f"{temperature_graph_key(series, current_year)}-json")
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return _graph_cache_headers(not_modified, etag)
+
+    # グラフを生成（同じ入力の画像はキャッシュから）
+    _, png = get_temperature_graph_png(series, current_year)
+    graph_base64 = base64.b64encode(png).decode('utf-8')
     
-    return JsonResponse({
+    response = JsonResponse({
+        'station': station.slug,
         'image_base64': graph_base64,
         'years': {
             'current': current_year,
@@ -204,16 +333,59 @@ def weather_graph(request):
             'forty_years_ago': current_year - 40,
         }
     })
+    return _graph_cache_headers(response, etag)
+
+@csrf_exempt
+@with_station
+@with_request_scope
+def weather_graph_image(request, station):
+    """
+    weather_graph と同じグラフを image/png のまま返す（Base64 で約33%増えるのを避ける）
+    """
+    current_year, series = _temperature_graph_series(station)
+
+    etag = quote_etag(temperature_graph_key(series, current_year))
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return _graph_cache_headers(not_modified, etag)
+
+    _, png = get_temperature_graph_png(series, current_year)
+    return _graph_cache_headers(HttpResponse(png, content_type='image/png'), etag)
 
 def health_check(request):
     return JsonResponse({'status': 'ok'})
 
+def metrics_view(request):
+    """
+    Prometheus 形式のメトリクス（このプロセスの分。weather/metrics.py）
+    WEATHER_METRICS_TOKEN が空なら 404、Authorization: Bearer <トークン> が無いか違えば 401
+    """
+    if not settings.WEATHER_METRICS_TOKEN:
+        raise Http404()
+    if not metrics.is_authorized(request):
+        response = HttpResponse('Unauthorized', status=401, content_type='text/plain')
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def station_list(request):
+    """
+    対応している観測所の一覧（stations/<slug>/... の slug に使う）
+    """
+    return JsonResponse({
+        'default': get_station().slug,
+        'stations': [station.as_dict() for station in STATIONS.values()],
+    })
+
 @csrf_exempt
-def custom_week_weather(request, weeks):
+@with_station
+@with_request_scope
+def custom_week_weather(request, weeks, station):
     """
     指定された週数分の日次データを返す
     例: /custom-week-weather/1/ → 過去1週間分（7日分）のデータ
         /custom-week-weather/2/ → 過去2週間分（14日分）のデータ
+    ?stream=1 または Accept: application/x-ndjson なら NDJSON で月ごとに順次返す
     """
     try:
         weeks = int(weeks)
@@ -223,20 +395,14 @@ def custom_week_weather(request, weeks):
         today = datetime.now()
         total_days = weeks * 7
 
-        # N週間分の日次データを取得
-        week_data = []
-        for days_ago in range(total_days, 0, -1):
-            target_date = today - timedelta(days=days_ago)
-            day_info = get_past_weather_data(target_date)
-            week_data.append({
-                'days_ago': days_ago,
-                'date': day_info['date'],
-                'temp': day_info['temp'],
-                'weather': day_info['weather'],
-                'source': day_info['source']
-            })
+        if _wants_ndjson(request):
+            return _stream_week_weather(today, weeks, total_days, station)
+
+        # N週間分の日次データを取得（期間にかかる月ページは1回ずつ）
+        week_data = _days_ago_entries(today, total_days, station)
 
         return JsonResponse({
+            'station': station.slug,
             'weeks': weeks,
             'total_days': total_days,
             'week_data': week_data,
@@ -245,8 +411,70 @@ def custom_week_weather(request, weeks):
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+def _wants_ndjson(request):
+    return request.GET.get('stream') == '1' or NDJSON_CONTENT_TYPE in request.headers.get('Accept', '')
+
+def _ndjson_line(data):
+    return json.dumps(data, cls=DjangoJSONEncoder) + '\n'
+
+def _stream_week_weather(today, weeks, total_days, station):
+    """
+    custom_week_weather の NDJSON 版
+    1行目に weeks / total_days / today_date、続けて week_data の要素を1日1行で、
+    月ページが揃った月から順に送る（途中で失敗したら error の行を送って終える）
+    """
+    start, end = _week_weather_range(today, total_days)
+
+    def lines():
+        yield _week_weather_header_line(today, weeks, total_days, station)
+        days_ago = total_days
+        try:
+            for days in iter_daily_weather_range(start, end, station):
+                chunk, days_ago = _week_weather_lines(days, days_ago, station)
+                yield chunk
+        except Exception as e:
+            yield _ndjson_line({'error': str(e)})
+
+    return _ndjson_response(lines())
+
+def _week_weather_range(today, total_days):
+    return today - timedelta(days=total_days), today - timedelta(days=1)
+
+def _week_weather_header_line(today, weeks, total_days, station):
+    return _ndjson_line({
+        'station': station.slug,
+        'weeks': weeks,
+        'total_days': total_days,
+        'today_date': today.strftime("%Y-%m-%d"),
+    })
+
+def _week_weather_lines(days, days_ago, station):
+    """
+    1ヶ月分の [(日付, 観測値)] を NDJSON の行にする
+    Returns: (行の文字列, 次の日の days_ago)
+    """
+    chunk = []
+    for day, observation in days:
+        entry = _past_weather_entry(day, observation, station)
+        chunk.append(_ndjson_line({'days_ago': days_ago, **entry}))
+        days_ago -= 1
+    return ''.join(chunk), days_ago
+
+def _ndjson_response(lines):
+    """
+    行のイテレーター（同期・非同期のどちらでもよい）を NDJSON で順次送るレスポンス
+    """
+    response = StreamingHttpResponse(lines, content_type=NDJSON_CONTENT_TYPE)
+    # プロキシ（nginx など）にバッファさせず、届いた月からクライアントに渡す
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @csrf_exempt
-def custom_year_weather(request, years):
+@with_station
+@with_request_scope
+def custom_year_weather(request, years, station):
     """
     指定された年数前の天気データを返す
     例: /custom-year-weather/2/ → 2年前のデータ
@@ -260,9 +488,10 @@ def custom_year_weather(request, years):
         target_date = today.replace(year=today.year - years)
 
         # 過去のデータを取得
-        past_info = get_past_weather_data(target_date)
+        past_info = get_past_weather_data(target_date, station)
 
         return JsonResponse({
+            'station': station.slug,
             'years_ago': years,
             'date': past_info['date'],
             'temp': past_info['temp'],
@@ -274,19 +503,68 @@ def custom_year_weather(request, years):
         return JsonResponse({'error': str(e)}, status=500)
 
 @csrf_exempt
-def predict_weather(request):
+@with_station
+@with_request_scope
+def predict_weather(request, station):
     """
     AI予測: 今月・来月・再来月の気温トレンドを予測
     過去10年のデータから線形回帰モデルで予測
     """
     try:
-        from .utils import predict_temperature_trend
+        from .prediction import predict_temperature_trend
 
-        prediction_data = predict_temperature_trend()
+        prediction_data = {'station': station.slug, **predict_temperature_trend(station)}
 
         return JsonResponse(prediction_data)
     except Exception as e:
         return JsonResponse({
             'success': False,
             'error': str(e)
-        }, status=500)
\ No newline at end of file
+        }, status=500)
+
+def _int_param(request, name, default, low, high):
+    """
+    クエリの整数パラメータ（範囲外・数値でなければ ValueError）
+    """
+    try:
+        value = int(request.GET.get(name, default))
+    except ValueError:
+        value = None
+    if value is None or not low <= value <= high:
+        raise ValueError(f"{name} は{low}〜{high}の範囲で指定してください")
+    return value
+
+@csrf_exempt
+@with_station
+@with_request_scope
+def predict_outlook(request, station):
+    """
+    複数月・複数観測所の気温予測をまとめて返す
+    例: /predict-outlook/?horizon=12&lookback=10&stations=tokyo,osaka
+    horizon: 今月から何ヶ月分か（1〜12、既定 12）
+    lookback: 直線を当てはめる過去の年数（3〜40、既定 10）
+    stations: 観測所の slug（または prec_no:block_no）のカンマ区切り。既定は URL の観測所
+    """
+    try:
+        horizon = _int_param(request, 'horizon', 12, 1, 12)
+        lookback = _int_param(request, 'lookback', TREND_WINDOW_YEARS, 3, 40)
+        names = request.GET.get('stations', station.slug).split(',')
+        stations = list(dict.fromkeys(get_station(name.strip()) for name in names))
+    except ValueError as e:  # UnknownStation も含む
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    try:
+        return JsonResponse({
+            'success': True,
+            'horizon': horizon,
+            'lookback': lookback,
+            'stations': [
+                {'station': target.slug, **temperature_outlook(horizon, lookback, station=target)}
+                for target in stations
+            ],
+        })
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
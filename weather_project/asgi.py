@@ -5,6 +5,15 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
+
+気象庁への取得を非同期で行うビュー（weather/async_views.py）で動かす場合:
+
+    WEATHER_ASYNC_VIEWS=True gunicorn weather_project.asgi:application \
+        -k uvicorn_worker.UvicornWorker --workers 2 --timeout 120
+
+（uvicorn 0.30 で非推奨になった uvicorn.workers.UvicornWorker の代わりに uvicorn-worker パッケージのものを使う）
+
+WEATHER_PRELOAD=True と --preload を付けると、httpx も含めてマスタープロセスで読み込んでから fork する
 """
 
 import os
@@ -48,6 +48,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # 応答時間・処理段階の計測（weather/metrics.py、/metrics/ で見る）。全体を測れるよう先頭に置く
+    'weather.metrics.metrics_middleware',
+    # WEATHER_PROFILE_TOKEN を付けたリクエストだけを cProfile で計測する（weather/profiling.py）
+    'weather.profiling.profiling_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -93,6 +97,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # 書き込みロックを待つ秒数（ワーカーと manage.py sync_weather が同じファイルに書き込む）
+        'OPTIONS': {'timeout': int(os.environ.get('WEATHER_SQLITE_TIMEOUT', 20))},
     }
 }
 
@@ -137,3 +143,81 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# ログは標準エラー出力へ（WEATHER_LOG_LEVEL=DEBUG で処理段階ごとの時間なども出る）
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {'format': '%(levelname)s:%(name)s:%(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'simple'},
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': os.environ.get('WEATHER_LOG_LEVEL', 'INFO'),
+    },
+}
+
+# URL で観測所を指定しないときの観測所（weather/stations.py の slug）
+WEATHER_DEFAULT_STATION = os.environ.get('WEATHER_DEFAULT_STATION', 'tokyo')
+
+# 気象庁の過去データ（etrn）と天気予報（bosai）の URL（ベンチマークではローカルのスタブに向ける）
+WEATHER_ETRN_BASE_URL = os.environ.get('WEATHER_ETRN_BASE_URL', 'https://www.data.jma.go.jp/stats/etrn/view')
+WEATHER_FORECAST_BASE_URL = os.environ.get(
+    'WEATHER_FORECAST_BASE_URL', 'https://www.jma.go.jp/bosai/forecast/data/forecast'
+)
+
+# 気象庁データのキャッシュ設定
+# 今月分の月ページを再取得するまでの秒数（終了した月は期限なし）
+WEATHER_CURRENT_MONTH_CACHE_TTL = int(os.environ.get('WEATHER_CURRENT_MONTH_CACHE_TTL', 60 * 60))
+# 期間（月・年）が終わってから何日過ぎたら、その期間のページを確定扱いにして取り直さなくなるか
+WEATHER_FINAL_GRACE_DAYS = int(os.environ.get('WEATHER_FINAL_GRACE_DAYS', 2))
+# ページキャッシュのヒット数（管理画面の hit_count）をまとめて DB に書き込む間隔（秒）
+WEATHER_HIT_COUNT_FLUSH_INTERVAL = int(os.environ.get('WEATHER_HIT_COUNT_FLUSH_INTERVAL', 60))
+# 気象庁の各ホストへの同時接続数の上限（月ページの並行取得に使用）
+WEATHER_UPSTREAM_MAX_CONCURRENCY = int(os.environ.get('WEATHER_UPSTREAM_MAX_CONCURRENCY', 6))
+# 気象庁への HTTP 接続のタイムアウト（秒）とリトライ回数・バックオフ係数
+WEATHER_UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get('WEATHER_UPSTREAM_CONNECT_TIMEOUT', 3.05))
+WEATHER_UPSTREAM_READ_TIMEOUT = float(os.environ.get('WEATHER_UPSTREAM_READ_TIMEOUT', 10))
+WEATHER_UPSTREAM_RETRIES = int(os.environ.get('WEATHER_UPSTREAM_RETRIES', 2))
+WEATHER_UPSTREAM_BACKOFF = float(os.environ.get('WEATHER_UPSTREAM_BACKOFF', 0.5))
+# 月平均気温の取得元: 'monthly'（monthly_s1.php の年ページ、1年1ページ）/ 'daily'（日ごとの月ページ）
+WEATHER_MONTHLY_MEAN_BACKEND = os.environ.get('WEATHER_MONTHLY_MEAN_BACKEND', 'monthly')
+# 同じページ・予報を同時に取りに行かず、取得中の結果を待って使う（single-flight）ときの最大の待ち時間（秒）
+WEATHER_SINGLE_FLIGHT_TIMEOUT = int(os.environ.get('WEATHER_SINGLE_FLIGHT_TIMEOUT', 30))
+# True にすると Django のキャッシュのロックで、別ワーカーとも同じページ・予報を同時に取得しない
+# （CACHES をワーカー間で共有するもの（Redis・Memcached・DB など）にしたときだけ意味がある）
+WEATHER_SHARED_FETCH_LOCK = os.environ.get('WEATHER_SHARED_FETCH_LOCK', 'False') == 'True'
+# 描画済みグラフ（PNG）をキャッシュに残す秒数と、レスポンスの Cache-Control の max-age
+WEATHER_GRAPH_CACHE_TIMEOUT = int(os.environ.get('WEATHER_GRAPH_CACHE_TIMEOUT', 60 * 60 * 24))
+WEATHER_GRAPH_MAX_AGE = int(os.environ.get('WEATHER_GRAPH_MAX_AGE', 60 * 60))
+# True にするとリクエスト処理中は気象庁の過去データを取りに行かず、
+# manage.py sync_weather で保存したデータだけを読む
+WEATHER_LOCAL_READS_ONLY = os.environ.get('WEATHER_LOCAL_READS_ONLY', 'False') == 'True'
+# manage.py sync_weather の既定値: 遡る年数（40年前のデータまで使うので 41）と再同期の間隔（秒）
+WEATHER_BACKFILL_YEARS = int(os.environ.get('WEATHER_BACKFILL_YEARS', 41))
+WEATHER_SYNC_INTERVAL = int(os.environ.get('WEATHER_SYNC_INTERVAL', 60 * 60))
+# manage.py sync_weather で同期する観測所（カンマ区切りの slug）
+WEATHER_SYNC_STATIONS = os.environ.get('WEATHER_SYNC_STATIONS', WEATHER_DEFAULT_STATION).split(',')
+# 天気予報 JSON をそのまま使う秒数（過ぎたら古い分を返しつつ裏で取り直す）と、
+# Django のキャッシュでワーカー間でも共有するか
+WEATHER_FORECAST_TTL = int(os.environ.get('WEATHER_FORECAST_TTL', 10 * 60))
+WEATHER_FORECAST_SHARED_CACHE = os.environ.get('WEATHER_FORECAST_SHARED_CACHE', 'False') == 'True'
+# 予報の取得に失敗してから取り直さずにいる秒数（その間は手元の予報か、無ければ予報なしで応答する）
+WEATHER_FORECAST_FAILURE_BACKOFF = int(os.environ.get('WEATHER_FORECAST_FAILURE_BACKOFF', 60))
+# /weather-data/ の応答を組み立て済みの JSON として保存して使い回すか
+# （日付・予報の発表時刻・今月の観測値が変わったら作り直す）
+WEATHER_DATA_RESPONSE_CACHE = os.environ.get('WEATHER_DATA_RESPONSE_CACHE', 'True') == 'True'
+# /metrics/ を返すのは Authorization: Bearer にこの値を付けたリクエストだけ（空なら /metrics/ は 404）
+WEATHER_METRICS_TOKEN = os.environ.get('WEATHER_METRICS_TOKEN', '')
+# X-Weather-Profile ヘッダーか ?profile= にこの値を付けたリクエストを cProfile で計測して結果を返す（空なら無効）
+WEATHER_PROFILE_TOKEN = os.environ.get('WEATHER_PROFILE_TOKEN', '')
+# 計測結果（JSON と pstats の .prof）も保存するディレクトリ（空なら保存しない）
+WEATHER_PROFILE_DIR = os.environ.get('WEATHER_PROFILE_DIR', '')
+# True にすると気象庁への取得を httpx で非同期に行うビューを使う（ASGI で動かすとき。weather/async_views.py）
+WEATHER_ASYNC_VIEWS = os.environ.get('WEATHER_ASYNC_VIEWS', 'False') == 'True'
+# True にすると起動時（gunicorn --preload ならワーカーを fork する前のマスタープロセス）に
+# ビュー・matplotlib・日本語フォントなどを読み込んでおく（weather/preload.py）
+WEATHER_PRELOAD = os.environ.get('WEATHER_PRELOAD', 'False') == 'True'
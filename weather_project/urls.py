@@ -1,14 +1,31 @@
 # weather_project/urls.py
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
 from weather import views
 
+if settings.WEATHER_ASYNC_VIEWS:
+    # ASGI で動かすときは上流の取得を非同期で行うビューを使う
+    from weather import async_views as data_views
+else:
+    data_views = views
+
+# 観測所ごとのデータ（stations/<slug>/... で観測所を指定、無ければ既定の観測所）
+data_urlpatterns = [
+    path('weather-data/', data_views.weather_data, name='weather_data'),
+    path('weather-graph/', data_views.weather_graph, name='weather_graph'),
+    path('weather-graph/image/', data_views.weather_graph_image, name='weather_graph_image'),
+    path('custom-week-weather/<int:weeks>/', data_views.custom_week_weather, name='custom_week_weather'),
+    path('custom-year-weather/<int:years>/', data_views.custom_year_weather, name='custom_year_weather'),
+    path('predict-weather/', data_views.predict_weather, name='predict_weather'),
+    path('predict-outlook/', data_views.predict_outlook, name='predict_outlook'),
+]
+
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('weather-data/', views.weather_data, name='weather_data'),
-    path('weather-graph/', views.weather_graph, name='weather_graph'),
-    path('custom-week-weather/<int:weeks>/', views.custom_week_weather, name='custom_week_weather'),
-    path('custom-year-weather/<int:years>/', views.custom_year_weather, name='custom_year_weather'),
-    path('predict-weather/', views.predict_weather, name='predict_weather'),
+    *data_urlpatterns,
+    path('stations/', views.station_list, name='station_list'),
+    path('stations/<slug:station>/', include((data_urlpatterns, 'station'))),
     path('health/', views.health_check, name='health_check'),
-]
\ No newline at end of file
+    path('metrics/', views.metrics_view, name='metrics'),
+]
@@ -5,6 +5,11 @@ It exposes the WSGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/wsgi/
+
+ワーカーの起動・入れ替えを速くするには、マスタープロセスで読み込みを済ませてから fork する
+（weather/preload.py）:
+
+    WEATHER_PRELOAD=True gunicorn weather_project.wsgi:application --preload --workers 2 --timeout 120
 """
 
 import os